@@ -0,0 +1,343 @@
+use std::{
+    collections::VecDeque,
+    sync::{
+        atomic::{AtomicUsize, Ordering},
+        Arc, Mutex, Weak,
+    },
+};
+
+use pyo3::{
+    exceptions::{PyRuntimeError, PyStopAsyncIteration},
+    prelude::*,
+};
+
+/// Poll interval used right after any activity.
+pub const MIN_POLL_INTERVAL: f64 = 0.001;
+/// Upper bound the interval backs off to while nothing happens.
+pub const MAX_POLL_INTERVAL: f64 = 0.05;
+
+/// Single event-loop-integrated poller shared by every awaiting lobby
+/// operation and message stream of one client. It reschedules itself with
+/// `loop.call_later`, dropping to the minimum interval on activity and
+/// doubling it while idle, and detaches from the loop once nothing waits.
+pub struct AioDriver {
+    event_loop: Option<Py<PyAny>>,
+    poll: Option<Py<PyAny>>,
+    timer: Option<Py<PyAny>>,
+    delay: f64,
+    pending_ops: Arc<AtomicUsize>,
+    /// Held weakly, so a stream is dropped from the driver once Python
+    /// frees it.
+    streams: Vec<Weak<StreamShared>>,
+}
+
+impl Default for AioDriver {
+    fn default() -> Self {
+        AioDriver {
+            event_loop: None,
+            poll: None,
+            timer: None,
+            delay: MIN_POLL_INTERVAL,
+            pending_ops: Arc::new(AtomicUsize::new(0)),
+            streams: Vec::new(),
+        }
+    }
+}
+
+impl AioDriver {
+    /// Binds the driver to `event_loop`, using `poll` as the callback that
+    /// drives it, and schedules an immediate poll.
+    pub fn attach(
+        &mut self,
+        py: Python<'_>,
+        event_loop: &Bound<'_, PyAny>,
+        poll: &Bound<'_, PyAny>,
+    ) -> PyResult<()> {
+        match &self.event_loop {
+            Some(current) if !current.bind(py).is(event_loop) => {
+                return Err(PyRuntimeError::new_err(
+                    "Async operations are already bound to another event loop",
+                ));
+            }
+            Some(_) => {}
+            None => {
+                self.event_loop = Some(event_loop.clone().unbind());
+                self.poll = Some(poll.clone().unbind());
+            }
+        }
+        self.kick(py)
+    }
+
+    /// Returns a callable that wakes the driver from any thread.
+    pub fn waker(&self, py: Python<'_>) -> PyResult<Option<Py<PyAny>>> {
+        match (&self.event_loop, &self.poll) {
+            (Some(event_loop), Some(poll)) => {
+                let partial = py.import("functools")?.getattr("partial")?;
+                let call_soon = event_loop.getattr(py, "call_soon_threadsafe")?;
+                Ok(Some(partial.call1((call_soon, poll.clone_ref(py)))?.unbind()))
+            }
+            _ => Ok(None),
+        }
+    }
+
+    /// Restarts polling at the fastest interval.
+    pub fn kick(&mut self, py: Python<'_>) -> PyResult<()> {
+        if let (Some(event_loop), Some(poll)) = (&self.event_loop, &self.poll) {
+            if let Some(timer) = self.timer.take() {
+                timer.call_method0(py, "cancel")?;
+            }
+            self.timer = Some(event_loop.call_method1(py, "call_soon", (poll.clone_ref(py),))?);
+            self.delay = MIN_POLL_INTERVAL;
+        }
+        Ok(())
+    }
+
+    /// Counts a lobby operation in flight and returns the counter its
+    /// completion decrements. Kept outside the driver lock because
+    /// completions may run on the pump thread while holding the GIL.
+    pub fn begin_op(&self) -> Arc<AtomicUsize> {
+        self.pending_ops.fetch_add(1, Ordering::AcqRel);
+        self.pending_ops.clone()
+    }
+
+    pub fn has_pending_ops(&self) -> bool {
+        self.pending_ops.load(Ordering::Acquire) > 0
+    }
+
+    pub fn add_stream(&mut self, stream: &MessageStream) {
+        self.streams.push(Arc::downgrade(&stream.shared));
+    }
+
+    pub fn has_streams(&self) -> bool {
+        !self.streams.is_empty()
+    }
+
+    fn open_streams(&self) -> impl Iterator<Item = Arc<StreamShared>> + '_ {
+        self.streams
+            .iter()
+            .filter_map(Weak::upgrade)
+            .filter(|stream| !stream.is_closed())
+    }
+
+    pub fn channels(&self) -> Vec<u32> {
+        let mut channels: Vec<u32> = self.open_streams().map(|s| s.channel).collect();
+        channels.sort_unstable();
+        channels.dedup();
+        channels
+    }
+
+    /// Hands `item` to every stream on `channel`. Returns `false` if no
+    /// stream is listening on that channel.
+    pub fn deliver(&self, py: Python<'_>, channel: u32, item: &Bound<'_, PyAny>) -> PyResult<bool> {
+        let mut delivered = false;
+        for stream in self.open_streams() {
+            if stream.channel == channel {
+                stream.push(py, item.clone().unbind())?;
+                delivered = true;
+            }
+        }
+        Ok(delivered)
+    }
+
+    /// Drops streams that were closed or freed, then schedules the next
+    /// poll, or detaches if nothing waits.
+    pub fn reschedule(&mut self, py: Python<'_>, activity: bool) -> PyResult<()> {
+        self.streams
+            .retain(|stream| stream.upgrade().is_some_and(|stream| !stream.is_closed()));
+
+        if let Some(timer) = self.timer.take() {
+            timer.call_method0(py, "cancel")?;
+        }
+        if !self.has_pending_ops() && self.streams.is_empty() {
+            self.event_loop = None;
+            self.poll = None;
+            return Ok(());
+        }
+
+        self.delay = if activity {
+            MIN_POLL_INTERVAL
+        } else {
+            (self.delay * 2.0).min(MAX_POLL_INTERVAL)
+        };
+        if let (Some(event_loop), Some(poll)) = (&self.event_loop, &self.poll) {
+            self.timer = Some(event_loop.call_method1(
+                py,
+                "call_later",
+                (self.delay, poll.clone_ref(py)),
+            )?);
+        }
+        Ok(())
+    }
+}
+
+pub fn running_loop(py: Python<'_>) -> PyResult<Bound<'_, PyAny>> {
+    py.import("asyncio")?.call_method0("get_running_loop")
+}
+
+/// Completes `future` unless it was already cancelled. Scheduled onto the
+/// event loop with `call_soon_threadsafe`.
+#[pyfunction]
+#[pyo3(signature = (future, value, error=None))]
+fn resolve_future(
+    future: &Bound<'_, PyAny>,
+    value: PyObject,
+    error: Option<Bound<'_, PyAny>>,
+) -> PyResult<()> {
+    if future.call_method0("done")?.is_truthy()? {
+        return Ok(());
+    }
+    match error {
+        None => future.call_method1("set_result", (value,))?,
+        Some(error) if error.is_instance_of::<pyo3::exceptions::PyBaseException>() => {
+            future.call_method1("set_exception", (error,))?
+        }
+        Some(error) => {
+            future.call_method1("set_exception", (PyRuntimeError::new_err(error.str()?.unbind()),))?
+        }
+    };
+    Ok(())
+}
+
+/// Completes `future` with `value`, or fails it with `error`, from any
+/// thread.
+pub fn resolve_threadsafe(
+    py: Python<'_>,
+    event_loop: &Py<PyAny>,
+    future: &Py<PyAny>,
+    value: Option<u64>,
+    error: Option<PyObject>,
+) -> PyResult<()> {
+    let resolve = wrap_pyfunction!(resolve_future, py)?;
+    event_loop.call_method1(
+        py,
+        "call_soon_threadsafe",
+        (resolve, future.clone_ref(py), value, error),
+    )?;
+    Ok(())
+}
+
+/// Lobby operation callback that completes an asyncio future. Safe to call
+/// from the pump thread.
+#[pyclass(frozen)]
+pub struct LobbyCompletion {
+    event_loop: Py<PyAny>,
+    future: Py<PyAny>,
+    pending_ops: Arc<AtomicUsize>,
+}
+
+impl LobbyCompletion {
+    pub fn new(event_loop: Py<PyAny>, future: Py<PyAny>, pending_ops: Arc<AtomicUsize>) -> Self {
+        LobbyCompletion {
+            event_loop,
+            future,
+            pending_ops,
+        }
+    }
+}
+
+#[pymethods]
+impl LobbyCompletion {
+    #[pyo3(signature = (lobby_id, error=None))]
+    fn __call__(&self, py: Python<'_>, lobby_id: Option<u64>, error: Option<PyObject>) -> PyResult<()> {
+        self.pending_ops.fetch_sub(1, Ordering::AcqRel);
+        resolve_threadsafe(py, &self.event_loop, &self.future, lobby_id, error)
+    }
+}
+
+#[derive(Default)]
+struct StreamState {
+    buffer: VecDeque<PyObject>,
+    waiter: Option<Py<PyAny>>,
+    closed: bool,
+}
+
+/// The part of a `MessageStream` the driver delivers into. Python code is
+/// never called with `state` locked.
+pub struct StreamShared {
+    channel: u32,
+    state: Mutex<StreamState>,
+}
+
+impl StreamShared {
+    fn is_closed(&self) -> bool {
+        self.state.lock().unwrap().closed
+    }
+
+    fn push(&self, py: Python<'_>, item: PyObject) -> PyResult<()> {
+        let waiter = self.state.lock().unwrap().waiter.take();
+        if let Some(waiter) = waiter {
+            if !waiter.call_method0(py, "done")?.is_truthy(py)? {
+                waiter.call_method1(py, "set_result", (item,))?;
+                return Ok(());
+            }
+        }
+        self.state.lock().unwrap().buffer.push_back(item);
+        Ok(())
+    }
+}
+
+/// Async iterator over `(steam_id, channel, bytes)` messages on one channel.
+/// It stops receiving once closed or freed.
+#[pyclass(frozen)]
+pub struct MessageStream {
+    shared: Arc<StreamShared>,
+    event_loop: Py<PyAny>,
+    driver: Arc<Mutex<AioDriver>>,
+}
+
+impl MessageStream {
+    pub fn new(channel: u32, event_loop: Py<PyAny>, driver: Arc<Mutex<AioDriver>>) -> Self {
+        MessageStream {
+            shared: Arc::new(StreamShared {
+                channel,
+                state: Mutex::new(StreamState::default()),
+            }),
+            event_loop,
+            driver,
+        }
+    }
+}
+
+#[pymethods]
+impl MessageStream {
+    #[getter]
+    pub fn channel(&self) -> u32 {
+        self.shared.channel
+    }
+
+    pub fn __aiter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    pub fn __anext__(&self, py: Python<'_>) -> PyResult<PyObject> {
+        let future = self.event_loop.call_method0(py, "create_future")?;
+        let mut state = self.shared.state.lock().unwrap();
+        if let Some(item) = state.buffer.pop_front() {
+            drop(state);
+            future.call_method1(py, "set_result", (item,))?;
+            return Ok(future);
+        }
+        if state.closed {
+            return Err(PyStopAsyncIteration::new_err(()));
+        }
+        state.waiter = Some(future.clone_ref(py));
+        drop(state);
+        self.driver.lock().unwrap().kick(py)?;
+        Ok(future)
+    }
+
+    /// Ends iteration. Any pending `__anext__` raises `StopAsyncIteration`.
+    pub fn close(&self, py: Python<'_>) -> PyResult<()> {
+        let waiter = {
+            let mut state = self.shared.state.lock().unwrap();
+            state.closed = true;
+            state.waiter.take()
+        };
+        if let Some(waiter) = waiter {
+            if !waiter.call_method0(py, "done")?.is_truthy(py)? {
+                waiter.call_method1(py, "set_exception", (PyStopAsyncIteration::new_err(()),))?;
+            }
+        }
+        Ok(())
+    }
+}
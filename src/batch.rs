@@ -0,0 +1,74 @@
+use pyo3::{
+    prelude::*,
+    sync::GILOnceCell,
+    types::{PyBytes, PyTuple, PyType},
+};
+
+static ARRAY_TYPE: GILOnceCell<Py<PyType>> = GILOnceCell::new();
+
+/// Columnar view of many received messages: one packed payload buffer plus
+/// per-message sender, channel, offset and length columns. Offsets and
+/// lengths are 64-bit so batches past 4 GiB still index correctly.
+#[derive(Default)]
+pub struct MessageBatch {
+    payload: Vec<u8>,
+    steam_ids: Vec<u64>,
+    channels: Vec<u32>,
+    offsets: Vec<u64>,
+    lengths: Vec<u64>,
+}
+
+impl MessageBatch {
+    pub fn reserve(&mut self, messages: usize, bytes: usize) {
+        self.payload.reserve(bytes);
+        self.steam_ids.reserve(messages);
+        self.channels.reserve(messages);
+        self.offsets.reserve(messages);
+        self.lengths.reserve(messages);
+    }
+
+    pub fn push(&mut self, steam_id: u64, channel: u32, data: &[u8]) {
+        self.steam_ids.push(steam_id);
+        self.channels.push(channel);
+        self.offsets.push(self.payload.len() as u64);
+        self.lengths.push(data.len() as u64);
+        self.payload.extend_from_slice(data);
+    }
+
+    /// Returns `(payload, steam_ids, channels, offsets, lengths)` where
+    /// `payload` is `bytes`, `channels` is `array('I')` and the other columns
+    /// are `array('Q')`.
+    pub fn into_py(self, py: Python<'_>) -> PyResult<PyObject> {
+        let payload = PyBytes::new(py, &self.payload);
+        let tuple = PyTuple::new(
+            py,
+            [
+                payload.into_any(),
+                to_array(py, "Q", &self.steam_ids)?,
+                to_array(py, "I", &self.channels)?,
+                to_array(py, "Q", &self.offsets)?,
+                to_array(py, "Q", &self.lengths)?,
+            ],
+        )?;
+        Ok(tuple.into_any().unbind())
+    }
+}
+
+/// Builds an `array.array` of the given typecode from a slice of plain
+/// integers in native byte order.
+pub fn to_array<'py, T: Copy>(
+    py: Python<'py>,
+    typecode: &str,
+    values: &[T],
+) -> PyResult<Bound<'py, PyAny>> {
+    let array = ARRAY_TYPE
+        .import(py, "array", "array")?
+        .call1((typecode,))?;
+    if !values.is_empty() {
+        let raw = unsafe {
+            std::slice::from_raw_parts(values.as_ptr() as *const u8, std::mem::size_of_val(values))
+        };
+        array.call_method1("frombytes", (PyBytes::new(py, raw),))?;
+    }
+    Ok(array)
+}
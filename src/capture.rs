@@ -0,0 +1,518 @@
+use std::{
+    collections::{HashMap, VecDeque},
+    fs::File,
+    io::{self, BufWriter, Write},
+    ops::Range,
+    path::Path,
+    sync::{Arc, Mutex},
+    time::Instant,
+};
+
+use memmap2::Mmap;
+use steamworks::SteamError;
+
+use crate::transport::LobbyUpdate;
+
+const CAPTURE_MAGIC: &[u8; 8] = b"PYSNCAP1";
+/// Magic followed by the recording client's SteamID.
+const CAPTURE_HEADER: usize = 16;
+
+/// Record kinds. Every record starts with its kind and the microseconds
+/// since the previous record as a varint.
+const RECORD_MESSAGE: u8 = 1;
+const RECORD_LOBBY_UPDATE: u8 = 2;
+const RECORD_SESSION_FAILED: u8 = 3;
+
+/// Appends received messages and lobby and session events to a capture log.
+pub struct Recorder {
+    out: BufWriter<File>,
+    last: Instant,
+    record: Vec<u8>,
+    pub records: u64,
+}
+
+impl Recorder {
+    pub fn create(path: &Path, own_steam_id: u64) -> io::Result<Self> {
+        let mut out = BufWriter::new(File::create(path)?);
+        out.write_all(CAPTURE_MAGIC)?;
+        out.write_all(&own_steam_id.to_le_bytes())?;
+        Ok(Recorder {
+            out,
+            last: Instant::now(),
+            record: Vec::new(),
+            records: 0,
+        })
+    }
+
+    fn begin(&mut self, kind: u8) {
+        let now = Instant::now();
+        let elapsed = now.duration_since(self.last).as_micros() as u64;
+        self.last = now;
+        self.record.clear();
+        self.record.push(kind);
+        write_varint(&mut self.record, elapsed);
+    }
+
+    fn finish(&mut self) {
+        // A full disk stops the capture silently rather than the networking.
+        let _ = self.out.write_all(&self.record);
+        self.records += 1;
+    }
+
+    pub fn record_message(&mut self, steam_id: u64, channel: u32, data: &[u8]) {
+        self.begin(RECORD_MESSAGE);
+        self.record.extend_from_slice(&steam_id.to_le_bytes());
+        write_varint(&mut self.record, channel as u64);
+        write_varint(&mut self.record, data.len() as u64);
+        self.finish();
+        let _ = self.out.write_all(data);
+    }
+
+    pub fn record_lobby_update(&mut self, update: LobbyUpdate) {
+        self.begin(RECORD_LOBBY_UPDATE);
+        self.record.extend_from_slice(&update.lobby.to_le_bytes());
+        self.record
+            .extend_from_slice(&update.user_changed.to_le_bytes());
+        self.record
+            .extend_from_slice(&update.making_change.to_le_bytes());
+        write_varint(&mut self.record, update.state);
+        self.finish();
+    }
+
+    pub fn record_session_failed(&mut self, steam_id: u64) {
+        self.begin(RECORD_SESSION_FAILED);
+        self.record.extend_from_slice(&steam_id.to_le_bytes());
+        self.finish();
+    }
+
+    pub fn flush(&mut self) -> io::Result<()> {
+        self.out.flush()
+    }
+}
+
+fn write_varint(out: &mut Vec<u8>, mut value: u64) {
+    while value >= 0x80 {
+        out.push((value as u8) | 0x80);
+        value >>= 7;
+    }
+    out.push(value as u8);
+}
+
+/// Reads a varint at `*offset` and moves past it.
+fn read_varint(data: &[u8], offset: &mut usize) -> Option<u64> {
+    let mut value = 0u64;
+    for shift in (0..64).step_by(7) {
+        let byte = *data.get(*offset)?;
+        *offset += 1;
+        value |= ((byte & 0x7F) as u64) << shift;
+        if byte & 0x80 == 0 {
+            return Some(value);
+        }
+    }
+    None
+}
+
+fn read_u64(data: &[u8], offset: &mut usize) -> Option<u64> {
+    let value = u64::from_le_bytes(data.get(*offset..*offset + 8)?.try_into().ok()?);
+    *offset += 8;
+    Some(value)
+}
+
+enum ReplayEvent {
+    LobbyUpdate(LobbyUpdate),
+    SessionFailed(u64),
+    LobbyResult(Box<dyn FnOnce() + Send>),
+}
+
+struct Cursor {
+    offset: usize,
+    /// Recorded time of the last record read, in microseconds.
+    time_us: u64,
+    inbox: HashMap<u32, VecDeque<(u64, Range<usize>)>>,
+    events: VecDeque<ReplayEvent>,
+    records: u64,
+}
+
+type LobbyHandler = Arc<dyn Fn(LobbyUpdate) + Send + Sync>;
+type SessionFailedHandler = Arc<dyn Fn(u64) + Send + Sync>;
+
+/// Plays a capture log back as if it arrived from the network, at the
+/// recorded pace scaled by `speed`, or as fast as it is read when `speed`
+/// is `0`. Messages are served straight from the mapped log.
+pub struct ReplayPeer {
+    log: Arc<Mmap>,
+    steam_id: u64,
+    speed: f64,
+    started: Instant,
+    cursor: Mutex<Cursor>,
+    lobby_handler: Mutex<Option<LobbyHandler>>,
+    session_failed_handler: Mutex<Option<SessionFailedHandler>>,
+}
+
+impl ReplayPeer {
+    pub fn open(path: &Path, speed: f64) -> io::Result<Arc<Self>> {
+        let file = File::open(path)?;
+        let log = unsafe { Mmap::map(&file)? };
+        if log.len() < CAPTURE_HEADER || &log[..8] != CAPTURE_MAGIC {
+            return Err(io::Error::new(
+                io::ErrorKind::InvalidData,
+                "Not a py_steam_net capture",
+            ));
+        }
+        let steam_id = u64::from_le_bytes(log[8..16].try_into().unwrap());
+        Ok(Arc::new(ReplayPeer {
+            log: Arc::new(log),
+            steam_id,
+            speed: speed.max(0.0),
+            started: Instant::now(),
+            cursor: Mutex::new(Cursor {
+                offset: CAPTURE_HEADER,
+                time_us: 0,
+                inbox: HashMap::new(),
+                events: VecDeque::new(),
+                records: 0,
+            }),
+            lobby_handler: Mutex::new(None),
+            session_failed_handler: Mutex::new(None),
+        }))
+    }
+
+    /// SteamID of the client that recorded the log.
+    pub fn steam_id(&self) -> u64 {
+        self.steam_id
+    }
+
+    pub fn on_lobby_update(&self, handler: impl Fn(LobbyUpdate) + Send + Sync + 'static) {
+        *self.lobby_handler.lock().unwrap() = Some(Arc::new(handler));
+    }
+
+    pub fn on_session_failed(&self, handler: impl Fn(u64) + Send + Sync + 'static) {
+        *self.session_failed_handler.lock().unwrap() = Some(Arc::new(handler));
+    }
+
+    /// Recorded time that has been reached, or `None` when replaying as
+    /// fast as possible.
+    fn horizon_us(&self) -> Option<u64> {
+        (self.speed > 0.0).then(|| (self.started.elapsed().as_micros() as f64 * self.speed) as u64)
+    }
+
+    /// Reads records up to `horizon_us`. Without a horizon, stops as soon
+    /// as `enough` holds. A truncated record at the end of the log ends the
+    /// replay.
+    fn advance(
+        &self,
+        cursor: &mut Cursor,
+        horizon_us: Option<u64>,
+        enough: impl Fn(&Cursor) -> bool,
+    ) {
+        let data = &self.log[..];
+        loop {
+            if horizon_us.is_none() && enough(cursor) {
+                return;
+            }
+            let mut offset = cursor.offset;
+            let Some(&kind) = data.get(offset) else {
+                return;
+            };
+            offset += 1;
+            let Some(elapsed) = read_varint(data, &mut offset) else {
+                return;
+            };
+            // Lengths and times come straight from the log, so a corrupt one
+            // that overflows is treated like a truncated one.
+            let Some(time_us) = cursor.time_us.checked_add(elapsed) else {
+                return;
+            };
+            if horizon_us.is_some_and(|horizon| time_us > horizon) {
+                return;
+            }
+            match kind {
+                RECORD_MESSAGE => {
+                    let (Some(steam_id), Some(channel), Some(len)) = (
+                        read_u64(data, &mut offset),
+                        read_varint(data, &mut offset),
+                        read_varint(data, &mut offset),
+                    ) else {
+                        return;
+                    };
+                    let Some(end) = usize::try_from(len)
+                        .ok()
+                        .and_then(|len| offset.checked_add(len))
+                        .filter(|&end| end <= data.len())
+                    else {
+                        return;
+                    };
+                    cursor
+                        .inbox
+                        .entry(channel as u32)
+                        .or_default()
+                        .push_back((steam_id, offset..end));
+                    offset = end;
+                }
+                RECORD_LOBBY_UPDATE => {
+                    let (Some(lobby), Some(user_changed), Some(making_change), Some(state)) = (
+                        read_u64(data, &mut offset),
+                        read_u64(data, &mut offset),
+                        read_u64(data, &mut offset),
+                        read_varint(data, &mut offset),
+                    ) else {
+                        return;
+                    };
+                    cursor
+                        .events
+                        .push_back(ReplayEvent::LobbyUpdate(LobbyUpdate {
+                            lobby,
+                            user_changed,
+                            making_change,
+                            state,
+                        }));
+                }
+                RECORD_SESSION_FAILED => {
+                    let Some(steam_id) = read_u64(data, &mut offset) else {
+                        return;
+                    };
+                    cursor
+                        .events
+                        .push_back(ReplayEvent::SessionFailed(steam_id));
+                }
+                _ => {
+                    // Unknown record: the rest of the log cannot be framed.
+                    cursor.offset = data.len();
+                    return;
+                }
+            }
+            cursor.offset = offset;
+            cursor.time_us = time_us;
+            cursor.records += 1;
+        }
+    }
+
+    /// Delivers lobby and session events that are due.
+    pub fn run_callbacks(&self) {
+        let events = {
+            let mut cursor = self.cursor.lock().unwrap();
+            // At full speed, read up to the next event so events do not
+            // depend on which channels are received.
+            self.advance(&mut cursor, self.horizon_us(), |cursor| {
+                !cursor.events.is_empty()
+            });
+            std::mem::take(&mut cursor.events)
+        };
+        for event in events {
+            match event {
+                ReplayEvent::LobbyUpdate(update) => {
+                    let handler = self.lobby_handler.lock().unwrap().clone();
+                    if let Some(handler) = handler {
+                        handler(update);
+                    }
+                }
+                ReplayEvent::SessionFailed(steam_id) => {
+                    let handler = self.session_failed_handler.lock().unwrap().clone();
+                    if let Some(handler) = handler {
+                        handler(steam_id);
+                    }
+                }
+                ReplayEvent::LobbyResult(call) => call(),
+            }
+        }
+    }
+
+    /// Takes up to `max_messages` due messages on `channel` as
+    /// `(sender, log, range)` triples pointing into the mapped log.
+    pub fn receive(
+        &self,
+        channel: u32,
+        max_messages: usize,
+    ) -> Vec<(u64, Arc<Mmap>, Range<usize>)> {
+        let mut cursor = self.cursor.lock().unwrap();
+        self.advance(&mut cursor, self.horizon_us(), |cursor| {
+            cursor.inbox.get(&channel).map_or(0, VecDeque::len) >= max_messages
+        });
+        let Some(queue) = cursor.inbox.get_mut(&channel) else {
+            return Vec::new();
+        };
+        let count = queue.len().min(max_messages);
+        queue
+            .drain(..count)
+            .map(|(steam_id, range)| (steam_id, self.log.clone(), range))
+            .collect()
+    }
+
+    /// Replays have no lobbies of their own; lobby operations fail on the
+    /// next `run_callbacks`.
+    pub fn create_lobby(&self, cb: impl FnOnce(Result<u64, SteamError>) + Send + 'static) {
+        self.post(Box::new(move || cb(Err(SteamError::InvalidState))));
+    }
+
+    pub fn join_lobby(&self, cb: impl FnOnce(Result<u64, ()>) + Send + 'static) {
+        self.post(Box::new(move || cb(Err(()))));
+    }
+
+    fn post(&self, call: Box<dyn FnOnce() + Send>) {
+        let mut cursor = self.cursor.lock().unwrap();
+        cursor.events.push_back(ReplayEvent::LobbyResult(call));
+    }
+
+    /// Returns `(bytes read, log size, records read, finished)`.
+    pub fn progress(&self) -> (usize, usize, u64, bool) {
+        let cursor = self.cursor.lock().unwrap();
+        let queued =
+            cursor.inbox.values().any(|queue| !queue.is_empty()) || !cursor.events.is_empty();
+        (
+            cursor.offset,
+            self.log.len(),
+            cursor.records,
+            cursor.offset >= self.log.len() && !queued,
+        )
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use std::path::PathBuf;
+
+    use super::*;
+
+    fn log_path(test: &str) -> PathBuf {
+        std::env::temp_dir().join(format!(
+            "py_steam_net-capture-{test}-{}",
+            std::process::id()
+        ))
+    }
+
+    fn record(path: &Path) {
+        let mut recorder = Recorder::create(path, 42).unwrap();
+        recorder.record_message(1, 0, b"first");
+        recorder.record_message(2, 5, &[]);
+        recorder.record_lobby_update(LobbyUpdate {
+            lobby: 9,
+            user_changed: 2,
+            making_change: 2,
+            state: 1,
+        });
+        recorder.record_message(1, 0, &[0xAB; 300]);
+        recorder.record_session_failed(3);
+        assert_eq!(recorder.records, 5);
+        recorder.flush().unwrap();
+    }
+
+    fn messages(replay: &ReplayPeer, channel: u32) -> Vec<(u64, Vec<u8>)> {
+        replay
+            .receive(channel, 16)
+            .into_iter()
+            .map(|(steam_id, log, range)| (steam_id, log[range].to_vec()))
+            .collect()
+    }
+
+    #[test]
+    fn capture_round_trip() {
+        let path = log_path("round-trip");
+        record(&path);
+        let replay = ReplayPeer::open(&path, 0.0).unwrap();
+        assert_eq!(replay.steam_id(), 42);
+
+        let updates = Arc::new(Mutex::new(Vec::new()));
+        let failed = Arc::new(Mutex::new(Vec::new()));
+        let seen = updates.clone();
+        replay.on_lobby_update(move |update| {
+            seen.lock()
+                .unwrap()
+                .push((update.lobby, update.user_changed, update.state))
+        });
+        let seen = failed.clone();
+        replay.on_session_failed(move |steam_id| seen.lock().unwrap().push(steam_id));
+
+        assert_eq!(
+            messages(&replay, 0),
+            [(1, b"first".to_vec()), (1, vec![0xAB; 300])]
+        );
+        assert_eq!(messages(&replay, 5), [(2, Vec::new())]);
+        replay.run_callbacks();
+        replay.run_callbacks();
+        assert_eq!(*updates.lock().unwrap(), [(9, 2, 1)]);
+        assert_eq!(*failed.lock().unwrap(), [3]);
+
+        let (read, size, records, finished) = replay.progress();
+        assert_eq!((read, records, finished), (size, 5, true));
+        std::fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn receive_stops_at_max_messages() {
+        let path = log_path("max-messages");
+        record(&path);
+        let replay = ReplayPeer::open(&path, 0.0).unwrap();
+        assert_eq!(replay.receive(0, 1).len(), 1);
+        assert!(!replay.progress().3);
+        assert_eq!(replay.receive(0, 1).len(), 1);
+        std::fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn truncated_log_ends_replay() {
+        let path = log_path("truncated");
+        record(&path);
+        let data = std::fs::read(&path).unwrap();
+        std::fs::write(&path, &data[..data.len() - 20]).unwrap();
+        let replay = ReplayPeer::open(&path, 0.0).unwrap();
+        assert_eq!(messages(&replay, 0), [(1, b"first".to_vec())]);
+        assert_eq!(replay.progress().2, 3);
+        std::fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn overflowing_lengths_end_replay() {
+        let path = log_path("overflow");
+        record(&path);
+        let valid = std::fs::read(&path).unwrap();
+        let huge = [0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0x01];
+        // A message whose length runs past the end of the address space.
+        let mut data = valid.clone();
+        data.extend_from_slice(&[RECORD_MESSAGE, 0]);
+        data.extend_from_slice(&7u64.to_le_bytes());
+        data.push(0);
+        data.extend_from_slice(&huge);
+        // Records whose elapsed times overflow the replay clock by the
+        // second one at the latest.
+        let mut late = valid;
+        late.push(RECORD_SESSION_FAILED);
+        late.extend_from_slice(&huge);
+        late.extend_from_slice(&7u64.to_le_bytes());
+        late.push(RECORD_SESSION_FAILED);
+        late.extend_from_slice(&huge);
+        late.extend_from_slice(&8u64.to_le_bytes());
+
+        for data in [data, late] {
+            std::fs::write(&path, &data).unwrap();
+            let replay = ReplayPeer::open(&path, 0.0).unwrap();
+            assert_eq!(messages(&replay, 0).len(), 2);
+            replay.run_callbacks();
+            replay.run_callbacks();
+            let (read, size, records, finished) = replay.progress();
+            assert!(read < size && records <= 6 && !finished);
+        }
+        std::fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn rejects_other_files() {
+        let path = log_path("invalid");
+        std::fs::write(&path, b"not a capture log").unwrap();
+        let err = ReplayPeer::open(&path, 0.0).err().unwrap();
+        assert_eq!(err.kind(), io::ErrorKind::InvalidData);
+        std::fs::remove_file(&path).unwrap();
+    }
+
+    #[test]
+    fn replay_has_no_lobbies() {
+        let path = log_path("lobbies");
+        record(&path);
+        let replay = ReplayPeer::open(&path, 0.0).unwrap();
+        let result = Arc::new(Mutex::new(None));
+        let seen = result.clone();
+        replay.join_lobby(move |joined| *seen.lock().unwrap() = Some(joined.is_err()));
+        replay.run_callbacks();
+        assert_eq!(*result.lock().unwrap(), Some(true));
+        std::fs::remove_file(&path).unwrap();
+    }
+}
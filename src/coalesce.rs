@@ -0,0 +1,305 @@
+use std::{
+    collections::{HashMap, HashSet},
+    sync::RwLock,
+};
+
+/// Prefix that marks a Steam message as a pack of length-prefixed frames.
+/// `0xFF` never starts valid UTF-8, so text payloads cannot be mistaken for
+/// a pack.
+const PACK_MAGIC: [u8; 2] = [0xFF, 0xC0];
+
+/// Key a pending pack is grouped by: `(steam_id, channel, send_flags)`.
+pub type PackKey = (u64, u32, i32);
+
+/// What the caller of `Coalescer::push` has to send now, in order.
+pub enum Push {
+    /// The message was buffered. These packs filled up and are ready.
+    Buffered(Vec<Vec<u8>>),
+    /// The message is too large to share a pack. The pending pack for its
+    /// key, if any, goes first, then the message itself, unframed.
+    Direct(Option<Vec<u8>>),
+}
+
+/// Buffers small outgoing messages per peer, channel and send flags and
+/// packs them into a single Steam message.
+pub struct Coalescer {
+    pub max_bytes: usize,
+    pub flush_on_tick: bool,
+    pending: HashMap<PackKey, Vec<u8>>,
+}
+
+impl Coalescer {
+    pub fn new(max_bytes: usize, flush_on_tick: bool) -> Self {
+        Coalescer {
+            max_bytes,
+            flush_on_tick,
+            pending: HashMap::new(),
+        }
+    }
+
+    /// Appends `data` to the pack for `key`, unless it would not fit in a
+    /// pack of `max_bytes` on its own. Messages that start with the pack
+    /// prefix are always framed, so a receiver unpacking their channel
+    /// cannot mistake them for a pack.
+    pub fn push(&mut self, key: PackKey, data: &[u8]) -> Push {
+        let frame_len = varint_len(data.len()) + data.len();
+        if PACK_MAGIC.len() + frame_len > self.max_bytes && !data.starts_with(&PACK_MAGIC) {
+            let pending = self
+                .pending
+                .remove(&key)
+                .filter(|pack| pack.len() > PACK_MAGIC.len());
+            return Push::Direct(pending);
+        }
+
+        let mut ready = Vec::new();
+        let pack = self
+            .pending
+            .entry(key)
+            .or_insert_with(|| PACK_MAGIC.to_vec());
+
+        if pack.len() > PACK_MAGIC.len() && pack.len() + frame_len > self.max_bytes {
+            ready.push(std::mem::replace(pack, PACK_MAGIC.to_vec()));
+        }
+        write_varint(pack, data.len());
+        pack.extend_from_slice(data);
+        if pack.len() >= self.max_bytes {
+            ready.push(std::mem::replace(pack, PACK_MAGIC.to_vec()));
+        }
+        Push::Buffered(ready)
+    }
+
+    /// Takes every non-empty pack, leaving the buffers empty.
+    pub fn drain(&mut self) -> Vec<(PackKey, Vec<u8>)> {
+        self.pending
+            .drain()
+            .filter(|(_, pack)| pack.len() > PACK_MAGIC.len())
+            .collect()
+    }
+}
+
+fn varint_len(mut value: usize) -> usize {
+    let mut len = 1;
+    while value >= 0x80 {
+        value >>= 7;
+        len += 1;
+    }
+    len
+}
+
+fn write_varint(out: &mut Vec<u8>, mut value: usize) {
+    while value >= 0x80 {
+        out.push((value as u8) | 0x80);
+        value >>= 7;
+    }
+    out.push(value as u8);
+}
+
+fn read_varint(data: &[u8]) -> Option<(usize, usize)> {
+    let mut value = 0usize;
+    for (index, &byte) in data.iter().enumerate().take(5) {
+        value |= ((byte & 0x7F) as usize) << (7 * index);
+        if byte & 0x80 == 0 {
+            return Some((value, index + 1));
+        }
+    }
+    None
+}
+
+/// Channels whose received messages are unpacked. Receivers opt in per
+/// channel; messages on every other channel pass through untouched, even if
+/// they happen to look like a pack.
+#[derive(Default)]
+pub struct Unpacking {
+    channels: RwLock<HashSet<u32>>,
+}
+
+impl Unpacking {
+    pub fn set(&self, channels: impl IntoIterator<Item = u32>) {
+        *self.channels.write().unwrap() = channels.into_iter().collect();
+    }
+
+    pub fn contains(&self, channel: u32) -> bool {
+        self.channels.read().unwrap().contains(&channel)
+    }
+
+    pub fn channels(&self) -> Vec<u32> {
+        let mut channels: Vec<u32> = self.channels.read().unwrap().iter().copied().collect();
+        channels.sort_unstable();
+        channels
+    }
+}
+
+/// Iterates the individual messages carried by one received Steam message,
+/// as byte ranges into it. Without `unpack`, or if the message is not a
+/// well-formed pack, it yields the message itself unchanged.
+pub enum Frames<'a> {
+    Single(Option<&'a [u8]>),
+    Packed(&'a [u8], usize),
+}
+
+impl<'a> Frames<'a> {
+    pub fn new(data: &'a [u8], unpack: bool) -> Self {
+        if unpack && is_pack(data) {
+            Frames::Packed(data, PACK_MAGIC.len())
+        } else {
+            Frames::Single(Some(data))
+        }
+    }
+}
+
+impl<'a> Iterator for Frames<'a> {
+    type Item = (usize, usize);
+
+    fn next(&mut self) -> Option<Self::Item> {
+        match self {
+            Frames::Single(data) => data.take().map(|data| (0, data.len())),
+            Frames::Packed(data, offset) => {
+                let (len, header) = read_varint(&data[*offset..])?;
+                let start = *offset + header;
+                let end = start.checked_add(len).filter(|&end| end <= data.len())?;
+                *offset = end;
+                Some((start, end))
+            }
+        }
+    }
+}
+
+fn is_pack(data: &[u8]) -> bool {
+    if !data.starts_with(&PACK_MAGIC) || data.len() == PACK_MAGIC.len() {
+        return false;
+    }
+    let mut offset = PACK_MAGIC.len();
+    while offset < data.len() {
+        match read_varint(&data[offset..]) {
+            Some((len, header)) => match (offset + header).checked_add(len) {
+                Some(end) if end <= data.len() => offset = end,
+                _ => return false,
+            },
+            None => return false,
+        }
+    }
+    true
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn unpack(data: &[u8], unpack: bool) -> Vec<&[u8]> {
+        Frames::new(data, unpack)
+            .map(|(start, end)| &data[start..end])
+            .collect()
+    }
+
+    fn buffered(push: Push) -> Vec<Vec<u8>> {
+        match push {
+            Push::Buffered(ready) => ready,
+            Push::Direct(_) => panic!("message was not buffered"),
+        }
+    }
+
+    #[test]
+    fn pack_round_trip() {
+        let mut coalescer = Coalescer::new(1200, true);
+        let big = vec![7u8; 300];
+        for data in [&b"a"[..], b"", &big] {
+            assert!(buffered(coalescer.push((1, 0, 0), data)).is_empty());
+        }
+        let packs = coalescer.drain();
+        assert_eq!(packs.len(), 1);
+        assert_eq!(packs[0].0, (1, 0, 0));
+        assert_eq!(unpack(&packs[0].1, true), [&b"a"[..], b"", &big]);
+        assert!(coalescer.drain().is_empty());
+    }
+
+    #[test]
+    fn full_pack_is_returned() {
+        let mut coalescer = Coalescer::new(16, false);
+        assert!(buffered(coalescer.push((1, 0, 0), &[1; 8])).is_empty());
+        let ready = buffered(coalescer.push((1, 0, 0), &[2; 8]));
+        assert_eq!(ready.len(), 1);
+        assert_eq!(unpack(&ready[0], true), [&[1u8; 8][..]]);
+        let packs = coalescer.drain();
+        assert_eq!(unpack(&packs[0].1, true), [&[2u8; 8][..]]);
+    }
+
+    #[test]
+    fn large_message_is_sent_directly_after_pending_pack() {
+        let mut coalescer = Coalescer::new(16, false);
+        coalescer.push((1, 0, 0), b"a");
+        coalescer.push((2, 0, 0), b"b");
+        match coalescer.push((1, 0, 0), &[3; 14]) {
+            Push::Direct(Some(pack)) => assert_eq!(unpack(&pack, true), [&b"a"[..]]),
+            _ => panic!("expected the pending pack and a direct send"),
+        }
+        assert!(matches!(
+            coalescer.push((1, 0, 0), &[3; 16]),
+            Push::Direct(None)
+        ));
+        // Packs of other keys stay pending.
+        assert_eq!(coalescer.drain().len(), 1);
+    }
+
+    #[test]
+    fn large_message_with_magic_is_framed() {
+        let mut coalescer = Coalescer::new(16, false);
+        let mut data = PACK_MAGIC.to_vec();
+        data.extend_from_slice(&[1; 30]);
+        let ready = buffered(coalescer.push((1, 0, 0), &data));
+        assert_eq!(ready.len(), 1);
+        assert_eq!(unpack(&ready[0], true), [&data[..]]);
+    }
+
+    #[test]
+    fn packs_are_kept_per_key() {
+        let mut coalescer = Coalescer::new(1200, true);
+        coalescer.push((1, 0, 0), b"a");
+        coalescer.push((1, 1, 0), b"b");
+        coalescer.push((2, 0, 8), b"c");
+        assert_eq!(coalescer.drain().len(), 3);
+    }
+
+    #[test]
+    fn payloads_pass_through_without_unpack() {
+        let mut coalescer = Coalescer::new(1200, true);
+        coalescer.push((1, 0, 0), b"a");
+        coalescer.push((1, 0, 0), b"b");
+        let pack = coalescer.drain().remove(0).1;
+        assert_eq!(unpack(&pack, false), [&pack[..]]);
+    }
+
+    #[test]
+    fn non_pack_with_magic_is_not_split() {
+        // Starts with the pack prefix, but the frame length runs past the end.
+        let data = [0xFF, 0xC0, 0x05, 1, 2];
+        assert_eq!(unpack(&data, true), [&data[..]]);
+        // A well-formed frame followed by trailing garbage.
+        let data = [0xFF, 0xC0, 0x01, 9, 0x80];
+        assert_eq!(unpack(&data, true), [&data[..]]);
+        assert_eq!(unpack(&PACK_MAGIC, true), [&PACK_MAGIC[..]]);
+        assert_eq!(unpack(b"", true), [&b""[..]]);
+    }
+
+    #[test]
+    fn binary_payload_on_other_channel_is_untouched() {
+        let unpacking = Unpacking::default();
+        unpacking.set([3]);
+        // A valid pack as far as framing goes, sent raw by the application.
+        let data = [0xFF, 0xC0, 0x01, 9];
+        assert_eq!(unpack(&data, unpacking.contains(4)), [&data[..]]);
+        assert_eq!(unpack(&data, unpacking.contains(3)), [&[9u8][..]]);
+        unpacking.set([]);
+        assert!(unpacking.channels().is_empty());
+    }
+
+    #[test]
+    fn varint_round_trip() {
+        for value in [0, 1, 0x7F, 0x80, 0x3FFF, 0x4000, 1 << 28] {
+            let mut out = Vec::new();
+            write_varint(&mut out, value);
+            assert_eq!(out.len(), varint_len(value));
+            assert_eq!(read_varint(&out), Some((value, out.len())));
+        }
+        assert_eq!(read_varint(&[0x80]), None);
+    }
+}
@@ -0,0 +1,165 @@
+use std::collections::VecDeque;
+
+use pyo3::{
+    prelude::*,
+    types::{PyBytes, PyTuple},
+};
+
+use crate::{batch::to_array, transport::LobbyUpdate};
+
+/// Record kinds of an event batch.
+pub const EVENT_MESSAGE: u8 = 0;
+pub const EVENT_LOBBY_CHANGED: u8 = 1;
+pub const EVENT_SESSION_FAILED: u8 = 2;
+pub const EVENT_LOBBY_CREATED: u8 = 3;
+pub const EVENT_LOBBY_JOINED: u8 = 4;
+pub const EVENT_SESSION_STATE: u8 = 5;
+
+/// Result codes of both lobby operations, numbered like Steam's `EResult`.
+/// Details of a failure are in the record's payload.
+pub const LOBBY_OK: u32 = 1;
+pub const LOBBY_FAIL: u32 = 2;
+
+/// A lobby or session event waiting for the next `tick`.
+pub enum Event {
+    LobbyChanged(LobbyUpdate),
+    SessionFailed(u64),
+    /// `(steam_id, old_state, new_state)` of a tracked session.
+    SessionState(u64, i32, i32),
+    /// `(kind, op, lobby, code, error)` of a finished create or join.
+    LobbyOp(u8, u64, u64, u32, String),
+}
+
+/// Lobby and session events collected for `tick`, in arrival order.
+/// Events past `capacity` are dropped and counted.
+pub struct EventQueue {
+    /// Set by the first `tick`; until then events go to the callbacks.
+    pub enabled: bool,
+    pub capacity: usize,
+    pub dropped: u64,
+    next_op: u64,
+    events: VecDeque<Event>,
+}
+
+impl Default for EventQueue {
+    fn default() -> Self {
+        EventQueue {
+            enabled: false,
+            capacity: 65536,
+            dropped: 0,
+            next_op: 1,
+            events: VecDeque::new(),
+        }
+    }
+}
+
+impl EventQueue {
+    pub fn push(&mut self, event: Event) {
+        if self.events.len() >= self.capacity {
+            self.dropped += 1;
+            return;
+        }
+        self.events.push_back(event);
+    }
+
+    /// Returns an ID identifying a lobby operation's completion event.
+    pub fn next_op(&mut self) -> u64 {
+        let op = self.next_op;
+        self.next_op += 1;
+        op
+    }
+
+    pub fn len(&self) -> usize {
+        self.events.len()
+    }
+
+    pub fn take(&mut self) -> VecDeque<Event> {
+        std::mem::take(&mut self.events)
+    }
+
+    pub fn clear(&mut self) {
+        self.enabled = false;
+        self.dropped = 0;
+        self.events.clear();
+    }
+}
+
+/// Columnar batch of events and messages: one packed payload buffer plus
+/// one entry per record in each column. What the `steam_id`, `lobby`,
+/// `extra` and `code` columns hold depends on the record kind.
+#[derive(Default)]
+pub struct EventBatch {
+    payload: Vec<u8>,
+    kinds: Vec<u8>,
+    steam_ids: Vec<u64>,
+    lobbies: Vec<u64>,
+    extras: Vec<u64>,
+    codes: Vec<u32>,
+    offsets: Vec<u64>,
+    lengths: Vec<u64>,
+}
+
+impl EventBatch {
+    fn record(&mut self, kind: u8, steam_id: u64, lobby: u64, extra: u64, code: u32, data: &[u8]) {
+        self.kinds.push(kind);
+        self.steam_ids.push(steam_id);
+        self.lobbies.push(lobby);
+        self.extras.push(extra);
+        self.codes.push(code);
+        self.offsets.push(self.payload.len() as u64);
+        self.lengths.push(data.len() as u64);
+        self.payload.extend_from_slice(data);
+    }
+
+    pub fn push_event(&mut self, event: Event) {
+        match event {
+            Event::LobbyChanged(update) => self.record(
+                EVENT_LOBBY_CHANGED,
+                update.user_changed,
+                update.lobby,
+                update.making_change,
+                update.state as u32,
+                &[],
+            ),
+            Event::SessionFailed(steam_id) => {
+                self.record(EVENT_SESSION_FAILED, steam_id, 0, 0, 0, &[])
+            }
+            Event::SessionState(steam_id, old, new) => self.record(
+                EVENT_SESSION_STATE,
+                steam_id,
+                0,
+                old as u64,
+                new as u32,
+                &[],
+            ),
+            Event::LobbyOp(kind, op, lobby, code, error) => {
+                self.record(kind, 0, lobby, op, code, error.as_bytes())
+            }
+        }
+    }
+
+    pub fn push_message(&mut self, steam_id: u64, channel: u32, data: &[u8]) {
+        self.record(EVENT_MESSAGE, steam_id, 0, 0, channel, data);
+    }
+
+    /// Returns `(payload, kinds, steam_ids, lobbies, extras, codes, offsets,
+    /// lengths)` where `payload` is `bytes`, `kinds` is `array('B')`, `codes`
+    /// is `array('I')` and the other columns are `array('Q')`.
+    pub fn into_py(self, py: Python<'_>) -> PyResult<PyObject> {
+        let payload = PyBytes::new(py, &self.payload);
+        let tuple = PyTuple::new(
+            py,
+            [
+                payload.into_any(),
+                to_array(py, "B", &self.kinds)?,
+                to_array(py, "Q", &self.steam_ids)?,
+                to_array(py, "Q", &self.lobbies)?,
+                to_array(py, "Q", &self.extras)?,
+                to_array(py, "I", &self.codes)?,
+                to_array(py, "Q", &self.offsets)?,
+                to_array(py, "Q", &self.lengths)?,
+            ],
+        )?;
+        Ok(tuple.into_any().unbind())
+    }
+}
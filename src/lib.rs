@@ -1,15 +1,67 @@
+mod aio;
+mod batch;
+mod capture;
+mod coalesce;
+mod events;
+mod lobby;
+mod loopback;
+mod message;
 mod net_client;
+mod pump;
+mod replication;
+mod schedule;
+mod router;
+mod session;
+mod shm;
+mod startup;
+mod stats;
+mod transfer;
+mod transport;
+mod worker;
 
-use pyo3::prelude::*;
+use pyo3::{exceptions::PyAttributeError, prelude::*, sync::GILOnceCell};
 
-use crate::net_client::PySteamClient;
+use crate::{
+    aio::MessageStream,
+    events::{
+        EVENT_LOBBY_CHANGED, EVENT_LOBBY_CREATED, EVENT_LOBBY_JOINED, EVENT_MESSAGE,
+        EVENT_SESSION_FAILED, EVENT_SESSION_STATE,
+    },
+    message::SteamMessage,
+    net_client::PySteamClient,
+    worker::SteamNetWorker,
+};
 
-#[pymodule]
-fn py_steam_net(py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
+static GLOBAL_CLIENT: GILOnceCell<Py<PySteamClient>> = GILOnceCell::new();
+
+/// Creates the module-level `py_steam_net` client on first access, so
+/// importing the module does no work.
+#[pyfunction]
+fn __getattr__(py: Python<'_>, name: &str) -> PyResult<Py<PySteamClient>> {
+    if name != "py_steam_net" {
+        return Err(PyAttributeError::new_err(format!(
+            "module 'py_steam_net' has no attribute {name:?}"
+        )));
+    }
+    let client = GLOBAL_CLIENT.get_or_try_init(py, || Py::new(py, PySteamClient::new()))?;
+    Ok(client.clone_ref(py))
+}
+
+#[pymodule(gil_used = false)]
+fn py_steam_net(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<PySteamClient>()?;
+    m.add_class::<SteamMessage>()?;
+    m.add_class::<MessageStream>()?;
+    m.add_class::<SteamNetWorker>()?;
+
+    m.add("EVENT_MESSAGE", EVENT_MESSAGE)?;
+    m.add("EVENT_LOBBY_CHANGED", EVENT_LOBBY_CHANGED)?;
+    m.add("EVENT_SESSION_FAILED", EVENT_SESSION_FAILED)?;
+    m.add("EVENT_LOBBY_CREATED", EVENT_LOBBY_CREATED)?;
+    m.add("EVENT_LOBBY_JOINED", EVENT_LOBBY_JOINED)?;
+    m.add("EVENT_SESSION_STATE", EVENT_SESSION_STATE)?;
 
-    let global = Py::new(py, PySteamClient::new())?;
-    m.add("py_steam_net", global)?;
+    m.add_function(wrap_pyfunction!(__getattr__, m)?)?;
 
     Ok(())
 }
\ No newline at end of file
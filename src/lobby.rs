@@ -0,0 +1,105 @@
+use std::collections::{HashMap, HashSet};
+
+use pyo3::{prelude::*, types::PyTuple};
+
+struct LobbyEntry {
+    members: Vec<u64>,
+    version: u64,
+    tuple: Option<Py<PyTuple>>,
+}
+
+/// Membership of the lobbies this client has created or joined, kept up to
+/// date from `LobbyChatUpdate` so reads never have to query Steam.
+#[derive(Default)]
+pub struct LobbyCache {
+    lobbies: HashMap<u64, LobbyEntry>,
+    next_version: u64,
+}
+
+impl LobbyCache {
+    fn bump(&mut self) -> u64 {
+        self.next_version += 1;
+        self.next_version
+    }
+
+    pub fn seed(&mut self, lobby_id: u64, members: Vec<u64>) {
+        let version = self.bump();
+        self.lobbies.insert(
+            lobby_id,
+            LobbyEntry {
+                members,
+                version,
+                tuple: None,
+            },
+        );
+    }
+
+    /// Applies a membership change. Changes for lobbies that were never
+    /// seeded are ignored.
+    pub fn apply(&mut self, lobby_id: u64, steam_id: u64, entered: bool) {
+        let version = self.bump();
+        if let Some(entry) = self.lobbies.get_mut(&lobby_id) {
+            let position = entry.members.iter().position(|&id| id == steam_id);
+            match (entered, position) {
+                (true, None) => entry.members.push(steam_id),
+                (false, Some(index)) => {
+                    entry.members.swap_remove(index);
+                }
+                _ => return,
+            }
+            entry.version = version;
+            entry.tuple = None;
+        }
+    }
+
+    pub fn remove(&mut self, lobby_id: u64) {
+        self.bump();
+        self.lobbies.remove(&lobby_id);
+    }
+
+    pub fn clear(&mut self) {
+        self.bump();
+        self.lobbies.clear();
+    }
+
+    /// Changes whenever any cached membership changes.
+    pub fn generation(&self) -> u64 {
+        self.next_version
+    }
+
+    pub fn contains_member(&self, steam_id: u64) -> bool {
+        self.lobbies
+            .values()
+            .any(|entry| entry.members.contains(&steam_id))
+    }
+
+    /// Returns every member of every cached lobby.
+    pub fn all_members(&self) -> HashSet<u64> {
+        self.lobbies
+            .values()
+            .flat_map(|entry| entry.members.iter().copied())
+            .collect()
+    }
+
+    pub fn members(&self, lobby_id: u64) -> Option<&[u64]> {
+        self.lobbies.get(&lobby_id).map(|entry| entry.members.as_slice())
+    }
+
+    pub fn version(&self, lobby_id: u64) -> Option<u64> {
+        self.lobbies.get(&lobby_id).map(|entry| entry.version)
+    }
+
+    /// Returns the cached member tuple, building it only if membership
+    /// changed since the last read.
+    pub fn members_tuple(&mut self, py: Python<'_>, lobby_id: u64) -> PyResult<Option<Py<PyTuple>>> {
+        match self.lobbies.get_mut(&lobby_id) {
+            Some(entry) => {
+                if entry.tuple.is_none() {
+                    entry.tuple = Some(PyTuple::new(py, &entry.members)?.unbind());
+                }
+                Ok(entry.tuple.as_ref().map(|tuple| tuple.clone_ref(py)))
+            }
+            None => Ok(None),
+        }
+    }
+}
@@ -0,0 +1,486 @@
+use std::{
+    cmp::{Ordering, Reverse},
+    collections::{BinaryHeap, HashMap, VecDeque},
+    sync::{
+        atomic::{self, AtomicU64},
+        Arc, Mutex, OnceLock, Weak,
+    },
+    time::{Duration, Instant},
+};
+
+use steamworks::SteamError;
+
+use crate::{
+    session::SessionStatus,
+    transport::{LobbyUpdate, MEMBER_DISCONNECTED, MEMBER_ENTERED, MEMBER_LEFT},
+};
+
+/// First fake SteamID, an individual account in the public universe.
+const STEAM_ID_BASE: u64 = 0x0110_0001_0000_0000;
+/// First fake lobby ID, a chat ID in the public universe.
+const LOBBY_ID_BASE: u64 = 0x0186_0000_0000_0000;
+/// Largest message Steam accepts in one send.
+const MAX_MESSAGE_SIZE: usize = 512 * 1024;
+
+/// Retransmissions simulated for one reliable message before it goes through.
+const MAX_RETRANSMITS: u32 = 16;
+
+const SEND_NO_DELAY: i32 = 4;
+const SEND_RELIABLE: i32 = 8;
+
+static NEXT_STEAM_ID: AtomicU64 = AtomicU64::new(1);
+static NEXT_LOBBY_ID: AtomicU64 = AtomicU64::new(1);
+static NEXT_SEQ: AtomicU64 = AtomicU64::new(0);
+
+/// Conditions applied to everything a loopback client sends.
+#[derive(Clone, Copy, Default)]
+pub struct LinkConditions {
+    /// One-way delay added to every message.
+    pub latency: Duration,
+    /// Probability that a transmission is lost. Unreliable messages are
+    /// dropped; reliable ones are retransmitted one round trip later.
+    pub loss: f64,
+    /// Outgoing bytes per second, or `0` for unlimited.
+    pub bandwidth: u64,
+}
+
+struct Lobby {
+    app_id: u32,
+    max_members: u32,
+    members: Vec<u64>,
+}
+
+/// Process-wide registry of loopback clients and the lobbies they share.
+#[derive(Default)]
+struct Network {
+    peers: HashMap<u64, Weak<LoopbackPeer>>,
+    lobbies: HashMap<u64, Lobby>,
+}
+
+fn network() -> &'static Mutex<Network> {
+    static NETWORK: OnceLock<Mutex<Network>> = OnceLock::new();
+    NETWORK.get_or_init(Default::default)
+}
+
+/// Upgrades `ids` to live peers. The returned handles must be dropped after
+/// the network lock is released, since dropping the last one unregisters
+/// the peer.
+fn upgrade(peers: &HashMap<u64, Weak<LoopbackPeer>>, ids: &[u64]) -> Vec<Arc<LoopbackPeer>> {
+    ids.iter()
+        .filter_map(|id| peers.get(id).and_then(Weak::upgrade))
+        .collect()
+}
+
+struct Delivery {
+    at: Instant,
+    seq: u64,
+    from: u64,
+    data: Vec<u8>,
+}
+
+impl PartialEq for Delivery {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
+}
+
+impl Eq for Delivery {}
+
+impl PartialOrd for Delivery {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl Ord for Delivery {
+    fn cmp(&self, other: &Self) -> Ordering {
+        (self.at, self.seq).cmp(&(other.at, other.seq))
+    }
+}
+
+/// Outgoing side of a loopback client: serializes sends at the configured
+/// bandwidth and keeps reliable messages in order per recipient and channel.
+struct Link {
+    conditions: LinkConditions,
+    busy_until: Instant,
+    in_flight: VecDeque<(Instant, usize, bool)>,
+    last_reliable: HashMap<(u64, u32), Instant>,
+    rng: u64,
+}
+
+impl Link {
+    fn transmit_time(&self, bytes: usize) -> Duration {
+        match self.conditions.bandwidth {
+            0 => Duration::ZERO,
+            bandwidth => Duration::from_secs_f64(bytes as f64 / bandwidth as f64),
+        }
+    }
+
+    fn lost(&mut self) -> bool {
+        if self.conditions.loss <= 0.0 {
+            return false;
+        }
+        // xorshift64: cheap and reproducible per SteamID.
+        self.rng ^= self.rng << 13;
+        self.rng ^= self.rng >> 7;
+        self.rng ^= self.rng << 17;
+        ((self.rng >> 11) as f64 / (1u64 << 53) as f64) < self.conditions.loss
+    }
+
+    fn prune(&mut self, now: Instant) {
+        while self
+            .in_flight
+            .front()
+            .is_some_and(|&(done, _, _)| done <= now)
+        {
+            self.in_flight.pop_front();
+        }
+    }
+}
+
+type Event = Box<dyn FnOnce(&LoopbackPeer) + Send>;
+type LobbyHandler = Arc<dyn Fn(LobbyUpdate) + Send + Sync>;
+type SessionFailedHandler = Arc<dyn Fn(u64) + Send + Sync>;
+
+/// In-process stand-in for a logged-in Steam client. Clients created with
+/// the same app ID can message each other and share lobbies. Lobby results
+/// and events are queued and delivered from `run_callbacks`, like Steam's.
+pub struct LoopbackPeer {
+    steam_id: u64,
+    app_id: u32,
+    link: Mutex<Link>,
+    inbox: Mutex<HashMap<u32, BinaryHeap<Reverse<Delivery>>>>,
+    events: Mutex<VecDeque<Event>>,
+    lobby_handler: Mutex<Option<LobbyHandler>>,
+    session_failed_handler: Mutex<Option<SessionFailedHandler>>,
+}
+
+impl LoopbackPeer {
+    pub fn connect(app_id: u32, conditions: LinkConditions) -> Arc<Self> {
+        let steam_id = STEAM_ID_BASE + NEXT_STEAM_ID.fetch_add(1, atomic::Ordering::Relaxed);
+        let peer = Arc::new(LoopbackPeer {
+            steam_id,
+            app_id,
+            link: Mutex::new(Link {
+                conditions,
+                busy_until: Instant::now(),
+                in_flight: VecDeque::new(),
+                last_reliable: HashMap::new(),
+                rng: steam_id,
+            }),
+            inbox: Mutex::new(HashMap::new()),
+            events: Mutex::new(VecDeque::new()),
+            lobby_handler: Mutex::new(None),
+            session_failed_handler: Mutex::new(None),
+        });
+        network()
+            .lock()
+            .unwrap()
+            .peers
+            .insert(steam_id, Arc::downgrade(&peer));
+        peer
+    }
+
+    pub fn steam_id(&self) -> u64 {
+        self.steam_id
+    }
+
+    pub fn set_conditions(&self, conditions: LinkConditions) {
+        self.link.lock().unwrap().conditions = conditions;
+    }
+
+    pub fn on_lobby_update(&self, handler: impl Fn(LobbyUpdate) + Send + Sync + 'static) {
+        *self.lobby_handler.lock().unwrap() = Some(Arc::new(handler));
+    }
+
+    pub fn on_session_failed(&self, handler: impl Fn(u64) + Send + Sync + 'static) {
+        *self.session_failed_handler.lock().unwrap() = Some(Arc::new(handler));
+    }
+
+    fn post(&self, event: Event) {
+        self.events.lock().unwrap().push_back(event);
+    }
+
+    fn post_lobby_update(&self, update: LobbyUpdate) {
+        self.post(Box::new(move |peer| {
+            let handler = peer.lobby_handler.lock().unwrap().clone();
+            if let Some(handler) = handler {
+                handler(update);
+            }
+        }));
+    }
+
+    /// Runs queued lobby results and events. Events posted while running are
+    /// left for the next call.
+    pub fn run_callbacks(&self) {
+        let events = std::mem::take(&mut *self.events.lock().unwrap());
+        for event in events {
+            event(self);
+        }
+    }
+
+    pub fn create_lobby(
+        &self,
+        max_members: u32,
+        cb: impl FnOnce(Result<u64, SteamError>) + Send + 'static,
+    ) {
+        let result = if max_members == 0 {
+            Err(SteamError::InvalidParam)
+        } else {
+            let lobby_id = LOBBY_ID_BASE + NEXT_LOBBY_ID.fetch_add(1, atomic::Ordering::Relaxed);
+            let lobby = Lobby {
+                app_id: self.app_id,
+                max_members,
+                members: vec![self.steam_id],
+            };
+            network().lock().unwrap().lobbies.insert(lobby_id, lobby);
+            Ok(lobby_id)
+        };
+        self.post(Box::new(move |_| cb(result)));
+    }
+
+    pub fn join_lobby(&self, lobby_id: u64, cb: impl FnOnce(Result<u64, ()>) + Send + 'static) {
+        let mut notify = Vec::new();
+        let result = {
+            let mut network = network().lock().unwrap();
+            let Network { peers, lobbies } = &mut *network;
+            match lobbies.get_mut(&lobby_id) {
+                Some(lobby) if lobby.app_id == self.app_id => {
+                    if lobby.members.contains(&self.steam_id) {
+                        Ok(lobby_id)
+                    } else if lobby.members.len() >= lobby.max_members as usize {
+                        Err(())
+                    } else {
+                        notify = upgrade(peers, &lobby.members);
+                        lobby.members.push(self.steam_id);
+                        Ok(lobby_id)
+                    }
+                }
+                _ => Err(()),
+            }
+        };
+        for peer in notify {
+            peer.post_lobby_update(LobbyUpdate {
+                lobby: lobby_id,
+                user_changed: self.steam_id,
+                making_change: self.steam_id,
+                state: MEMBER_ENTERED,
+            });
+        }
+        self.post(Box::new(move |_| cb(result)));
+    }
+
+    pub fn leave_lobby(&self, lobby_id: u64) {
+        let notify = {
+            let mut network = network().lock().unwrap();
+            depart(&mut network, self.steam_id, lobby_id)
+        };
+        for peer in notify {
+            peer.post_lobby_update(LobbyUpdate {
+                lobby: lobby_id,
+                user_changed: self.steam_id,
+                making_change: self.steam_id,
+                state: MEMBER_LEFT,
+            });
+        }
+    }
+
+    pub fn lobby_members(&self, lobby_id: u64) -> Vec<u64> {
+        let network = network().lock().unwrap();
+        network
+            .lobbies
+            .get(&lobby_id)
+            .map(|lobby| lobby.members.clone())
+            .unwrap_or_default()
+    }
+
+    pub fn send(
+        &self,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        data: &[u8],
+    ) -> Result<(), SteamError> {
+        if data.len() > MAX_MESSAGE_SIZE {
+            return Err(SteamError::InvalidParam);
+        }
+        let recipient = {
+            let network = network().lock().unwrap();
+            network
+                .peers
+                .get(&steam_id)
+                .and_then(Weak::upgrade)
+                .filter(|peer| peer.app_id == self.app_id)
+        };
+        let Some(recipient) = recipient else {
+            self.post(Box::new(move |peer| {
+                let handler = peer.session_failed_handler.lock().unwrap().clone();
+                if let Some(handler) = handler {
+                    handler(steam_id);
+                }
+            }));
+            return Err(SteamError::NoConnection);
+        };
+
+        let reliable = message_type & SEND_RELIABLE != 0;
+        let now = Instant::now();
+        let at = {
+            let mut link = self.link.lock().unwrap();
+            link.prune(now);
+            let start = link.busy_until.max(now);
+            if !reliable && message_type & SEND_NO_DELAY != 0 && start > now {
+                return Err(SteamError::Ignored);
+            }
+            link.busy_until = start + link.transmit_time(data.len());
+            let sent = link.busy_until;
+            link.in_flight.push_back((sent, data.len(), reliable));
+
+            let latency = link.conditions.latency;
+            let mut at = sent + latency;
+            if reliable {
+                let round_trip = (latency * 2).max(Duration::from_millis(1));
+                let mut retransmits = 0;
+                while retransmits < MAX_RETRANSMITS && link.lost() {
+                    at += round_trip;
+                    retransmits += 1;
+                }
+                let last = link.last_reliable.entry((steam_id, channel)).or_insert(at);
+                at = at.max(*last);
+                *last = at;
+            } else if link.lost() {
+                return Ok(());
+            }
+            at
+        };
+
+        let delivery = Delivery {
+            at,
+            seq: NEXT_SEQ.fetch_add(1, atomic::Ordering::Relaxed),
+            from: self.steam_id,
+            data: data.to_vec(),
+        };
+        recipient
+            .inbox
+            .lock()
+            .unwrap()
+            .entry(channel)
+            .or_default()
+            .push(Reverse(delivery));
+        Ok(())
+    }
+
+    /// Takes up to `max_messages` messages on `channel` whose delivery time
+    /// has passed, as `(sender, payload)` pairs.
+    pub fn receive(&self, channel: u32, max_messages: usize) -> Vec<(u64, Vec<u8>)> {
+        let now = Instant::now();
+        let mut inbox = self.inbox.lock().unwrap();
+        let Some(queue) = inbox.get_mut(&channel) else {
+            return Vec::new();
+        };
+        let mut received = Vec::new();
+        while received.len() < max_messages {
+            match queue.peek() {
+                Some(Reverse(delivery)) if delivery.at <= now => {
+                    let Reverse(delivery) = queue.pop().unwrap();
+                    received.push((delivery.from, delivery.data));
+                }
+                _ => break,
+            }
+        }
+        received
+    }
+
+    /// Returns the session state code and simulated status towards
+    /// `steam_id`. Throughput is not simulated and reported as zero.
+    pub fn session_status(&self, steam_id: u64) -> (i32, Option<SessionStatus>) {
+        let remote = {
+            let network = network().lock().unwrap();
+            network
+                .peers
+                .get(&steam_id)
+                .and_then(Weak::upgrade)
+                .filter(|peer| peer.app_id == self.app_id)
+        };
+        let Some(remote) = remote else {
+            return (0, None);
+        };
+        let remote_conditions = remote.link.lock().unwrap().conditions;
+
+        let now = Instant::now();
+        let mut link = self.link.lock().unwrap();
+        link.prune(now);
+        let (mut pending_reliable, mut pending_unreliable) = (0, 0);
+        for &(_, bytes, reliable) in &link.in_flight {
+            if reliable {
+                pending_reliable += bytes as i32;
+            } else {
+                pending_unreliable += bytes as i32;
+            }
+        }
+        let conditions = link.conditions;
+        let status = SessionStatus {
+            ping: (conditions.latency + remote_conditions.latency).as_millis() as i32,
+            quality_local: (1.0 - remote_conditions.loss) as f32,
+            quality_remote: (1.0 - conditions.loss) as f32,
+            pending_reliable,
+            pending_unreliable,
+            sent_unacked_reliable: 0,
+            send_rate: match conditions.bandwidth {
+                0 => i32::MAX,
+                bandwidth => bandwidth.min(i32::MAX as u64) as i32,
+            },
+            out_bytes_per_sec: 0.0,
+            in_bytes_per_sec: 0.0,
+            queue_time_us: link.busy_until.saturating_duration_since(now).as_micros() as i64,
+        };
+        (3, Some(status))
+    }
+}
+
+/// Removes `steam_id` from `lobby_id`, dropping the lobby once empty, and
+/// returns the remaining members to notify.
+fn depart(network: &mut Network, steam_id: u64, lobby_id: u64) -> Vec<Arc<LoopbackPeer>> {
+    let Some(lobby) = network.lobbies.get_mut(&lobby_id) else {
+        return Vec::new();
+    };
+    let Some(index) = lobby.members.iter().position(|&id| id == steam_id) else {
+        return Vec::new();
+    };
+    lobby.members.remove(index);
+    if lobby.members.is_empty() {
+        network.lobbies.remove(&lobby_id);
+        return Vec::new();
+    }
+    upgrade(&network.peers, &lobby.members)
+}
+
+impl Drop for LoopbackPeer {
+    /// Unregisters the client and reports it as disconnected from every lobby
+    /// it was still in.
+    fn drop(&mut self) {
+        let mut notify = Vec::new();
+        {
+            let mut network = network().lock().unwrap();
+            network.peers.remove(&self.steam_id);
+            let joined: Vec<u64> = network
+                .lobbies
+                .iter()
+                .filter(|(_, lobby)| lobby.members.contains(&self.steam_id))
+                .map(|(&lobby_id, _)| lobby_id)
+                .collect();
+            for lobby_id in joined {
+                for peer in depart(&mut network, self.steam_id, lobby_id) {
+                    notify.push((peer, lobby_id));
+                }
+            }
+        }
+        for (peer, lobby_id) in notify {
+            peer.post_lobby_update(LobbyUpdate {
+                lobby: lobby_id,
+                user_changed: self.steam_id,
+                making_change: self.steam_id,
+                state: MEMBER_DISCONNECTED,
+            });
+        }
+    }
+}
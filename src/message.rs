@@ -0,0 +1,113 @@
+use std::{
+    ops::Range,
+    os::raw::{c_int, c_void},
+    sync::Arc,
+};
+
+use pyo3::{exceptions::PyBufferError, ffi, prelude::*, types::PyBytes};
+
+use crate::transport::Received;
+
+/// A received message exposed through the buffer protocol. The payload stays
+/// in Steam's receive buffer (or the loopback backend's copy) and is handed
+/// back when the view is released or garbage collected. Messages unpacked
+/// from one coalesced Steam message share it, and it is handed back once
+/// every view is released.
+#[pyclass(unsendable)]
+pub struct SteamMessage {
+    message: Option<Arc<Received>>,
+    range: Range<usize>,
+    steam_id: u64,
+    channel: u32,
+    exports: usize,
+}
+
+impl SteamMessage {
+    pub fn new(message: Arc<Received>, range: Range<usize>, steam_id: u64, channel: u32) -> Self {
+        SteamMessage {
+            message: Some(message),
+            range,
+            steam_id,
+            channel,
+            exports: 0,
+        }
+    }
+
+    fn data(&self) -> PyResult<&[u8]> {
+        match &self.message {
+            Some(message) => Ok(&message.data()[self.range.clone()]),
+            None => Err(PyBufferError::new_err("Message has been released")),
+        }
+    }
+}
+
+#[pymethods]
+impl SteamMessage {
+    #[getter]
+    pub fn steam_id(&self) -> u64 {
+        self.steam_id
+    }
+
+    #[getter]
+    pub fn channel(&self) -> u32 {
+        self.channel
+    }
+
+    #[getter]
+    pub fn released(&self) -> bool {
+        self.message.is_none()
+    }
+
+    pub fn __len__(&self) -> usize {
+        self.message.as_ref().map_or(0, |_| self.range.len())
+    }
+
+    pub fn tobytes<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyBytes>> {
+        Ok(PyBytes::new(py, self.data()?))
+    }
+
+    /// Returns the message to Steam. Fails while a memoryview still exports it.
+    pub fn release(&mut self) -> PyResult<()> {
+        if self.exports > 0 {
+            return Err(PyBufferError::new_err(
+                "Cannot release a message while a buffer export is active",
+            ));
+        }
+        self.message = None;
+        Ok(())
+    }
+
+    pub fn __enter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    pub fn __exit__(
+        &mut self,
+        _exc_type: PyObject,
+        _exc_value: PyObject,
+        _traceback: PyObject,
+    ) -> PyResult<()> {
+        self.release()
+    }
+
+    unsafe fn __getbuffer__(
+        mut slf: PyRefMut<'_, Self>,
+        view: *mut ffi::Py_buffer,
+        flags: c_int,
+    ) -> PyResult<()> {
+        let py = slf.py();
+        let (buf, len) = {
+            let data = slf.data()?;
+            (data.as_ptr() as *mut c_void, data.len() as ffi::Py_ssize_t)
+        };
+        if ffi::PyBuffer_FillInfo(view, slf.as_ptr(), buf, len, 1, flags) == -1 {
+            return Err(PyErr::fetch(py));
+        }
+        slf.exports += 1;
+        Ok(())
+    }
+
+    unsafe fn __releasebuffer__(mut slf: PyRefMut<'_, Self>, _view: *mut ffi::Py_buffer) {
+        slf.exports -= 1;
+    }
+}
@@ -1,23 +1,110 @@
-use std::sync::{Arc, Mutex};
+use std::{
+    path::PathBuf,
+    sync::{
+        atomic::{AtomicBool, Ordering},
+        Arc, Mutex, RwLock,
+    },
+    thread,
+    time::{Duration, Instant},
+};
 
 use pyo3::{
-    exceptions::PyRuntimeError,
+    exceptions::{PyRuntimeError, PyValueError},
     prelude::*,
-    types::{PyBytes, PyList},
+    types::{PyBytes, PyDict, PyList, PyString, PyTuple},
 };
-use steamworks::{
-    networking_messages::NetworkingMessages,
-    networking_types::{NetworkingIdentity, SendFlags},
-    Client, ClientManager, LobbyChatUpdate, LobbyId, LobbyType, SingleClient, SteamId,
+use steamworks::SteamError;
+
+use crate::{
+    aio::{resolve_threadsafe, running_loop, AioDriver, LobbyCompletion, MessageStream},
+    batch::{to_array, MessageBatch},
+    coalesce::{Coalescer, Frames, Push, Unpacking},
+    events::{
+        Event, EventBatch, EventQueue, EVENT_LOBBY_CREATED, EVENT_LOBBY_JOINED, LOBBY_FAIL,
+        LOBBY_OK,
+    },
+    lobby::LobbyCache,
+    loopback::LinkConditions,
+    message::SteamMessage,
+    pump::{CallbackRunner, Pump},
+    replication::{Replicator, REPLICATION_SEND_FLAGS},
+    router::Router,
+    schedule::{Scheduled, Scheduler},
+    session::{
+        SessionActions, SessionInfoBatch, SessionManager, SessionPolicy, SESSION_HELLO,
+        SESSION_SEND_FLAGS,
+    },
+    shm::{Bus, BusHost},
+    startup::Startup,
+    stats::NetStats,
+    transfer::{Accept, Payload, Source, TransferEvent, Transfers, TRANSFER_SEND_FLAGS},
+    transport::{Backend, Received, Transport, MEMBER_ENTERED},
 };
 
-#[pyclass(unsendable)]
+/// Messages drained per channel on each asyncio driver step.
+const AIO_MAX_MESSAGES: usize = 256;
+
+/// Messages read from the transfer and replication channels per tick.
+const TRANSFER_MAX_MESSAGES: usize = 1024;
+const REPLICATION_MAX_MESSAGES: usize = 1024;
+
+/// How often and for how long relay network availability is polled after
+/// initialization.
+const RELAY_WATCH_INTERVAL: Duration = Duration::from_millis(10);
+const RELAY_WATCH_TIMEOUT: Duration = Duration::from_secs(30);
+
+/// Warm-up messages drained from the session channel per read.
+const SESSION_MAX_MESSAGES: usize = 256;
+
+/// Per-recipient send result codes, numbered like Steam's `EResult`.
+const SEND_NOT_ATTEMPTED: i32 = 0;
+const SEND_OK: i32 = 1;
+const SEND_PENDING: i32 = 22;
+
+pub fn send_result_code(result: &Result<(), SteamError>) -> i32 {
+    match result {
+        Ok(()) => SEND_OK,
+        Err(SteamError::NoConnection) => 3,
+        Err(SteamError::InvalidParam) => 8,
+        Err(SteamError::InvalidState) => 11,
+        Err(SteamError::LimitExceeded) => 25,
+        Err(SteamError::Ignored) => 43,
+        Err(_) => 2,
+    }
+}
+
+struct Connection {
+    transport: Transport,
+    runner: Arc<Mutex<CallbackRunner>>,
+    /// Set once the session request handler is registered with the
+    /// transport. It reads the current session policy, so it is only
+    /// registered once.
+    session_requests: AtomicBool,
+}
+
+/// Safe to share between Python threads: every field is behind a lock or
+/// atomic, and networking calls run with the GIL released.
+#[pyclass(frozen)]
 pub struct PySteamClient {
-    client: Option<(Client, SingleClient)>,
-    messages: Option<NetworkingMessages<ClientManager>>,
+    client: RwLock<Option<Arc<Connection>>>,
     cb_conn_failed: Arc<Mutex<Option<Py<PyAny>>>>,
     cb_lobby_changed: Arc<Mutex<Option<Py<PyAny>>>>,
-    cb_message_recv: Arc<Mutex<Option<Py<PyAny>>>>,
+    cb_transfer: Mutex<Option<Py<PyAny>>>,
+    cb_session_state: Mutex<Option<Py<PyAny>>>,
+    events: Arc<Mutex<EventQueue>>,
+    router: Router,
+    lobbies: Arc<Mutex<LobbyCache>>,
+    pump: Mutex<Option<Arc<Pump>>>,
+    bus: Mutex<Option<Arc<BusHost>>>,
+    aio: Arc<Mutex<AioDriver>>,
+    coalescer: Mutex<Option<Coalescer>>,
+    unpacking: Arc<Unpacking>,
+    scheduler: Mutex<Option<Scheduler>>,
+    transfers: Mutex<Option<Transfers>>,
+    replication: Mutex<Option<Replicator>>,
+    sessions: Arc<Mutex<Option<SessionManager>>>,
+    startup: Arc<Startup>,
+    stats: Arc<NetStats>,
 }
 
 #[pymethods]
@@ -25,204 +112,2002 @@ impl PySteamClient {
     #[new]
     pub fn new() -> Self {
         PySteamClient {
-            client: None,
-            messages: None,
+            client: RwLock::new(None),
             cb_conn_failed: Arc::new(Mutex::new(None)),
             cb_lobby_changed: Arc::new(Mutex::new(None)),
-            cb_message_recv: Arc::new(Mutex::new(None)),
+            cb_transfer: Mutex::new(None),
+            cb_session_state: Mutex::new(None),
+            events: Arc::new(Mutex::new(EventQueue::default())),
+            router: Router::default(),
+            lobbies: Arc::new(Mutex::new(LobbyCache::default())),
+            pump: Mutex::new(None),
+            bus: Mutex::new(None),
+            aio: Arc::new(Mutex::new(AioDriver::default())),
+            coalescer: Mutex::new(None),
+            unpacking: Arc::new(Unpacking::default()),
+            scheduler: Mutex::new(None),
+            transfers: Mutex::new(None),
+            replication: Mutex::new(None),
+            sessions: Arc::new(Mutex::new(None)),
+            startup: Arc::new(Startup::default()),
+            stats: Arc::new(NetStats::default()),
         }
     }
 
-    pub fn init(&mut self, app_id: u32) -> PyResult<()> {
-        match Client::init_app(app_id) {
-            Ok((client, single)) => {
-                let cb_lobby_changed_shared = self.cb_lobby_changed.clone();
-                client.register_callback::<LobbyChatUpdate, _>(move |update| {
-                    Python::with_gil(|py| {
-                        if let Some(cb) = &*cb_lobby_changed_shared.lock().unwrap() {
-                            let _ = cb.call1(
-                                py,
-                                (
-                                    update.lobby.raw(),
-                                    update.user_changed.raw(),
-                                    update.making_change.raw(),
-                                    update.member_state_change as u64,
-                                ),
-                            );
-                        }
-                    });
-                });
+    /// Initializes networking. `backend="loopback"` replaces Steam with
+    /// in-process clients that get fake SteamIDs and can message each other
+    /// and share lobbies when created with the same `app_id`; `latency_ms`,
+    /// `loss` and `bandwidth` shape what this client sends.
+    /// `backend="replay"` plays back the capture at `replay_path` at
+    /// `replay_speed` times the recorded pace (`0` for as fast as it is
+    /// read); sends are discarded and lobby operations fail.
+    /// With `background`, returns at once and initializes on a native
+    /// thread; see `wait_ready` and `init_status`.
+    #[pyo3(signature = (app_id, backend="steam", latency_ms=0.0, loss=0.0, bandwidth=0, replay_path=None, replay_speed=1.0, background=false))]
+    pub fn init(
+        slf: &Bound<'_, Self>,
+        app_id: u32,
+        backend: &str,
+        latency_ms: f64,
+        loss: f64,
+        bandwidth: u64,
+        replay_path: Option<PathBuf>,
+        replay_speed: f64,
+        background: bool,
+    ) -> PyResult<()> {
+        let backend = parse_backend(
+            backend,
+            latency_ms,
+            loss,
+            bandwidth,
+            replay_path,
+            replay_speed,
+        )?;
+        let this = slf.get();
+        this.startup.begin().map_err(PyRuntimeError::new_err)?;
+        if background {
+            Self::connect_in_background(slf, app_id, backend, None)
+        } else {
+            slf.py()
+                .allow_threads(|| this.connect(app_id, backend))
+                .map_err(PyRuntimeError::new_err)
+        }
+    }
 
-                let networking = client.networking_messages();
-                let cb_connection_failed_shared = self.cb_conn_failed.clone();
-                networking.session_failed_callback(move |info| {
-                    Python::with_gil(|py| {
-                        if let Some(cb) = &*cb_connection_failed_shared.lock().unwrap() {
-                            let _ = cb.call1(
-                                py,
-                                (info.identity_remote().unwrap().steam_id().unwrap().raw(),),
-                            );
-                        }
-                    });
-                });
+    /// Initializes networking on a native thread like
+    /// `init(background=True)` and returns an asyncio future that resolves
+    /// once the client is ready.
+    #[pyo3(signature = (app_id, backend="steam", latency_ms=0.0, loss=0.0, bandwidth=0, replay_path=None, replay_speed=1.0))]
+    pub fn init_async(
+        slf: &Bound<'_, Self>,
+        app_id: u32,
+        backend: &str,
+        latency_ms: f64,
+        loss: f64,
+        bandwidth: u64,
+        replay_path: Option<PathBuf>,
+        replay_speed: f64,
+    ) -> PyResult<PyObject> {
+        let py = slf.py();
+        let backend = parse_backend(
+            backend,
+            latency_ms,
+            loss,
+            bandwidth,
+            replay_path,
+            replay_speed,
+        )?;
+        let event_loop = running_loop(py)?;
+        let future = event_loop.call_method0("create_future")?;
+        slf.get().startup.begin().map_err(PyRuntimeError::new_err)?;
+        Self::connect_in_background(
+            slf,
+            app_id,
+            backend,
+            Some((event_loop.unbind(), future.clone().unbind())),
+        )?;
+        Ok(future.unbind())
+    }
+
+    /// Blocks until initialization finished, and with `relay` until the
+    /// Steam relay network is usable too. Returns `False` on timeout or if
+    /// initialization failed.
+    #[pyo3(signature = (timeout=None, relay=false))]
+    pub fn wait_ready(&self, py: Python<'_>, timeout: Option<f64>, relay: bool) -> bool {
+        let timeout = timeout.map(|timeout| Duration::from_secs_f64(timeout.max(0.0)));
+        py.allow_threads(|| self.startup.wait(timeout, relay))
+    }
+
+    /// Returns the initialization state, its error and how long each stage
+    /// took.
+    pub fn init_status<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        self.startup.to_dict(py)
+    }
 
-                self.client = Some((client, single));
-                self.messages = Some(networking);
+    /// Changes the latency, loss and bandwidth simulated for this client's
+    /// outgoing messages. Only supported by the loopback backend.
+    #[pyo3(signature = (latency_ms=0.0, loss=0.0, bandwidth=0))]
+    pub fn set_link_conditions(&self, latency_ms: f64, loss: f64, bandwidth: u64) -> PyResult<()> {
+        match self.connection() {
+            Some(connection)
+                if connection
+                    .transport
+                    .set_conditions(link_conditions(latency_ms, loss, bandwidth)) =>
+            {
                 Ok(())
             }
-            Err(e) => Err(PyRuntimeError::new_err(e.to_string())),
+            Some(_) => Err(PyRuntimeError::new_err(
+                "Link conditions require the loopback backend",
+            )),
+            None => Err(PyRuntimeError::new_err("Client not initialized")),
         }
     }
 
-    pub fn deinit(&mut self) {
-        self.client = None;
+    pub fn deinit(&self, py: Python<'_>) {
+        // A background initialization would set the client after this.
+        py.allow_threads(|| self.startup.wait(None, false));
+        self.stop_pump(py);
+        self.stop_shared_bus(py);
+        // Dropping a loopback client may take other clients' locks.
+        let connection = self.client.write().unwrap().take();
+        py.allow_threads(|| drop(connection));
+        self.lobbies.lock().unwrap().clear();
+        if let Some(transfers) = &mut *self.transfers.lock().unwrap() {
+            transfers.clear();
+        }
+        if let Some(replicator) = &mut *self.replication.lock().unwrap() {
+            replicator.clear();
+        }
+        if let Some(manager) = &mut *self.sessions.lock().unwrap() {
+            manager.clear();
+        }
+        self.events.lock().unwrap().clear();
+        self.startup.reset();
     }
 
     pub fn is_ready(&self) -> bool {
-        self.client.is_some()
+        self.client.read().unwrap().is_some()
     }
 
-    pub fn run_callbacks(&self) {
-        if let Some(client) = &self.client {
-            client.1.run_callbacks();
+    pub fn run_callbacks(&self, py: Python<'_>) {
+        self.flush_scheduled(py);
+        let flush_on_tick = self
+            .coalescer
+            .lock()
+            .unwrap()
+            .as_ref()
+            .is_some_and(|c| c.flush_on_tick);
+        if flush_on_tick {
+            self.flush(py);
+        }
+        if let Some(connection) = self.connection() {
+            // Called from a lobby or session handler, the runner is already
+            // held by this thread.
+            if !CallbackRunner::running_here() {
+                // The pump thread may hold the runner while waiting for the GIL.
+                py.allow_threads(|| {
+                    let runner = connection.runner.lock().unwrap();
+                    let started = Instant::now();
+                    runner.run();
+                    self.stats.run_callbacks_time.record(started.elapsed());
+                });
+            }
+            self.poll_transfers(py, &connection.transport);
+            self.poll_replication(py, &connection.transport);
+            self.poll_sessions(py, &connection.transport);
         }
     }
 
-    pub fn receive_messages(&self, channel: u32, max_messages: usize) {
-        if let Some(messages) = &self.messages {
-            let received_messages: Vec<(u64, u32, Vec<u8>)> = messages
-                .receive_messages_on_channel(channel, max_messages)
-                .into_iter()
-                .filter_map(|message| {
-                    if let Some(steam_id_identity) = message.identity_peer().steam_id() {
-                        Some((steam_id_identity.raw(), channel, message.data().to_vec()))
-                    } else {
-                        None
+    pub fn receive_messages(&self, py: Python<'_>, channel: u32, max_messages: usize) {
+        let received_messages = self.receive_from_transport(py, channel, max_messages);
+        let routes = self.router.snapshot();
+        let unpack = self.unpacking.contains(channel);
+        for (steam_id, message) in &received_messages {
+            let data = message.data();
+            for (start, end) in Frames::new(data, unpack) {
+                self.stats.record_receive(*steam_id, channel, end - start);
+                self.router.dispatch(
+                    &routes,
+                    &self.stats,
+                    py,
+                    *steam_id,
+                    channel,
+                    &data[start..end],
+                );
+            }
+        }
+    }
+
+    /// Runs callbacks, then drains up to `max_messages` from each of
+    /// `channels`, and returns everything that happened as one columnar
+    /// batch of records in the order it happened. The first call switches
+    /// lobby changes and session failures from their callbacks to the
+    /// batch; lobby operations started without a callback report there too.
+    #[pyo3(signature = (channels, max_messages=256))]
+    pub fn tick(
+        &self,
+        py: Python<'_>,
+        channels: Vec<u32>,
+        max_messages: usize,
+    ) -> PyResult<PyObject> {
+        self.events.lock().unwrap().enabled = true;
+        self.run_callbacks(py);
+        let Some(connection) = self.connection() else {
+            return EventBatch::default().into_py(py);
+        };
+        let batch = py.allow_threads(|| {
+            let mut batch = EventBatch::default();
+            let events = self.events.lock().unwrap().take();
+            for event in events {
+                batch.push_event(event);
+            }
+            for channel in channels {
+                let received = connection
+                    .transport
+                    .receive(channel, max_messages, &self.stats);
+                let unpack = self.unpacking.contains(channel);
+                for (steam_id, message) in received {
+                    let data = message.data();
+                    for (start, end) in Frames::new(data, unpack) {
+                        self.stats.record_receive(steam_id, channel, end - start);
+                        batch.push_message(steam_id, channel, &data[start..end]);
                     }
-                })
-                .collect();
+                }
+            }
+            batch
+        });
+        batch.into_py(py)
+    }
 
-            Python::with_gil(|py| {
-                if let Some(cb) = &*self.cb_message_recv.lock().unwrap() {
-                    for (steam_id, ch, data) in received_messages {
-                        let _ = cb.call1(py, (steam_id, ch, PyBytes::new(py, &data)));
+    /// Returns how many events are waiting for the next `tick` and how many
+    /// were dropped because the queue was full.
+    pub fn event_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        let events = self.events.lock().unwrap();
+        stats.set_item("enabled", events.enabled)?;
+        stats.set_item("queued", events.len())?;
+        stats.set_item("dropped", events.dropped)?;
+        Ok(stats)
+    }
+
+    /// Drains up to `max_messages` from each of `channels` and returns them
+    /// as a single columnar batch instead of invoking the message callback.
+    pub fn receive_batch(
+        &self,
+        py: Python<'_>,
+        channels: Vec<u32>,
+        max_messages: usize,
+    ) -> PyResult<PyObject> {
+        let Some(connection) = self.connection() else {
+            return MessageBatch::default().into_py(py);
+        };
+        let batch = py.allow_threads(|| {
+            let mut batch = MessageBatch::default();
+            for channel in channels {
+                let received = connection
+                    .transport
+                    .receive(channel, max_messages, &self.stats);
+                let bytes = received.iter().map(|(_, m)| m.data().len()).sum();
+                batch.reserve(received.len(), bytes);
+                let unpack = self.unpacking.contains(channel);
+                for (steam_id, message) in received {
+                    let data = message.data();
+                    for (start, end) in Frames::new(data, unpack) {
+                        self.stats.record_receive(steam_id, channel, end - start);
+                        batch.push(steam_id, channel, &data[start..end]);
                     }
                 }
-            });
+            }
+            batch
+        });
+        batch.into_py(py)
+    }
+
+    /// Returns up to `max_messages` from `channel` as `SteamMessage` views that
+    /// read the payload in place instead of copying it into `bytes`.
+    pub fn receive_message_views<'py>(
+        &self,
+        py: Python<'py>,
+        channel: u32,
+        max_messages: usize,
+    ) -> PyResult<Bound<'py, PyList>> {
+        let mut views = Vec::new();
+        let unpack = self.unpacking.contains(channel);
+        for (steam_id, message) in self.receive_from_transport(py, channel, max_messages) {
+            let message = Arc::new(message);
+            for (start, end) in Frames::new(message.data(), unpack) {
+                self.stats.record_receive(steam_id, channel, end - start);
+                let view = SteamMessage::new(message.clone(), start..end, steam_id, channel);
+                views.push(Bound::new(py, view)?);
+            }
+        }
+        PyList::new(py, views)
+    }
+
+    /// Starts a native thread that runs callbacks and drains `channels` every
+    /// `interval_ms` into a bounded queue of `capacity` messages. Messages
+    /// arriving while the queue is full are dropped and counted.
+    #[pyo3(signature = (channels, interval_ms=1.0, capacity=65536, max_messages=256))]
+    pub fn start_pump(
+        &self,
+        channels: Vec<u32>,
+        interval_ms: f64,
+        capacity: usize,
+        max_messages: usize,
+    ) -> PyResult<()> {
+        let mut pump = self.pump.lock().unwrap();
+        if pump.as_ref().is_some_and(|pump| pump.is_running()) {
+            return Err(PyRuntimeError::new_err("Pump already running"));
+        }
+        match self.connection() {
+            Some(connection) => {
+                *pump = Some(Arc::new(Pump::start(
+                    connection.transport.clone(),
+                    connection.runner.clone(),
+                    self.stats.clone(),
+                    self.unpacking.clone(),
+                    channels,
+                    Duration::from_secs_f64(interval_ms.max(0.0) / 1000.0),
+                    capacity,
+                    max_messages,
+                )));
+                Ok(())
+            }
+            None => Err(PyRuntimeError::new_err("Client not initialized")),
         }
     }
 
-    pub fn create_lobby(&mut self, lobby_type: u32, max_members: u32, cb_on_created: Py<PyAny>) {
-        if let Some((client, _)) = &self.client {
-            let matchmaking = client.matchmaking();
+    /// Stops the pump thread. Messages still queued can be drained afterwards.
+    pub fn stop_pump(&self, py: Python<'_>) {
+        if let Some(pump) = self.pump() {
+            py.allow_threads(|| pump.stop());
+        }
+    }
 
-            let lobby_kind = match lobby_type {
-                0 => LobbyType::Private,
-                1 => LobbyType::FriendsOnly,
-                2 => LobbyType::Public,
-                3 => LobbyType::Invisible,
-                _ => LobbyType::Private,
+    /// Passes up to `max_messages` queued pump messages to the message
+    /// callback and returns how many were delivered.
+    #[pyo3(signature = (max_messages=usize::MAX))]
+    pub fn drain_pump(&self, py: Python<'_>, max_messages: usize) -> usize {
+        let Some(pump) = self.pump() else {
+            return 0;
+        };
+        let routes = self.router.snapshot();
+        let mut delivered = 0;
+        while delivered < max_messages {
+            let Some(message) = pump.shared.queue.pop() else {
+                break;
             };
+            self.router.dispatch(
+                &routes,
+                &self.stats,
+                py,
+                message.steam_id,
+                message.channel,
+                &message.data,
+            );
+            delivered += 1;
+        }
+        delivered
+    }
+
+    /// Drains up to `max_messages` queued pump messages into a columnar batch
+    /// with the same layout as `receive_batch`.
+    #[pyo3(signature = (max_messages=usize::MAX))]
+    pub fn drain_pump_batch(&self, py: Python<'_>, max_messages: usize) -> PyResult<PyObject> {
+        let pump = self.pump();
+        let batch = py.allow_threads(|| {
+            let mut batch = MessageBatch::default();
+            if let Some(pump) = pump {
+                let queue = &pump.shared.queue;
+                let mut taken = 0;
+                while taken < max_messages {
+                    let Some(message) = queue.pop() else {
+                        break;
+                    };
+                    batch.push(message.steam_id, message.channel, &message.data);
+                    taken += 1;
+                }
+            }
+            batch
+        });
+        batch.into_py(py)
+    }
+
+    /// Returns queue depth and backpressure counters for the pump.
+    pub fn pump_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        let pump = self.pump();
+        let running = pump.as_ref().is_some_and(|pump| pump.is_running());
+        stats.set_item("running", running)?;
+        if let Some(pump) = pump {
+            let shared = &pump.shared;
+            stats.set_item("queued", shared.queue.len())?;
+            stats.set_item("capacity", shared.queue.capacity())?;
+            stats.set_item("high_water", shared.high_water.load(Ordering::Relaxed))?;
+            stats.set_item("received", shared.received.load(Ordering::Relaxed))?;
+            stats.set_item("dropped", shared.dropped.load(Ordering::Relaxed))?;
+            stats.set_item("ticks", shared.ticks.load(Ordering::Relaxed))?;
+        }
+        Ok(stats)
+    }
+
+    /// Creates the shared-memory bus `name` and starts a native thread that
+    /// moves messages between it and the network every `interval_ms`.
+    /// Each of `channels` gets an inbound and an outbound ring of
+    /// `slot_count` slots of `slot_size` bytes. Messages larger than a slot
+    /// take several consecutive slots. Other processes attach with
+    /// `SteamNetWorker(name)`. Received messages on these channels go to the
+    /// bus only, and sends from workers bypass coalescing. An existing bus
+    /// of the same name is only replaced with `replace`.
+    #[pyo3(signature = (name, channels, slot_count=4096, slot_size=1280, interval_ms=1.0, max_messages=256, replace=false))]
+    pub fn start_shared_bus(
+        &self,
+        name: &str,
+        channels: Vec<u32>,
+        slot_count: usize,
+        slot_size: usize,
+        interval_ms: f64,
+        max_messages: usize,
+        replace: bool,
+    ) -> PyResult<()> {
+        let mut bus = self.bus.lock().unwrap();
+        if bus.as_ref().is_some_and(|bus| bus.is_running()) {
+            return Err(PyRuntimeError::new_err("Shared bus already running"));
+        }
+        let Some(connection) = self.connection() else {
+            return Err(PyRuntimeError::new_err("Client not initialized"));
+        };
+        let shared = Bus::create(name, &channels, slot_count, slot_size, replace)?;
+        *bus = Some(Arc::new(BusHost::start(
+            shared,
+            connection.transport.clone(),
+            self.stats.clone(),
+            self.unpacking.clone(),
+            Duration::from_secs_f64(interval_ms.max(0.0) / 1000.0),
+            max_messages,
+        )));
+        Ok(())
+    }
+
+    /// Stops the bus thread and unlinks the bus. Attached workers see
+    /// `closed` become true.
+    pub fn stop_shared_bus(&self, py: Python<'_>) {
+        let bus = self.bus.lock().unwrap().take();
+        if let Some(bus) = bus {
+            py.allow_threads(|| {
+                bus.stop();
+                drop(bus);
+            });
+        }
+    }
+
+    /// Returns forwarding counters and per-channel ring occupancy of the bus.
+    pub fn shared_bus_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        let host = self.bus.lock().unwrap().clone();
+        stats.set_item(
+            "running",
+            host.as_ref().is_some_and(|host| host.is_running()),
+        )?;
+        if let Some(host) = host {
+            let shared = &host.shared;
+            stats.set_item("forwarded_in", shared.forwarded_in.load(Ordering::Relaxed))?;
+            stats.set_item(
+                "forwarded_out",
+                shared.forwarded_out.load(Ordering::Relaxed),
+            )?;
+            stats.set_item("ticks", shared.ticks.load(Ordering::Relaxed))?;
+            let channels = PyDict::new(py);
+            for (index, &channel) in host.bus.channels().iter().enumerate() {
+                let inbound = host.bus.inbound(index);
+                let row = PyDict::new(py);
+                row.set_item("inbound_slots", inbound.queued())?;
+                row.set_item("outbound_slots", host.bus.outbound(index).queued())?;
+                row.set_item("dropped", inbound.dropped().load(Ordering::Relaxed))?;
+                channels.set_item(channel, row)?;
+            }
+            stats.set_item("channels", channels)?;
+        }
+        Ok(stats)
+    }
+
+    /// Starts recording every received message, lobby change and session
+    /// failure to `path`, whichever API receives them, for later playback
+    /// with `init(backend="replay")`. Replaces a capture in progress.
+    pub fn start_capture(&self, py: Python<'_>, path: PathBuf) -> PyResult<()> {
+        let Some(connection) = self.connection() else {
+            return Err(PyRuntimeError::new_err("Client not initialized"));
+        };
+        py.allow_threads(|| connection.transport.start_capture(&path))?;
+        Ok(())
+    }
+
+    /// Stops recording and returns the number of records written, or `None`
+    /// if no capture was running.
+    pub fn stop_capture(&self, py: Python<'_>) -> PyResult<Option<u64>> {
+        match self.connection() {
+            Some(connection) => Ok(py.allow_threads(|| connection.transport.stop_capture())?),
+            None => Ok(None),
+        }
+    }
+
+    /// Returns how far the replay backend has read its capture.
+    pub fn replay_status<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let status = PyDict::new(py);
+        let progress = self
+            .connection()
+            .and_then(|connection| connection.transport.replay_progress());
+        status.set_item("replaying", progress.is_some())?;
+        if let Some((offset, size, records, finished)) = progress {
+            status.set_item("bytes_read", offset)?;
+            status.set_item("size", size)?;
+            status.set_item("records", records)?;
+            status.set_item("finished", finished)?;
+        }
+        Ok(status)
+    }
+
+    /// Enables large-payload transfers on `channel`, which should carry
+    /// nothing else. Payloads are sent in `chunk_size` pieces from
+    /// `run_callbacks` once the peer accepted them, at most `tick_bytes` per
+    /// call, and only while the peer has fewer than `window_bytes` of queued
+    /// or unacknowledged reliable data.
+    /// Transfers received into memory may use `max_memory` bytes in total.
+    #[pyo3(signature = (channel=250, chunk_size=16384, window_bytes=262144, tick_bytes=131072, max_memory=268435456))]
+    pub fn enable_transfers(
+        &self,
+        channel: u32,
+        chunk_size: usize,
+        window_bytes: usize,
+        tick_bytes: usize,
+        max_memory: usize,
+    ) {
+        *self.transfers.lock().unwrap() = Some(Transfers::new(
+            channel,
+            chunk_size,
+            window_bytes,
+            tick_bytes,
+            max_memory,
+        ));
+    }
+
+    /// Drops every transfer in progress without notifying peers.
+    pub fn disable_transfers(&self) {
+        *self.transfers.lock().unwrap() = None;
+    }
+
+    /// Sets `cb(event, steam_id, transfer_id, done, total, data)`, called
+    /// from `run_callbacks` for transfer offers, progress, completion and
+    /// cancellation.
+    pub fn set_transfer_callback(&self, py: Python<'_>, cb: Py<PyAny>) {
+        py.allow_threads(|| {
+            let mut guard = self.cb_transfer.lock().unwrap();
+            *guard = Some(cb);
+        });
+    }
+
+    /// Starts sending `data` to `steam_id` and returns the transfer ID.
+    #[pyo3(signature = (steam_id, data, name=String::new()))]
+    pub fn send_transfer(&self, steam_id: u64, data: &[u8], name: String) -> PyResult<u64> {
+        self.start_transfer(steam_id, name, Source::Memory(data.to_vec()))
+    }
+
+    /// Starts sending the file at `path` to `steam_id`, mapped instead of
+    /// read into memory, and returns the transfer ID. `name` defaults to
+    /// the file name.
+    #[pyo3(signature = (steam_id, path, name=None))]
+    pub fn send_file(&self, steam_id: u64, path: PathBuf, name: Option<String>) -> PyResult<u64> {
+        let name = name.unwrap_or_else(|| {
+            path.file_name()
+                .map(|name| name.to_string_lossy().into_owned())
+                .unwrap_or_default()
+        });
+        self.start_transfer(steam_id, name, Source::open(&path)?)
+    }
+
+    /// Cancels the transfer `transfer_id` with `steam_id` and tells the peer.
+    /// `incoming` selects a transfer this client is receiving. Returns
+    /// `False` if no such transfer is in progress.
+    #[pyo3(signature = (steam_id, transfer_id, incoming=false))]
+    pub fn cancel_transfer(
+        &self,
+        py: Python<'_>,
+        steam_id: u64,
+        transfer_id: u64,
+        incoming: bool,
+    ) -> bool {
+        let cancelled = self
+            .transfers
+            .lock()
+            .unwrap()
+            .as_mut()
+            .and_then(|transfers| {
+                transfers
+                    .cancel(steam_id, transfer_id, incoming)
+                    .map(|(message, event)| (transfers.channel, message, event))
+            });
+        let Some((channel, message, event)) = cancelled else {
+            return false;
+        };
+        if let Some(connection) = self.connection() {
+            self.send_now(
+                &connection.transport,
+                steam_id,
+                TRANSFER_SEND_FLAGS,
+                channel,
+                &message,
+            );
+        }
+        self.dispatch_transfer_events(py, vec![event]);
+        true
+    }
+
+    /// Enables state replication on `channel`, which should carry nothing
+    /// else. Every `run_callbacks()` sends each replication peer the fields
+    /// of the entries set with `set_state` that it has not acknowledged, as
+    /// unreliable messages of up to `max_packet` bytes. Values are compared
+    /// in fields of `field_size` bytes. Every `resync_ticks` calls a peer is
+    /// sent every entry in full.
+    #[pyo3(signature = (channel=251, field_size=4, resync_ticks=300, max_packet=1200))]
+    pub fn enable_replication(
+        &self,
+        channel: u32,
+        field_size: usize,
+        resync_ticks: u64,
+        max_packet: usize,
+    ) {
+        *self.replication.lock().unwrap() = Some(Replicator::new(
+            channel,
+            field_size,
+            resync_ticks,
+            max_packet,
+        ));
+    }
 
-            matchmaking.create_lobby(lobby_kind, max_members, move |result| {
-                Python::with_gil(|py| match result {
+    /// Drops every local and received entry.
+    pub fn disable_replication(&self) {
+        *self.replication.lock().unwrap() = None;
+    }
+
+    /// Sets the Steam IDs local entries are replicated to.
+    pub fn set_replication_peers(&self, steam_ids: Vec<u64>) -> PyResult<()> {
+        self.with_replicator(|replicator| replicator.set_peers(&steam_ids))
+    }
+
+    /// Sets the local value of `key`, sent to peers on the next tick.
+    pub fn set_state(&self, key: u64, value: &[u8]) -> PyResult<()> {
+        self.with_replicator(|replicator| replicator.set(key, value))
+    }
+
+    /// Removes the local entry `key` from every peer.
+    pub fn remove_state(&self, key: u64) -> PyResult<bool> {
+        self.with_replicator(|replicator| replicator.remove(key))
+    }
+
+    /// Returns the value of `key` replicated from `steam_id`, if any.
+    pub fn get_state<'py>(
+        &self,
+        py: Python<'py>,
+        steam_id: u64,
+        key: u64,
+    ) -> PyResult<Option<Bound<'py, PyBytes>>> {
+        self.with_replicator(|replicator| {
+            replicator
+                .get(steam_id, key)
+                .map(|value| PyBytes::new(py, value))
+        })
+    }
+
+    /// Returns every entry replicated from `steam_id` as `{key: bytes}`.
+    pub fn get_states<'py>(&self, py: Python<'py>, steam_id: u64) -> PyResult<Bound<'py, PyDict>> {
+        let states = PyDict::new(py);
+        self.with_replicator(|replicator| {
+            for (key, value) in replicator.entries(steam_id) {
+                states.set_item(key, PyBytes::new(py, value))?;
+            }
+            Ok::<_, PyErr>(())
+        })??;
+        Ok(states)
+    }
+
+    /// Returns the `(steam_id, key)` pairs whose replicated value changed or
+    /// was removed since the last call.
+    pub fn take_state_changes(&self) -> PyResult<Vec<(u64, u64)>> {
+        self.with_replicator(Replicator::take_changes)
+    }
+
+    /// Returns counters of entries sent in full, as deltas or as removals,
+    /// messages and bytes sent, messages received and stale entries ignored.
+    pub fn replication_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        self.with_replicator(|replicator| {
+            let counters = &replicator.stats;
+            stats.set_item("full_entries", counters.full_entries)?;
+            stats.set_item("delta_entries", counters.delta_entries)?;
+            stats.set_item("removed_entries", counters.removed_entries)?;
+            stats.set_item("packets_sent", counters.packets_sent)?;
+            stats.set_item("bytes_sent", counters.bytes_sent)?;
+            stats.set_item("packets_received", counters.packets_received)?;
+            stats.set_item("stale_entries", counters.stale_entries)
+        })??;
+        Ok(stats)
+    }
+
+    /// Manages sessions to lobby members. Every `run_callbacks()` opens a
+    /// session to each new member by sending it a small reliable message on
+    /// `channel` (when `prewarm` is set), closes sessions to peers that left
+    /// every lobby (when `close_departed` is set) and closes sessions that
+    /// carried no messages for `idle_timeout_s` seconds (`0` never closes
+    /// idle sessions). With `accept_members`, session requests from lobby
+    /// members are accepted and all others rejected. Peers should use the
+    /// same `channel`, which should carry nothing else.
+    #[pyo3(signature = (channel=252, prewarm=true, accept_members=true, close_departed=true, idle_timeout_s=0.0))]
+    pub fn enable_sessions(
+        &self,
+        channel: u32,
+        prewarm: bool,
+        accept_members: bool,
+        close_departed: bool,
+        idle_timeout_s: f64,
+    ) -> PyResult<()> {
+        let Some(connection) = self.connection() else {
+            return Err(PyRuntimeError::new_err("Client not initialized"));
+        };
+        let policy = SessionPolicy {
+            channel,
+            prewarm,
+            accept_members,
+            close_departed,
+            idle_timeout: (idle_timeout_s > 0.0).then(|| Duration::from_secs_f64(idle_timeout_s)),
+        };
+        *self.sessions.lock().unwrap() = Some(SessionManager::new(policy));
+        if accept_members && !connection.session_requests.swap(true, Ordering::AcqRel) {
+            let sessions_shared = self.sessions.clone();
+            let lobbies_shared = self.lobbies.clone();
+            connection.transport.on_session_request(move |steam_id| {
+                // Without a manager, or with acceptance turned off, every
+                // request is accepted.
+                sessions_shared
+                    .lock()
+                    .unwrap()
+                    .as_mut()
+                    .and_then(|manager| {
+                        manager.decide_request(|| {
+                            lobbies_shared.lock().unwrap().contains_member(steam_id)
+                        })
+                    })
+                    .unwrap_or(true)
+            });
+        }
+        Ok(())
+    }
+
+    /// Stops managing sessions. Open sessions are left as they are and
+    /// later session requests are accepted.
+    pub fn disable_sessions(&self) {
+        *self.sessions.lock().unwrap() = None;
+    }
+
+    /// Opens a session to `steam_id` on the next tick and keeps tracking it
+    /// whether or not it shares a lobby, until `close_session`.
+    pub fn open_session(&self, steam_id: u64) -> PyResult<()> {
+        self.with_sessions(|manager| manager.open(steam_id, Instant::now()))
+    }
+
+    /// Stops tracking `steam_id` and closes its session, dropping anything
+    /// still queued for it. Returns `False` if there was no session.
+    pub fn close_session(&self, py: Python<'_>, steam_id: u64) -> bool {
+        let tracked = self
+            .sessions
+            .lock()
+            .unwrap()
+            .as_mut()
+            .and_then(|manager| manager.close(steam_id));
+        let closed = match self.connection() {
+            Some(connection) => py.allow_threads(|| connection.transport.close_session(steam_id)),
+            None => false,
+        };
+        if let Some(old) = tracked.filter(|&old| old != 0) {
+            self.dispatch_session_transitions(py, vec![(steam_id, old, 0)]);
+        }
+        closed
+    }
+
+    /// Sets `callback_fn(steam_id, old_state, new_state)`, called from
+    /// `run_callbacks()` when a tracked session changes state. Once `tick()`
+    /// is used, transitions are reported there instead.
+    pub fn set_session_state_callback(&self, py: Python<'_>, cb: Py<PyAny>) {
+        py.allow_threads(|| {
+            let mut guard = self.cb_session_state.lock().unwrap();
+            *guard = Some(cb);
+        });
+    }
+
+    /// Returns `(steam_id, state, pinned, idle_seconds)` for every tracked
+    /// session, sorted by SteamID.
+    pub fn get_sessions(&self) -> PyResult<Vec<(u64, i32, bool, f64)>> {
+        self.with_sessions(|manager| manager.sessions(Instant::now()))
+    }
+
+    /// Returns counters of sessions warmed and warm-ups that could not be
+    /// sent, requests accepted and rejected, and sessions closed for
+    /// idleness or departure.
+    pub fn session_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        self.with_sessions(|manager| {
+            let counters = &manager.stats;
+            stats.set_item("warmed", counters.warmed)?;
+            stats.set_item("warm_failed", counters.warm_failed)?;
+            stats.set_item("accepted", counters.accepted)?;
+            stats.set_item("rejected", counters.rejected)?;
+            stats.set_item("closed_idle", counters.closed_idle)?;
+            stats.set_item("closed_departed", counters.closed_departed)
+        })??;
+        Ok(stats)
+    }
+
+    /// Creates a lobby and returns an asyncio future resolving to its ID.
+    pub fn create_lobby_async(
+        slf: &Bound<'_, Self>,
+        lobby_type: u32,
+        max_members: u32,
+    ) -> PyResult<PyObject> {
+        let (future, completion) = Self::begin_lobby_op(slf)?;
+        slf.get()
+            .create_lobby(lobby_type, max_members, Some(completion));
+        Ok(future)
+    }
+
+    /// Joins a lobby and returns an asyncio future resolving to its ID.
+    pub fn join_lobby_async(slf: &Bound<'_, Self>, lobby_id: u64) -> PyResult<PyObject> {
+        let (future, completion) = Self::begin_lobby_op(slf)?;
+        slf.get().join_lobby(lobby_id, Some(completion));
+        Ok(future)
+    }
+
+    /// Returns an async iterator over `(steam_id, channel, bytes)` messages
+    /// received on `channel`, driven by the running event loop.
+    pub fn messages(slf: &Bound<'_, Self>, channel: u32) -> PyResult<Py<MessageStream>> {
+        let py = slf.py();
+        let event_loop = running_loop(py)?;
+        let poll = slf.getattr("_aio_poll")?;
+        let this = slf.get();
+        let mut driver = this.aio.lock().unwrap();
+        driver.attach(py, &event_loop, &poll)?;
+        let stream = MessageStream::new(channel, event_loop.unbind(), this.aio.clone());
+        driver.add_stream(&stream);
+        Py::new(py, stream)
+    }
+
+    /// One step of the asyncio driver, scheduled on the event loop.
+    #[pyo3(name = "_aio_poll")]
+    fn aio_poll(&self, py: Python<'_>) -> PyResult<()> {
+        let pump = self.pump().filter(|pump| pump.is_running());
+        if pump.is_none() {
+            self.run_callbacks(py);
+        }
+
+        let mut driver = self.aio.lock().unwrap();
+        let mut activity = false;
+        let mut unstreamed = Vec::new();
+        match &pump {
+            Some(pump) => {
+                let channels = driver.channels();
+                while let Some(message) = pump.shared.queue.pop() {
+                    activity = true;
+                    if channels.binary_search(&message.channel).is_ok() {
+                        let item =
+                            (message.steam_id, message.channel, PyBytes::new(py, &message.data))
+                                .into_pyobject(py)?;
+                        driver.deliver(py, message.channel, item.as_any())?;
+                    } else {
+                        unstreamed.push(message);
+                    }
+                }
+            }
+            None => {
+                for channel in driver.channels() {
+                    let unpack = self.unpacking.contains(channel);
+                    for (steam_id, message) in
+                        self.receive_from_transport(py, channel, AIO_MAX_MESSAGES)
+                    {
+                        activity = true;
+                        let data = message.data();
+                        for (start, end) in Frames::new(data, unpack) {
+                            self.stats.record_receive(steam_id, channel, end - start);
+                            let item = (steam_id, channel, PyBytes::new(py, &data[start..end]))
+                                .into_pyobject(py)?;
+                            driver.deliver(py, channel, item.as_any())?;
+                        }
+                    }
+                }
+            }
+        }
+
+        driver.reschedule(py, activity)?;
+        if let Some(pump) = &pump {
+            if driver.has_streams() {
+                if !pump.shared.has_waker() {
+                    pump.shared.set_waker(driver.waker(py)?);
+                }
+                pump.shared.arm_waker();
+            } else {
+                pump.shared.set_waker(None);
+            }
+        }
+        drop(driver);
+
+        // Dispatched after releasing the driver so handlers may open streams.
+        let routes = self.router.snapshot();
+        for message in unstreamed {
+            self.router.dispatch(
+                &routes,
+                &self.stats,
+                py,
+                message.steam_id,
+                message.channel,
+                &message.data,
+            );
+        }
+        Ok(())
+    }
+
+    /// Creates a lobby. Without `cb_on_created`, the result is reported by
+    /// `tick` as a lobby-created record carrying the returned operation ID.
+    #[pyo3(signature = (lobby_type, max_members, cb_on_created=None))]
+    pub fn create_lobby(
+        &self,
+        lobby_type: u32,
+        max_members: u32,
+        cb_on_created: Option<Py<PyAny>>,
+    ) -> Option<u64> {
+        let connection = self.connection()?;
+        let transport = &connection.transport;
+        let seed_transport = transport.clone();
+        let lobbies_shared = self.lobbies.clone();
+        let stats_shared = self.stats.clone();
+        let events_shared = self.events.clone();
+        let op = self.events.lock().unwrap().next_op();
+        transport.create_lobby(lobby_type, max_members, move |result| {
+            if let Ok(lobby_id) = result {
+                seed_lobby(&seed_transport, &lobbies_shared, lobby_id);
+            }
+            let Some(cb_on_created) = cb_on_created else {
+                let event = match result {
                     Ok(lobby_id) => {
-                        let _ = cb_on_created.call1(py, (lobby_id.raw(),));
+                        Event::LobbyOp(EVENT_LOBBY_CREATED, op, lobby_id, LOBBY_OK, String::new())
                     }
                     Err(err) => {
-                        let _ = cb_on_created.call1(py, (py.None(), err.to_string()));
+                        Event::LobbyOp(EVENT_LOBBY_CREATED, op, 0, LOBBY_FAIL, err.to_string())
                     }
-                });
+                };
+                events_shared.lock().unwrap().push(event);
+                return;
+            };
+            Python::with_gil(|py| {
+                let started = Instant::now();
+                let called = match result {
+                    Ok(lobby_id) => cb_on_created.call1(py, (lobby_id,)),
+                    Err(err) => cb_on_created.call1(py, (py.None(), err.to_string())),
+                };
+                stats_shared.record_callback(started.elapsed(), called.is_err());
             });
-        }
+        });
+        Some(op)
     }
 
-    pub fn join_lobby(&mut self, lobby_id: u64, cb_on_joined: Py<PyAny>) {
-        if let Some((client, _)) = &self.client {
-            let matchmaking = client.matchmaking();
-            matchmaking.join_lobby(LobbyId::from_raw(lobby_id), move |result| {
-                Python::with_gil(|py| match result {
+    /// Joins a lobby. Without `cb_on_joined`, the result is reported by
+    /// `tick` as a lobby-joined record carrying the returned operation ID.
+    #[pyo3(signature = (lobby_id, cb_on_joined=None))]
+    pub fn join_lobby(&self, lobby_id: u64, cb_on_joined: Option<Py<PyAny>>) -> Option<u64> {
+        let connection = self.connection()?;
+        let transport = &connection.transport;
+        let seed_transport = transport.clone();
+        let lobbies_shared = self.lobbies.clone();
+        let stats_shared = self.stats.clone();
+        let events_shared = self.events.clone();
+        let op = self.events.lock().unwrap().next_op();
+        transport.join_lobby(lobby_id, move |result| {
+            if let Ok(lobby_id) = result {
+                seed_lobby(&seed_transport, &lobbies_shared, lobby_id);
+            }
+            let Some(cb_on_joined) = cb_on_joined else {
+                let event = match result {
                     Ok(lobby_id) => {
-                        let _ = cb_on_joined.call1(py, (lobby_id.raw(), py.None()));
-                    }
-                    Err(e) => {
-                        let _ = cb_on_joined.call1(
-                            py,
-                            (
-                                py.None(),
-                                PyRuntimeError::new_err(format!("No Lobby Found: {:?}", e)),
-                            ),
-                        );
+                        Event::LobbyOp(EVENT_LOBBY_JOINED, op, lobby_id, LOBBY_OK, String::new())
                     }
-                });
+                    Err(e) => Event::LobbyOp(
+                        EVENT_LOBBY_JOINED,
+                        op,
+                        0,
+                        LOBBY_FAIL,
+                        format!("No Lobby Found: {:?}", e),
+                    ),
+                };
+                events_shared.lock().unwrap().push(event);
+                return;
+            };
+            Python::with_gil(|py| {
+                let started = Instant::now();
+                let called = match result {
+                    Ok(lobby_id) => cb_on_joined.call1(py, (lobby_id, py.None())),
+                    Err(e) => cb_on_joined.call1(
+                        py,
+                        (
+                            py.None(),
+                            PyRuntimeError::new_err(format!("No Lobby Found: {:?}", e)),
+                        ),
+                    ),
+                };
+                stats_shared.record_callback(started.elapsed(), called.is_err());
             });
-        }
+        });
+        Some(op)
     }
 
-    pub fn leave_lobby(&mut self, lobby_id: u64) {
-        if let Some((client, _)) = &self.client {
-            let matchmaking = client.matchmaking();
-            matchmaking.leave_lobby(LobbyId::from_raw(lobby_id));
+    pub fn leave_lobby(&self, lobby_id: u64) {
+        if let Some(connection) = self.connection() {
+            let transport = &connection.transport;
+            transport.leave_lobby(lobby_id);
         }
+        self.lobbies.lock().unwrap().remove(lobby_id);
     }
 
+    /// Returns the members of `lobby_id` as a tuple. Lobbies this client
+    /// created or joined are served from the membership cache; any other
+    /// lobby is queried from Steam and may be empty.
     pub fn get_lobby_members(&self, py: Python<'_>, lobby_id: u64) -> PyResult<PyObject> {
-        if let Some(client) = &self.client {
-            let matchmaking = client.0.matchmaking();
-            let lobby = LobbyId::from_raw(lobby_id);
-            let members = matchmaking.lobby_members(lobby);
-
-            if members.is_empty() {
-                return Err(PyRuntimeError::new_err("Lobby not found or no members"));
+        if let Some(connection) = self.connection() {
+            let transport = &connection.transport;
+            if let Some(tuple) = self.lobbies.lock().unwrap().members_tuple(py, lobby_id)? {
+                return Ok(tuple.into_any());
             }
 
-            let member_ids: Vec<u64> = members.iter().map(|id| id.raw()).collect();
-
-            let py_list = PyList::new(py, member_ids.clone())?;
-            Ok(py_list.into_pyobject(py)?.into())
+            let member_ids = transport.lobby_members(lobby_id);
+            Ok(PyTuple::new(py, member_ids)?.into_any().unbind())
         } else {
             Err(PyRuntimeError::new_err("Client not initialized"))
         }
     }
 
-    pub fn set_lobby_changed_callback(&mut self, cb: Py<PyAny>) {
-        let mut guard = self.cb_lobby_changed.lock().unwrap();
-        *guard = Some(cb);
+    /// Returns a counter that changes whenever the cached membership of
+    /// `lobby_id` changes, or `None` if the lobby is not cached.
+    pub fn get_lobby_members_version(&self, lobby_id: u64) -> Option<u64> {
+        self.lobbies.lock().unwrap().version(lobby_id)
     }
 
-    pub fn set_connection_failed_callback(&mut self, cb: Py<PyAny>) {
-        let mut guard = self.cb_conn_failed.lock().unwrap();
-        *guard = Some(cb);
+    pub fn set_lobby_changed_callback(&self, py: Python<'_>, cb: Py<PyAny>) {
+        // The pump thread takes this lock with the GIL held to copy the
+        // callback out, so it must not be awaited with the GIL held.
+        py.allow_threads(|| {
+            let mut guard = self.cb_lobby_changed.lock().unwrap();
+            *guard = Some(cb);
+        });
     }
 
-    pub fn set_message_recv_callback(&mut self, cb: Py<PyAny>) {
-        let mut guard = self.cb_message_recv.lock().unwrap();
-        *guard = Some(cb);
+    pub fn set_connection_failed_callback(&self, py: Python<'_>, cb: Py<PyAny>) {
+        py.allow_threads(|| {
+            let mut guard = self.cb_conn_failed.lock().unwrap();
+            *guard = Some(cb);
+        });
+    }
+
+    /// Sets the default handler for messages that no channel or tag route
+    /// matches.
+    pub fn set_message_recv_callback(&self, py: Python<'_>, cb: Py<PyAny>) {
+        self.router.set_default(py, Some(cb));
+    }
+
+    /// Routes messages on `channel` to `handler`, or only those whose first
+    /// payload byte equals `tag` when given. Passing `None` as the handler
+    /// removes the route. Dispatch happens in Rust; messages matching no
+    /// route and no default handler are counted and dropped.
+    #[pyo3(signature = (channel, handler, tag=None))]
+    pub fn set_channel_handler(
+        &self,
+        py: Python<'_>,
+        channel: u32,
+        handler: Option<Py<PyAny>>,
+        tag: Option<u8>,
+    ) {
+        self.router.set_handler(py, channel, tag, handler);
+    }
+
+    /// Returns per-peer and per-channel traffic counters, send failures by
+    /// result code, drop and exception counts, and timing histograms. With
+    /// `reset`, counters are zeroed as they are read.
+    #[pyo3(signature = (reset=false))]
+    pub fn get_stats<'py>(&self, py: Python<'py>, reset: bool) -> PyResult<Bound<'py, PyDict>> {
+        let stats = self.stats.to_dict(py, reset)?;
+        stats.set_item("unrouted", self.router.unrouted())?;
+        Ok(stats)
+    }
+
+    /// Zeroes every counter and histogram returned by `get_stats`.
+    pub fn reset_stats(&self, py: Python<'_>) -> PyResult<()> {
+        self.stats.to_dict(py, true)?;
+        Ok(())
+    }
+
+    /// Returns the connection status of `steam_ids`, or of every peer traffic
+    /// was exchanged with that still has a session, as a dict of
+    /// `array.array` columns in one call.
+    #[pyo3(signature = (steam_ids=None))]
+    pub fn get_session_info<'py>(
+        &self,
+        py: Python<'py>,
+        steam_ids: Option<Vec<u64>>,
+    ) -> PyResult<Bound<'py, PyDict>> {
+        let mut batch = SessionInfoBatch::default();
+        if let Some(connection) = self.connection() {
+            let transport = &connection.transport;
+            let explicit = steam_ids.is_some();
+            let mut peers = steam_ids.unwrap_or_else(|| self.stats.peers());
+            if !explicit {
+                peers.sort_unstable();
+            }
+            for steam_id in peers {
+                let (state, status) = transport.session_status(steam_id);
+                if explicit || state != 0 {
+                    batch.push(steam_id, state, status.as_ref());
+                }
+            }
+        }
+        batch.into_py(py)
+    }
+
+    /// Returns how many received messages matched no handler.
+    pub fn get_unrouted_count(&self) -> u64 {
+        self.router.unrouted()
     }
 
     pub fn send_message_to(
         &self,
+        py: Python<'_>,
         steam_id: u64,
         message_type: i32,
         channel: u32,
         message: &[u8],
     ) {
-        if let Some(networking) = &self.messages {
-            let flags = SendFlags::from_bits(message_type).unwrap_or(SendFlags::RELIABLE);
-            let _ = networking.send_message_to_user(
-                NetworkingIdentity::new_steam_id(SteamId::from_raw(steam_id)),
-                flags,
-                message,
-                channel,
-            );
+        py.allow_threads(|| self.send_to_each(&[steam_id], message_type, channel, message));
+    }
+
+    /// Buffers sends that fit in `max_bytes` per peer, channel and send
+    /// flags and packs them into one Steam message, sent on `flush()`, when a
+    /// pack reaches `max_bytes`, or on every `run_callbacks()` if
+    /// `flush_on_tick` is set. Larger messages are sent directly, after the
+    /// pending pack for the same peer, channel and flags. Packs are not
+    /// unpacked automatically: receivers must pass the same channels to
+    /// `set_unpack_channels`.
+    #[pyo3(signature = (max_bytes=1200, flush_on_tick=true))]
+    pub fn enable_coalescing(&self, max_bytes: usize, flush_on_tick: bool) {
+        let mut coalescer = self.coalescer.lock().unwrap();
+        match &mut *coalescer {
+            Some(existing) => {
+                existing.flush_on_tick = flush_on_tick;
+                existing.max_bytes = max_bytes;
+            }
+            None => *coalescer = Some(Coalescer::new(max_bytes, flush_on_tick)),
+        }
+    }
+
+    /// Queues every outgoing message until the next `run_callbacks()` or
+    /// `flush_scheduled()`, which sends them per peer in descending channel
+    /// priority. With `bytes_per_sec` set, each peer may send that many bytes
+    /// per second in bursts of up to `burst_bytes`, and the rest waits for
+    /// later ticks. At most `max_queued` messages wait per peer.
+    #[pyo3(signature = (bytes_per_sec=0, burst_bytes=16384, max_queued=4096))]
+    pub fn enable_scheduler(&self, bytes_per_sec: u64, burst_bytes: u64, max_queued: usize) {
+        let mut scheduler = self.scheduler.lock().unwrap();
+        match &mut *scheduler {
+            Some(existing) => {
+                existing.bytes_per_sec = bytes_per_sec;
+                existing.burst_bytes = burst_bytes.max(1);
+                existing.max_queued = max_queued;
+            }
+            None => *scheduler = Some(Scheduler::new(bytes_per_sec, burst_bytes, max_queued)),
+        }
+    }
+
+    /// Sends every queued message and sends subsequent messages directly.
+    pub fn disable_scheduler(&self, py: Python<'_>) {
+        let scheduled = self
+            .scheduler
+            .lock()
+            .unwrap()
+            .take()
+            .map(|mut scheduler| scheduler.take_all());
+        if let Some(scheduled) = scheduled {
+            py.allow_threads(|| self.send_scheduled(scheduled));
+        }
+    }
+
+    /// Sets the priority of `channel`; higher priorities are sent first.
+    /// Channels default to `0`.
+    pub fn set_channel_priority(&self, channel: u32, priority: i32) -> PyResult<()> {
+        match &mut *self.scheduler.lock().unwrap() {
+            Some(scheduler) => {
+                scheduler.set_priority(channel, priority);
+                Ok(())
+            }
+            None => Err(PyRuntimeError::new_err("Scheduler not enabled")),
+        }
+    }
+
+    /// Sends like `send_message_to`, but while the scheduler is enabled an
+    /// unreliable message replaces the queued one with the same peer,
+    /// channel and `key`. Returns the result code.
+    pub fn send_keyed(
+        &self,
+        py: Python<'_>,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        key: u64,
+        message: &[u8],
+    ) -> i32 {
+        py.allow_threads(|| {
+            if let Some(scheduler) = &mut *self.scheduler.lock().unwrap() {
+                return scheduler.push(steam_id, message_type, channel, Some(key), message);
+            }
+            self.send_to_each(&[steam_id], message_type, channel, message)[0]
+        })
+    }
+
+    /// Sends what the scheduler allows this tick and returns how many
+    /// messages were released.
+    pub fn flush_scheduled(&self, py: Python<'_>) -> usize {
+        py.allow_threads(|| {
+            let scheduled = match &mut *self.scheduler.lock().unwrap() {
+                Some(scheduler) => scheduler.take_ready(Instant::now()),
+                None => return 0,
+            };
+            let count = scheduled.len();
+            self.send_scheduled(scheduled);
+            count
+        })
+    }
+
+    /// Returns scheduler counters and the queued messages and bytes per
+    /// channel.
+    pub fn scheduler_stats<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+        let scheduler = self.scheduler.lock().unwrap();
+        stats.set_item("enabled", scheduler.is_some())?;
+        if let Some(scheduler) = &*scheduler {
+            let counters = &scheduler.stats;
+            stats.set_item("sent", counters.sent)?;
+            stats.set_item("replaced", counters.replaced)?;
+            stats.set_item("dropped", counters.dropped)?;
+            stats.set_item("deferred", counters.deferred)?;
+            let channels = PyDict::new(py);
+            for (channel, (messages, bytes)) in scheduler.queued() {
+                let row = PyDict::new(py);
+                row.set_item("messages", messages)?;
+                row.set_item("bytes", bytes)?;
+                channels.set_item(channel, row)?;
+            }
+            stats.set_item("queued", channels)?;
+        }
+        Ok(stats)
+    }
+
+    /// Unpacks coalesced messages received on `channels`, which must match
+    /// the channels peers send on with coalescing enabled. Messages on any
+    /// other channel are delivered as they arrived. Replaces the previous
+    /// set; an empty list turns unpacking off.
+    pub fn set_unpack_channels(&self, channels: Vec<u32>) {
+        self.unpacking.set(channels);
+    }
+
+    pub fn unpack_channels(&self) -> Vec<u32> {
+        self.unpacking.channels()
+    }
+
+    /// Flushes pending packs and sends subsequent messages directly.
+    pub fn disable_coalescing(&self, py: Python<'_>) {
+        self.flush(py);
+        *self.coalescer.lock().unwrap() = None;
+    }
+
+    /// Sends every pending pack and returns how many Steam messages were sent.
+    pub fn flush(&self, py: Python<'_>) -> usize {
+        py.allow_threads(|| self.flush_packs())
+    }
+
+    /// Sends `message` to every member of `lobby_id` in one call. Returns
+    /// `(steam_ids, result_codes)` as `array('Q')` / `array('i')`.
+    #[pyo3(signature = (lobby_id, message_type, channel, message, exclude_self=true))]
+    pub fn send_to_lobby(
+        &self,
+        py: Python<'_>,
+        lobby_id: u64,
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+        exclude_self: bool,
+    ) -> PyResult<PyObject> {
+        let mut recipients = Vec::new();
+        if let Some(connection) = self.connection() {
+            let transport = &connection.transport;
+            let own_id = transport.own_steam_id();
+            let cached = self.lobbies.lock().unwrap().members(lobby_id).map(<[u64]>::to_vec);
+            recipients = cached.unwrap_or_else(|| transport.lobby_members(lobby_id));
+            if exclude_self {
+                recipients.retain(|&id| id != own_id);
+            }
         }
+        let codes =
+            py.allow_threads(|| self.send_to_each(&recipients, message_type, channel, message));
+        let tuple = PyTuple::new(
+            py,
+            [to_array(py, "Q", &recipients)?, to_array(py, "i", &codes)?],
+        )?;
+        Ok(tuple.into_any().unbind())
+    }
+
+    /// Sends `message` to each of `steam_ids` in one call and returns an
+    /// `array('i')` of per-recipient result codes in the same order.
+    pub fn send_to_many<'py>(
+        &self,
+        py: Python<'py>,
+        steam_ids: Vec<u64>,
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> PyResult<Bound<'py, PyAny>> {
+        let codes =
+            py.allow_threads(|| self.send_to_each(&steam_ids, message_type, channel, message));
+        to_array(py, "i", &codes)
     }
 
     pub fn own_steam_id(&self) -> u64 {
-        if let Some((client, _)) = &self.client {
-            client.user().steam_id().raw()
+        if let Some(connection) = self.connection() {
+            let transport = &connection.transport;
+            transport.own_steam_id()
         } else {
             0
         }
     }
 }
+
+/// Copies a callback out of its slot so it is called without holding the
+/// lock, letting it call back into the client or replace itself.
+fn clone_callback(py: Python<'_>, slot: &Mutex<Option<Py<PyAny>>>) -> Option<Py<PyAny>> {
+    slot.lock().unwrap().as_ref().map(|cb| cb.clone_ref(py))
+}
+
+fn seed_lobby(transport: &Transport, lobbies: &Mutex<LobbyCache>, lobby_id: u64) {
+    let members = transport.lobby_members(lobby_id);
+    lobbies.lock().unwrap().seed(lobby_id, members);
+}
+
+fn parse_backend(
+    backend: &str,
+    latency_ms: f64,
+    loss: f64,
+    bandwidth: u64,
+    replay_path: Option<PathBuf>,
+    replay_speed: f64,
+) -> PyResult<Backend> {
+    match backend {
+        "steam" => Ok(Backend::Steam),
+        "loopback" => Ok(Backend::Loopback(link_conditions(
+            latency_ms, loss, bandwidth,
+        ))),
+        "replay" => match replay_path {
+            Some(path) => Ok(Backend::Replay(path, replay_speed)),
+            None => Err(PyValueError::new_err(
+                "The replay backend requires replay_path",
+            )),
+        },
+        other => Err(PyValueError::new_err(format!(
+            "Unknown backend {other:?}, expected \"steam\", \"loopback\" or \"replay\""
+        ))),
+    }
+}
+
+fn link_conditions(latency_ms: f64, loss: f64, bandwidth: u64) -> LinkConditions {
+    LinkConditions {
+        latency: Duration::from_secs_f64(latency_ms.max(0.0) / 1000.0),
+        loss: loss.clamp(0.0, 1.0),
+        bandwidth,
+    }
+}
+
+impl PySteamClient {
+    /// Initializes the transport and wires its callbacks into this client,
+    /// recording progress in `startup`.
+    fn connect(&self, app_id: u32, backend: Backend) -> Result<(), String> {
+        let result = Transport::init(app_id, backend).map(|(transport, runner)| {
+            self.startup.steam_initialized();
+            let cb_lobby_changed_shared = self.cb_lobby_changed.clone();
+            let lobbies_shared = self.lobbies.clone();
+            let own_id = transport.own_steam_id();
+            let stats_shared = self.stats.clone();
+            let events_shared = self.events.clone();
+            transport.on_lobby_update(move |update| {
+                {
+                    let entered = update.state == MEMBER_ENTERED;
+                    let mut lobbies = lobbies_shared.lock().unwrap();
+                    if !entered && update.user_changed == own_id {
+                        lobbies.remove(update.lobby);
+                    } else {
+                        lobbies.apply(update.lobby, update.user_changed, entered);
+                    }
+                }
+                {
+                    let mut events = events_shared.lock().unwrap();
+                    if events.enabled {
+                        events.push(Event::LobbyChanged(update));
+                        return;
+                    }
+                }
+                Python::with_gil(|py| {
+                    if let Some(cb) = clone_callback(py, &cb_lobby_changed_shared) {
+                        let started = Instant::now();
+                        let result = cb.call1(
+                            py,
+                            (
+                                update.lobby,
+                                update.user_changed,
+                                update.making_change,
+                                update.state,
+                            ),
+                        );
+                        stats_shared.record_callback(started.elapsed(), result.is_err());
+                    }
+                });
+            });
+
+            let cb_connection_failed_shared = self.cb_conn_failed.clone();
+            let stats_shared = self.stats.clone();
+            let events_shared = self.events.clone();
+            transport.on_session_failed(move |steam_id| {
+                {
+                    let mut events = events_shared.lock().unwrap();
+                    if events.enabled {
+                        events.push(Event::SessionFailed(steam_id));
+                        return;
+                    }
+                }
+                Python::with_gil(|py| {
+                    if let Some(cb) = clone_callback(py, &cb_connection_failed_shared) {
+                        let started = Instant::now();
+                        let result = cb.call1(py, (steam_id,));
+                        stats_shared.record_callback(started.elapsed(), result.is_err());
+                    }
+                });
+            });
+
+            let connection = Arc::new(Connection {
+                transport,
+                runner: Arc::new(Mutex::new(runner)),
+                session_requests: AtomicBool::new(false),
+            });
+            *self.client.write().unwrap() = Some(connection.clone());
+            connection
+        });
+        match result {
+            Ok(connection) => {
+                self.startup.finish(Ok(()));
+                self.watch_relay(&connection);
+                Ok(())
+            }
+            Err(e) => {
+                self.startup.finish(Err(e.clone()));
+                Err(e)
+            }
+        }
+    }
+
+    /// Runs `connect` on a native thread, completing `future` on
+    /// `event_loop` when given.
+    fn connect_in_background(
+        slf: &Bound<'_, Self>,
+        app_id: u32,
+        backend: Backend,
+        future: Option<(Py<PyAny>, Py<PyAny>)>,
+    ) -> PyResult<()> {
+        let client = slf.clone().unbind();
+        let spawned = thread::Builder::new()
+            .name("py_steam_net-init".into())
+            .spawn(move || {
+                let result = client.get().connect(app_id, backend);
+                if let Some((event_loop, future)) = future {
+                    Python::with_gil(|py| {
+                        let error = result
+                            .err()
+                            .map(|e| PyRuntimeError::new_err(e).into_value(py).into_any());
+                        // The loop may have been closed in the meantime.
+                        let _ = resolve_threadsafe(py, &event_loop, &future, None, error);
+                    });
+                }
+            });
+        if let Err(e) = spawned {
+            slf.get().startup.finish(Err(e.to_string()));
+            return Err(e.into());
+        }
+        Ok(())
+    }
+
+    /// Starts relay network access and watches it on a native thread until
+    /// it is usable, so the first lobby operation or message does not pay
+    /// for relay setup. Stops early when the client is deinitialized.
+    fn watch_relay(&self, connection: &Arc<Connection>) {
+        let connection = Arc::downgrade(connection);
+        let startup = self.startup.clone();
+        let _ = thread::Builder::new()
+            .name("py_steam_net-relay".into())
+            .spawn(move || {
+                let deadline = Instant::now() + RELAY_WATCH_TIMEOUT;
+                let mut warmed = false;
+                while Instant::now() < deadline {
+                    let Some(connection) = connection.upgrade() else {
+                        return;
+                    };
+                    if !warmed {
+                        connection.transport.warm_relay();
+                        warmed = true;
+                    }
+                    if startup.relay_update(connection.transport.relay_status()) {
+                        return;
+                    }
+                    drop(connection);
+                    thread::sleep(RELAY_WATCH_INTERVAL);
+                }
+            });
+    }
+
+    /// Binds the asyncio driver to the running loop and returns a future
+    /// together with the lobby callback that completes it.
+    fn begin_lobby_op(slf: &Bound<'_, Self>) -> PyResult<(PyObject, Py<PyAny>)> {
+        let py = slf.py();
+        let this = slf.get();
+        if !this.is_ready() {
+            return Err(PyRuntimeError::new_err("Client not initialized"));
+        }
+        let event_loop = running_loop(py)?;
+        let future = event_loop.call_method0("create_future")?;
+        let poll = slf.getattr("_aio_poll")?;
+        let mut driver = this.aio.lock().unwrap();
+        driver.attach(py, &event_loop, &poll)?;
+        let completion = LobbyCompletion::new(
+            event_loop.unbind(),
+            future.clone().unbind(),
+            driver.begin_op(),
+        );
+        Ok((future.unbind(), Py::new(py, completion)?.into_any()))
+    }
+
+    fn send_to_each(
+        &self,
+        steam_ids: &[u64],
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> Vec<i32> {
+        let Some(connection) = self.connection() else {
+            return vec![SEND_NOT_ATTEMPTED; steam_ids.len()];
+        };
+        if let Some(scheduler) = &mut *self.scheduler.lock().unwrap() {
+            return steam_ids
+                .iter()
+                .map(|&steam_id| scheduler.push(steam_id, message_type, channel, None, message))
+                .collect();
+        }
+        self.send_unscheduled(
+            &connection.transport,
+            steam_ids,
+            message_type,
+            channel,
+            message,
+        )
+    }
+
+    /// Sends through the coalescer, if enabled, or directly. A buffered
+    /// message reports `SEND_PENDING` unless a pack sent to make room for it
+    /// failed, in which case that failure is reported.
+    fn send_unscheduled(
+        &self,
+        transport: &Transport,
+        steam_ids: &[u64],
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> Vec<i32> {
+        let mut coalescer = self.coalescer.lock().unwrap();
+        steam_ids
+            .iter()
+            .map(|&steam_id| match &mut *coalescer {
+                Some(coalescer) => {
+                    let key = (steam_id, channel, message_type);
+                    let (packs, direct) = match coalescer.push(key, message) {
+                        Push::Buffered(ready) => (ready, false),
+                        Push::Direct(pending) => (pending.into_iter().collect(), true),
+                    };
+                    let mut code = SEND_PENDING;
+                    for pack in &packs {
+                        let sent = self.send_now(transport, steam_id, message_type, channel, pack);
+                        if sent != SEND_OK && code == SEND_PENDING {
+                            code = sent;
+                        }
+                    }
+                    if direct {
+                        let sent =
+                            self.send_now(transport, steam_id, message_type, channel, message);
+                        if code == SEND_PENDING {
+                            code = sent;
+                        }
+                    }
+                    code
+                }
+                None => self.send_now(transport, steam_id, message_type, channel, message),
+            })
+            .collect()
+    }
+
+    /// Sends messages released by the scheduler. Called without the GIL.
+    fn send_scheduled(&self, scheduled: Vec<Scheduled>) {
+        let Some(connection) = self.connection() else {
+            return;
+        };
+        for message in scheduled {
+            self.send_unscheduled(
+                &connection.transport,
+                &[message.steam_id],
+                message.message_type,
+                message.channel,
+                &message.data,
+            );
+        }
+    }
+
+    fn send_now(
+        &self,
+        transport: &Transport,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> i32 {
+        let result = transport.send(steam_id, message_type, channel, message);
+        let code = send_result_code(&result);
+        self.stats
+            .record_send(steam_id, channel, message.len(), result.is_ok(), code);
+        code
+    }
+
+    /// Sends every pending pack and returns how many were sent. Called
+    /// without the GIL.
+    fn flush_packs(&self) -> usize {
+        let packs = match &mut *self.coalescer.lock().unwrap() {
+            Some(coalescer) => coalescer.drain(),
+            None => return 0,
+        };
+        let Some(connection) = self.connection() else {
+            return 0;
+        };
+        let mut sent = 0;
+        for ((steam_id, channel, message_type), pack) in &packs {
+            let code = self.send_now(
+                &connection.transport,
+                *steam_id,
+                *message_type,
+                *channel,
+                pack,
+            );
+            if code == SEND_OK {
+                sent += 1;
+            }
+        }
+        sent
+    }
+
+    fn start_transfer(&self, steam_id: u64, name: String, source: Source) -> PyResult<u64> {
+        match &mut *self.transfers.lock().unwrap() {
+            Some(transfers) => Ok(transfers.start(steam_id, name, source)),
+            None => Err(PyRuntimeError::new_err("Transfers not enabled")),
+        }
+    }
+
+    /// Paces outgoing transfers, then handles what arrived on the transfer
+    /// channel. Offers are decided by the transfer callback between runs of
+    /// messages handled without the GIL.
+    fn poll_transfers(&self, py: Python<'_>, transport: &Transport) {
+        let Some(channel) = self.transfers.lock().unwrap().as_ref().map(|t| t.channel) else {
+            return;
+        };
+        let (events, received) = py.allow_threads(|| {
+            let mut transfers = self.transfers.lock().unwrap();
+            let Some(transfers) = transfers.as_mut() else {
+                return (Vec::new(), Vec::new());
+            };
+            let events = transfers.pump(
+                |steam_id| match transport.session_status(steam_id) {
+                    (_, Some(status)) => {
+                        (status.pending_reliable.max(0) + status.sent_unacked_reliable.max(0))
+                            as usize
+                    }
+                    (_, None) => 0,
+                },
+                |steam_id, data| {
+                    self.send_now(transport, steam_id, TRANSFER_SEND_FLAGS, channel, data)
+                },
+            );
+            let received = transport.receive(channel, TRANSFER_MAX_MESSAGES, &self.stats);
+            (events, received)
+        });
+        self.dispatch_transfer_events(py, events);
+
+        let mut received = received.into_iter();
+        loop {
+            let (events, offer) = py.allow_threads(|| {
+                let mut events = Vec::new();
+                let mut transfers = self.transfers.lock().unwrap();
+                let Some(transfers) = transfers.as_mut() else {
+                    return (events, None);
+                };
+                for (steam_id, message) in received.by_ref() {
+                    let data = message.data();
+                    self.stats.record_receive(steam_id, channel, data.len());
+                    let (reply, event) = transfers.handle(steam_id, data);
+                    if let Some(reply) = reply {
+                        self.send_now(transport, steam_id, TRANSFER_SEND_FLAGS, channel, &reply);
+                    }
+                    match event {
+                        Some(offer @ TransferEvent::Offer { .. }) => return (events, Some(offer)),
+                        Some(event) => events.push(event),
+                        None => {}
+                    }
+                }
+                (events, None)
+            });
+            self.dispatch_transfer_events(py, events);
+            let Some(TransferEvent::Offer {
+                steam_id,
+                id,
+                total,
+                name,
+            }) = offer
+            else {
+                break;
+            };
+
+            let accept = self.decide_offer(py, steam_id, id, total, name);
+            // A destination file that cannot be created rejects the offer.
+            let (reply, event) = match &mut *self.transfers.lock().unwrap() {
+                Some(transfers) => transfers
+                    .accept(steam_id, id, total, accept)
+                    .or_else(|_| transfers.accept(steam_id, id, total, Accept::Reject))
+                    .unwrap_or((None, None)),
+                None => break,
+            };
+            if let Some(reply) = reply {
+                self.send_now(transport, steam_id, TRANSFER_SEND_FLAGS, channel, &reply);
+            }
+            self.dispatch_transfer_events(py, event.into_iter().collect());
+        }
+    }
+
+    /// Applies received state and acknowledgements, then sends this tick's
+    /// acknowledgements and deltas. Runs entirely without the GIL.
+    fn poll_replication(&self, py: Python<'_>, transport: &Transport) {
+        py.allow_threads(|| {
+            let mut replication = self.replication.lock().unwrap();
+            let Some(replicator) = replication.as_mut() else {
+                return;
+            };
+            let channel = replicator.channel;
+            for (steam_id, message) in
+                transport.receive(channel, REPLICATION_MAX_MESSAGES, &self.stats)
+            {
+                let data = message.data();
+                self.stats.record_receive(steam_id, channel, data.len());
+                replicator.handle(steam_id, data);
+            }
+            replicator.tick(|steam_id, packet| {
+                self.send_now(transport, steam_id, REPLICATION_SEND_FLAGS, channel, packet);
+            });
+        });
+    }
+
+    fn poll_sessions(&self, py: Python<'_>, transport: &Transport) {
+        let transitions = py.allow_threads(|| {
+            let mut sessions = self.sessions.lock().unwrap();
+            let manager = sessions.as_mut()?;
+            let channel = manager.policy.channel;
+            // Warm-up messages only open sessions.
+            while transport
+                .receive(channel, SESSION_MAX_MESSAGES, &self.stats)
+                .len()
+                == SESSION_MAX_MESSAGES
+            {}
+            let generation = self.lobbies.lock().unwrap().generation();
+            let SessionActions {
+                warm,
+                close,
+                transitions,
+            } = manager.tick(
+                Instant::now(),
+                transport.own_steam_id(),
+                generation,
+                || self.lobbies.lock().unwrap().all_members(),
+                |steam_id| self.stats.peer_messages(steam_id),
+                |steam_id| transport.session_status(steam_id).0,
+            );
+            drop(sessions);
+            let failed: Vec<u64> = warm
+                .into_iter()
+                .filter(|&steam_id| {
+                    let code = self.send_now(
+                        transport,
+                        steam_id,
+                        SESSION_SEND_FLAGS,
+                        channel,
+                        SESSION_HELLO,
+                    );
+                    code != SEND_OK
+                })
+                .collect();
+            if !failed.is_empty() {
+                if let Some(manager) = &mut *self.sessions.lock().unwrap() {
+                    for steam_id in failed {
+                        manager.warm_failed(steam_id);
+                    }
+                }
+            }
+            for steam_id in close {
+                transport.close_session(steam_id);
+            }
+            Some(transitions)
+        });
+        if let Some(transitions) = transitions {
+            self.dispatch_session_transitions(py, transitions);
+        }
+    }
+
+    fn dispatch_session_transitions(&self, py: Python<'_>, transitions: Vec<(u64, i32, i32)>) {
+        if transitions.is_empty() {
+            return;
+        }
+        {
+            let mut events = self.events.lock().unwrap();
+            if events.enabled {
+                for (steam_id, old, new) in transitions {
+                    events.push(Event::SessionState(steam_id, old, new));
+                }
+                return;
+            }
+        }
+        let Some(cb) = clone_callback(py, &self.cb_session_state) else {
+            return;
+        };
+        for transition in transitions {
+            let started = Instant::now();
+            let result = cb.call1(py, transition);
+            self.stats
+                .record_callback(started.elapsed(), result.is_err());
+        }
+    }
+
+    fn with_sessions<T>(&self, f: impl FnOnce(&mut SessionManager) -> T) -> PyResult<T> {
+        match &mut *self.sessions.lock().unwrap() {
+            Some(manager) => Ok(f(manager)),
+            None => Err(PyRuntimeError::new_err("Session management not enabled")),
+        }
+    }
+
+    fn with_replicator<T>(&self, f: impl FnOnce(&mut Replicator) -> T) -> PyResult<T> {
+        match &mut *self.replication.lock().unwrap() {
+            Some(replicator) => Ok(f(replicator)),
+            None => Err(PyRuntimeError::new_err("Replication not enabled")),
+        }
+    }
+
+    /// Asks the transfer callback where to store an offered transfer: `None`
+    /// keeps it in memory, a path writes it to that file and `False` rejects
+    /// it. Without a callback, transfers are kept in memory.
+    fn decide_offer(
+        &self,
+        py: Python<'_>,
+        steam_id: u64,
+        id: u64,
+        total: u64,
+        name: String,
+    ) -> Accept {
+        let Some(cb) = clone_callback(py, &self.cb_transfer) else {
+            return Accept::Memory;
+        };
+        let started = Instant::now();
+        let result = cb.call1(py, ("offer", steam_id, id, 0u64, total, name));
+        self.stats
+            .record_callback(started.elapsed(), result.is_err());
+        match result {
+            Ok(decision) if decision.is_none(py) => Accept::Memory,
+            Ok(decision) => match decision.extract::<PathBuf>(py) {
+                Ok(path) => Accept::File(path.to_string_lossy().into_owned()),
+                Err(_) => Accept::Reject,
+            },
+            Err(_) => Accept::Reject,
+        }
+    }
+
+    fn dispatch_transfer_events(&self, py: Python<'_>, events: Vec<TransferEvent>) {
+        if events.is_empty() {
+            return;
+        }
+        let Some(cb) = clone_callback(py, &self.cb_transfer) else {
+            return;
+        };
+        for event in events {
+            let args = match event {
+                TransferEvent::Offer { .. } => continue,
+                TransferEvent::SendProgress {
+                    steam_id,
+                    id,
+                    done,
+                    total,
+                } => ("send_progress", steam_id, id, done, total, py.None()),
+                TransferEvent::RecvProgress {
+                    steam_id,
+                    id,
+                    done,
+                    total,
+                } => ("recv_progress", steam_id, id, done, total, py.None()),
+                TransferEvent::Sent {
+                    steam_id,
+                    id,
+                    total,
+                } => ("sent", steam_id, id, total, total, py.None()),
+                TransferEvent::Received {
+                    steam_id,
+                    id,
+                    total,
+                    payload,
+                } => {
+                    let data = match payload {
+                        Payload::Memory(data) => PyBytes::new(py, &data).into_any().unbind(),
+                        Payload::File(path) => PyString::new(py, &path).into_any().unbind(),
+                    };
+                    ("received", steam_id, id, total, total, data)
+                }
+                TransferEvent::Cancelled {
+                    steam_id,
+                    id,
+                    done,
+                    total,
+                } => ("cancelled", steam_id, id, done, total, py.None()),
+            };
+            let started = Instant::now();
+            let result = cb.call1(py, args);
+            self.stats
+                .record_callback(started.elapsed(), result.is_err());
+        }
+    }
+
+    fn connection(&self) -> Option<Arc<Connection>> {
+        self.client.read().unwrap().clone()
+    }
+
+    fn pump(&self) -> Option<Arc<Pump>> {
+        self.pump.lock().unwrap().clone()
+    }
+
+    /// Receives from the transport with the GIL released.
+    fn receive_from_transport(
+        &self,
+        py: Python<'_>,
+        channel: u32,
+        max_messages: usize,
+    ) -> Vec<(u64, Received)> {
+        match self.connection() {
+            Some(connection) => py.allow_threads(|| {
+                connection
+                    .transport
+                    .receive(channel, max_messages, &self.stats)
+            }),
+            None => Vec::new(),
+        }
+    }
+}
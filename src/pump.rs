@@ -0,0 +1,216 @@
+use std::{
+    cell::Cell,
+    sync::{
+        atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering},
+        Arc, Mutex,
+    },
+    thread::{self, JoinHandle},
+    time::{Duration, Instant},
+};
+
+use crossbeam_queue::ArrayQueue;
+use pyo3::prelude::*;
+use steamworks::SingleClient;
+
+use crate::{
+    capture::ReplayPeer,
+    coalesce::{Frames, Unpacking},
+    loopback::LoopbackPeer,
+    stats::NetStats,
+    transport::Transport,
+};
+
+/// Owns the `SingleClient`, or the loopback client, so callbacks can be run
+/// from either the Python thread or the pump thread. `SingleClient` is
+/// `!Send` only to prevent concurrent `run_callbacks` calls, which the
+/// surrounding mutex rules out.
+pub enum CallbackRunner {
+    Steam(SingleClient),
+    Loopback(Arc<LoopbackPeer>),
+    Replay(Arc<ReplayPeer>),
+}
+
+unsafe impl Send for CallbackRunner {}
+
+thread_local! {
+    /// Set while this thread is inside `CallbackRunner::run`.
+    static RUNNING: Cell<bool> = const { Cell::new(false) };
+}
+
+impl CallbackRunner {
+    pub fn run(&self) {
+        RUNNING.with(|running| running.set(true));
+        match self {
+            CallbackRunner::Steam(single) => single.run_callbacks(),
+            CallbackRunner::Loopback(peer) => peer.run_callbacks(),
+            CallbackRunner::Replay(peer) => peer.run_callbacks(),
+        }
+        RUNNING.with(|running| running.set(false));
+    }
+
+    /// Whether the calling thread is running callbacks, so a handler that
+    /// calls back into `run_callbacks` must not take the runner lock again.
+    pub fn running_here() -> bool {
+        RUNNING.with(Cell::get)
+    }
+}
+
+pub struct InboundMessage {
+    pub steam_id: u64,
+    pub channel: u32,
+    pub data: Vec<u8>,
+}
+
+pub struct PumpShared {
+    pub queue: ArrayQueue<InboundMessage>,
+    running: AtomicBool,
+    pub received: AtomicU64,
+    pub dropped: AtomicU64,
+    pub high_water: AtomicUsize,
+    pub ticks: AtomicU64,
+    waker: Mutex<Option<Py<PyAny>>>,
+    wake_armed: AtomicBool,
+}
+
+impl PumpShared {
+    /// Installs a callable the pump thread invokes once new messages arrive
+    /// after `arm_waker`, so a waiting event loop is not bound by its poll
+    /// interval.
+    pub fn set_waker(&self, waker: Option<Py<PyAny>>) {
+        *self.waker.lock().unwrap() = waker;
+    }
+
+    pub fn has_waker(&self) -> bool {
+        self.waker.lock().unwrap().is_some()
+    }
+
+    pub fn arm_waker(&self) {
+        self.wake_armed.store(true, Ordering::Release);
+    }
+
+    fn wake(&self) {
+        if !self.wake_armed.swap(false, Ordering::AcqRel) {
+            return;
+        }
+        Python::with_gil(|py| {
+            // Clone out of the lock so no Python code runs while it is held.
+            let waker = self.waker.lock().unwrap().as_ref().map(|w| w.clone_ref(py));
+            if let Some(waker) = waker {
+                let _ = waker.call0(py);
+            }
+        });
+    }
+}
+
+/// Native thread that runs Steam callbacks and drains channels into a bounded
+/// lock-free queue at a fixed rate, independent of the Python main loop.
+pub struct Pump {
+    pub shared: Arc<PumpShared>,
+    handle: Mutex<Option<JoinHandle<()>>>,
+}
+
+impl Pump {
+    pub fn start(
+        transport: Transport,
+        runner: Arc<Mutex<CallbackRunner>>,
+        stats: Arc<NetStats>,
+        unpacking: Arc<Unpacking>,
+        channels: Vec<u32>,
+        interval: Duration,
+        capacity: usize,
+        max_messages: usize,
+    ) -> Self {
+        let shared = Arc::new(PumpShared {
+            queue: ArrayQueue::new(capacity.max(1)),
+            running: AtomicBool::new(true),
+            received: AtomicU64::new(0),
+            dropped: AtomicU64::new(0),
+            high_water: AtomicUsize::new(0),
+            ticks: AtomicU64::new(0),
+            waker: Mutex::new(None),
+            wake_armed: AtomicBool::new(false),
+        });
+
+        let thread_shared = shared.clone();
+        let handle = thread::Builder::new()
+            .name("py_steam_net-pump".into())
+            .spawn(move || {
+                while thread_shared.running.load(Ordering::Acquire) {
+                    let started = Instant::now();
+                    {
+                        let runner = runner.lock().unwrap();
+                        let callbacks_started = Instant::now();
+                        runner.run();
+                        stats.run_callbacks_time.record(callbacks_started.elapsed());
+                    }
+
+                    let mut pushed = false;
+                    for &channel in &channels {
+                        let unpack = unpacking.contains(channel);
+                        for (steam_id, message) in transport.receive(channel, max_messages, &stats)
+                        {
+                            let data = message.data();
+                            for (start, end) in Frames::new(data, unpack) {
+                                stats.record_receive(steam_id, channel, end - start);
+                                let inbound = InboundMessage {
+                                    steam_id,
+                                    channel,
+                                    data: data[start..end].to_vec(),
+                                };
+                                if thread_shared.queue.push(inbound).is_ok() {
+                                    thread_shared.received.fetch_add(1, Ordering::Relaxed);
+                                    pushed = true;
+                                } else {
+                                    thread_shared.dropped.fetch_add(1, Ordering::Relaxed);
+                                }
+                            }
+                        }
+                    }
+
+                    if pushed {
+                        thread_shared.wake();
+                    }
+                    thread_shared
+                        .high_water
+                        .fetch_max(thread_shared.queue.len(), Ordering::Relaxed);
+                    thread_shared.ticks.fetch_add(1, Ordering::Relaxed);
+
+                    if let Some(remaining) = interval.checked_sub(started.elapsed()) {
+                        thread::park_timeout(remaining);
+                    }
+                }
+            })
+            .expect("failed to spawn pump thread");
+
+        Pump {
+            shared,
+            handle: Mutex::new(Some(handle)),
+        }
+    }
+
+    pub fn is_running(&self) -> bool {
+        self.handle.lock().unwrap().is_some()
+    }
+
+    /// Signals the thread to exit and waits for it. Must be called without
+    /// holding the GIL, since the thread may be inside a Python callback.
+    pub fn stop(&self) {
+        self.shared.running.store(false, Ordering::Release);
+        let handle = self.handle.lock().unwrap().take();
+        if let Some(handle) = handle {
+            handle.thread().unpark();
+            let _ = handle.join();
+        }
+    }
+}
+
+impl Drop for Pump {
+    /// Signals the thread without joining it, so dropping a running pump
+    /// while holding the GIL cannot deadlock. The thread exits on its own.
+    fn drop(&mut self) {
+        self.shared.running.store(false, Ordering::Release);
+        if let Some(handle) = self.handle.get_mut().unwrap().take() {
+            handle.thread().unpark();
+        }
+    }
+}
@@ -0,0 +1,608 @@
+use std::collections::{BTreeMap, HashMap, HashSet};
+
+/// Replication messages, identified by their first byte.
+const MSG_STATE: u8 = 1;
+const MSG_ACK: u8 = 2;
+
+/// How an entry is encoded in a state message.
+const OP_FULL: u8 = 0;
+const OP_DELTA: u8 = 1;
+const OP_REMOVE: u8 = 2;
+
+/// Header of a state message (kind, sequence) and of each entry in it
+/// (key, op, value length).
+const STATE_HEADER: usize = 5;
+const ENTRY_HEADER: usize = 13;
+
+/// Flags used for every replication message: `k_nSteamNetworkingSend_Unreliable`.
+pub const REPLICATION_SEND_FLAGS: i32 = 0;
+
+/// Unacknowledged sends kept per entry before it falls back to full state.
+const MAX_INFLIGHT: usize = 32;
+/// Unacknowledged messages kept per peer; older ones are assumed lost.
+const MAX_PACKETS: usize = 1024;
+
+/// Counters reported by `replication_stats`.
+#[derive(Default)]
+pub struct ReplicationStats {
+    pub full_entries: u64,
+    pub delta_entries: u64,
+    pub removed_entries: u64,
+    pub packets_sent: u64,
+    pub bytes_sent: u64,
+    pub packets_received: u64,
+    pub stale_entries: u64,
+}
+
+/// What one peer has acknowledged of an entry, and what was sent since.
+#[derive(Default)]
+struct Baseline {
+    value: Option<Vec<u8>>,
+    seq: u32,
+    /// `(seq, value sent, fields sent)`. A `None` value was a removal.
+    inflight: Vec<(u32, Option<Vec<u8>>, Vec<u8>)>,
+    /// Set when an unacknowledged send was dropped from `inflight`: deltas
+    /// no longer repeat its fields, so the next send is a full value.
+    must_be_full: bool,
+}
+
+struct Peer {
+    next_seq: u32,
+    baselines: HashMap<u64, Baseline>,
+    packets: BTreeMap<u32, Vec<u64>>,
+    resync_at: u64,
+}
+
+impl Default for Peer {
+    /// Sequences start at 1 so 0 can mean "nothing acknowledged".
+    fn default() -> Self {
+        Peer {
+            next_seq: 1,
+            baselines: HashMap::new(),
+            packets: BTreeMap::new(),
+            resync_at: 0,
+        }
+    }
+}
+
+/// State received from one peer.
+#[derive(Default)]
+struct Remote {
+    /// Latest applied sequence and value per key. `None` marks a removal.
+    entries: HashMap<u64, (u32, Option<Vec<u8>>)>,
+    latest: Option<u32>,
+    /// Bit `i` set means `latest - 1 - i` was received.
+    received: u32,
+    ack_due: bool,
+}
+
+/// Replicates keyed byte values to a set of peers. Each tick, every peer is
+/// sent only the fields that differ from the values it acknowledged, plus
+/// any fields sent since, so a delta applies correctly whichever earlier
+/// messages were lost. Values are split into fields of `field_size` bytes.
+pub struct Replicator {
+    pub channel: u32,
+    field_size: usize,
+    resync_ticks: u64,
+    max_packet: usize,
+    tick: u64,
+    local: HashMap<u64, Vec<u8>>,
+    peers: HashMap<u64, Peer>,
+    remotes: HashMap<u64, Remote>,
+    changes: Vec<(u64, u64)>,
+    changed: HashSet<(u64, u64)>,
+    pub stats: ReplicationStats,
+}
+
+impl Replicator {
+    pub fn new(channel: u32, field_size: usize, resync_ticks: u64, max_packet: usize) -> Self {
+        Replicator {
+            channel,
+            field_size: field_size.max(1),
+            resync_ticks: resync_ticks.max(1),
+            max_packet,
+            tick: 0,
+            local: HashMap::new(),
+            peers: HashMap::new(),
+            remotes: HashMap::new(),
+            changes: Vec::new(),
+            changed: HashSet::new(),
+            stats: ReplicationStats::default(),
+        }
+    }
+
+    pub fn set(&mut self, key: u64, value: &[u8]) {
+        match self.local.get_mut(&key) {
+            Some(current) => {
+                current.clear();
+                current.extend_from_slice(value);
+            }
+            None => {
+                self.local.insert(key, value.to_vec());
+            }
+        }
+    }
+
+    pub fn remove(&mut self, key: u64) -> bool {
+        self.local.remove(&key).is_some()
+    }
+
+    /// Replaces the peers state is sent to. New peers start with a full
+    /// resync; dropped peers forget what they acknowledged.
+    pub fn set_peers(&mut self, steam_ids: &[u64]) {
+        self.peers
+            .retain(|steam_id, _| steam_ids.contains(steam_id));
+        for &steam_id in steam_ids {
+            self.peers.entry(steam_id).or_default();
+        }
+    }
+
+    /// Value of `key` as last received from `steam_id`.
+    pub fn get(&self, steam_id: u64, key: u64) -> Option<&[u8]> {
+        self.remotes.get(&steam_id)?.entries.get(&key)?.1.as_deref()
+    }
+
+    /// Every value received from `steam_id`.
+    pub fn entries(&self, steam_id: u64) -> impl Iterator<Item = (u64, &[u8])> {
+        self.remotes.get(&steam_id).into_iter().flat_map(|remote| {
+            remote
+                .entries
+                .iter()
+                .filter_map(|(&key, (_, value))| Some((key, value.as_deref()?)))
+        })
+    }
+
+    /// Takes the `(steam_id, key)` pairs whose received value changed.
+    pub fn take_changes(&mut self) -> Vec<(u64, u64)> {
+        self.changed.clear();
+        std::mem::take(&mut self.changes)
+    }
+
+    /// Forgets all peer state, e.g. after `deinit`. Local values are kept.
+    pub fn clear(&mut self) {
+        for peer in self.peers.values_mut() {
+            *peer = Peer::default();
+        }
+        self.remotes.clear();
+        self.take_changes();
+    }
+
+    /// Handles one message from the replication channel.
+    pub fn handle(&mut self, steam_id: u64, data: &[u8]) {
+        match data.first() {
+            Some(&MSG_STATE) => self.apply_state(steam_id, data),
+            Some(&MSG_ACK) if data.len() >= 9 => {
+                let latest = read_u32(data, 1);
+                let received = read_u32(data, 5);
+                if let Some(peer) = self.peers.get_mut(&steam_id) {
+                    peer.ack(latest);
+                    for bit in 0..32 {
+                        if received & (1 << bit) != 0 && latest > bit {
+                            peer.ack(latest - 1 - bit);
+                        }
+                    }
+                }
+            }
+            _ => {}
+        }
+    }
+
+    /// Sends acknowledgements for what arrived since the last tick, then
+    /// each peer's changes. Every `resync_ticks` ticks a peer gets every
+    /// entry in full.
+    pub fn tick(&mut self, mut send: impl FnMut(u64, &[u8])) {
+        self.tick += 1;
+        for (&steam_id, remote) in self.remotes.iter_mut() {
+            if remote.ack_due {
+                if let Some(latest) = remote.latest {
+                    let mut ack = Vec::with_capacity(9);
+                    ack.push(MSG_ACK);
+                    ack.extend_from_slice(&latest.to_le_bytes());
+                    ack.extend_from_slice(&remote.received.to_le_bytes());
+                    send(steam_id, &ack);
+                }
+                remote.ack_due = false;
+            }
+        }
+
+        for (&steam_id, peer) in self.peers.iter_mut() {
+            let full = self.tick >= peer.resync_at;
+            if full {
+                peer.resync_at = self.tick + self.resync_ticks;
+            }
+            let mut keys: Vec<u64> = self.local.keys().copied().collect();
+            keys.extend(
+                peer.baselines
+                    .keys()
+                    .filter(|key| !self.local.contains_key(key)),
+            );
+
+            let mut packet = state_packet(peer.next_seq);
+            let mut packet_keys = Vec::new();
+            let mut entry = Vec::new();
+            for key in keys {
+                let current = self.local.get(&key);
+                let baseline = peer.baselines.entry(key).or_default();
+                let Some(mask) = encode(
+                    &mut entry,
+                    key,
+                    current.map(Vec::as_slice),
+                    baseline,
+                    full,
+                    self.field_size,
+                    &mut self.stats,
+                ) else {
+                    if current.is_none() && baseline.value.is_none() && baseline.inflight.is_empty()
+                    {
+                        peer.baselines.remove(&key);
+                    }
+                    continue;
+                };
+
+                if !packet_keys.is_empty() && packet.len() + entry.len() > self.max_packet {
+                    self.stats.packets_sent += 1;
+                    self.stats.bytes_sent += packet.len() as u64;
+                    send(steam_id, &packet);
+                    peer.packets
+                        .insert(peer.next_seq, std::mem::take(&mut packet_keys));
+                    peer.next_seq += 1;
+                    packet = state_packet(peer.next_seq);
+                }
+                packet.extend_from_slice(&entry);
+                packet_keys.push(key);
+                if entry[8] == OP_FULL {
+                    baseline.must_be_full = false;
+                }
+                if baseline.inflight.len() >= MAX_INFLIGHT {
+                    baseline.inflight.remove(0);
+                    baseline.must_be_full = true;
+                }
+                baseline
+                    .inflight
+                    .push((peer.next_seq, current.cloned(), mask));
+            }
+            if !packet_keys.is_empty() {
+                self.stats.packets_sent += 1;
+                self.stats.bytes_sent += packet.len() as u64;
+                send(steam_id, &packet);
+                peer.packets.insert(peer.next_seq, packet_keys);
+                peer.next_seq += 1;
+            }
+            while peer.packets.len() > MAX_PACKETS {
+                peer.packets.pop_first();
+            }
+        }
+    }
+
+    fn apply_state(&mut self, steam_id: u64, data: &[u8]) {
+        if data.len() < STATE_HEADER {
+            return;
+        }
+        let seq = read_u32(data, 1);
+        self.stats.packets_received += 1;
+        let remote = self.remotes.entry(steam_id).or_default();
+        if remote
+            .latest
+            .is_some_and(|latest| seq.saturating_add(MAX_PACKETS as u32) < latest)
+        {
+            // The sender restarted its sequence.
+            *remote = Remote::default();
+        }
+        remote.mark_received(seq);
+
+        let mut offset = STATE_HEADER;
+        while offset + ENTRY_HEADER <= data.len() {
+            let key = u64::from_le_bytes(data[offset..offset + 8].try_into().unwrap());
+            let op = data[offset + 8];
+            let len = read_u32(data, offset + 9) as usize;
+            offset += ENTRY_HEADER;
+            let body_len = match op {
+                OP_FULL => len,
+                OP_DELTA => {
+                    let fields = len.div_ceil(self.field_size);
+                    let mask_len = fields.div_ceil(8);
+                    let Some(mask) = data.get(offset..offset + mask_len) else {
+                        return;
+                    };
+                    mask_len
+                        + (0..fields)
+                            .filter(|&field| mask[field / 8] & (1 << (field % 8)) != 0)
+                            .map(|field| field_range(field, self.field_size, len).len())
+                            .sum::<usize>()
+                }
+                OP_REMOVE => 0,
+                _ => return,
+            };
+            let Some(body) = data.get(offset..offset + body_len) else {
+                return;
+            };
+            offset += body_len;
+
+            // Entries are only ever replaced by newer messages.
+            let stored = remote.entries.entry(key).or_insert((0, None));
+            if seq <= stored.0 {
+                self.stats.stale_entries += 1;
+                continue;
+            }
+            match op {
+                OP_FULL => stored.1 = Some(body.to_vec()),
+                OP_DELTA => {
+                    let Some(value) = stored.1.as_mut() else {
+                        self.stats.stale_entries += 1;
+                        continue;
+                    };
+                    value.resize(len, 0);
+                    let fields = len.div_ceil(self.field_size);
+                    let (mask, mut fields_data) = body.split_at(fields.div_ceil(8));
+                    for field in 0..fields {
+                        if mask[field / 8] & (1 << (field % 8)) != 0 {
+                            let range = field_range(field, self.field_size, len);
+                            let (field_data, rest) = fields_data.split_at(range.len());
+                            value[range].copy_from_slice(field_data);
+                            fields_data = rest;
+                        }
+                    }
+                }
+                _ => stored.1 = None,
+            }
+            stored.0 = seq;
+            if self.changed.insert((steam_id, key)) {
+                self.changes.push((steam_id, key));
+            }
+        }
+    }
+}
+
+impl Peer {
+    /// Makes what was sent in `seq` the baseline of every entry in it.
+    fn ack(&mut self, seq: u32) {
+        let Some(keys) = self.packets.remove(&seq) else {
+            return;
+        };
+        for key in keys {
+            let Some(baseline) = self.baselines.get_mut(&key) else {
+                continue;
+            };
+            let Some(index) = baseline.inflight.iter().position(|(s, ..)| *s == seq) else {
+                continue;
+            };
+            let (_, value, _) = baseline.inflight.remove(index);
+            if seq > baseline.seq {
+                baseline.value = value;
+                baseline.seq = seq;
+            }
+            // Later sends repeat every field of earlier ones.
+            baseline.inflight.retain(|(s, ..)| *s > seq);
+            if baseline.value.is_none() && baseline.inflight.is_empty() {
+                self.baselines.remove(&key);
+            }
+        }
+    }
+}
+
+impl Remote {
+    fn mark_received(&mut self, seq: u32) {
+        match self.latest {
+            Some(latest) if seq > latest => {
+                let shift = seq - latest;
+                self.received = if shift > 32 {
+                    0
+                } else {
+                    ((self.received as u64) << shift | 1 << (shift - 1)) as u32
+                };
+                self.latest = Some(seq);
+            }
+            Some(latest) if seq < latest && latest - seq <= 32 => {
+                self.received |= 1 << (latest - seq - 1);
+            }
+            Some(_) => {}
+            None => self.latest = Some(seq),
+        }
+        self.ack_due = true;
+    }
+}
+
+fn state_packet(seq: u32) -> Vec<u8> {
+    let mut packet = Vec::with_capacity(STATE_HEADER);
+    packet.push(MSG_STATE);
+    packet.extend_from_slice(&seq.to_le_bytes());
+    packet
+}
+
+fn read_u32(data: &[u8], offset: usize) -> u32 {
+    u32::from_le_bytes(data[offset..offset + 4].try_into().unwrap())
+}
+
+fn field_range(field: usize, field_size: usize, len: usize) -> std::ops::Range<usize> {
+    field * field_size..((field + 1) * field_size).min(len)
+}
+
+/// Encodes `key` into `out` as a full value, a delta against `baseline` or a
+/// removal, and returns the fields it carries. Returns `None` if the peer
+/// already has the current value.
+fn encode(
+    out: &mut Vec<u8>,
+    key: u64,
+    current: Option<&[u8]>,
+    baseline: &Baseline,
+    full: bool,
+    field_size: usize,
+    stats: &mut ReplicationStats,
+) -> Option<Vec<u8>> {
+    out.clear();
+    out.extend_from_slice(&key.to_le_bytes());
+    let Some(current) = current else {
+        if baseline.value.is_none() && baseline.inflight.is_empty() {
+            return None;
+        }
+        out.push(OP_REMOVE);
+        out.extend_from_slice(&0u32.to_le_bytes());
+        stats.removed_entries += 1;
+        return Some(Vec::new());
+    };
+    let fields = current.len().div_ceil(field_size);
+    let mask_len = fields.div_ceil(8);
+    out.extend_from_slice(&[0]);
+    out.extend_from_slice(&(current.len() as u32).to_le_bytes());
+
+    // A removal in flight may have been applied, so only a full value is safe.
+    let must_be_full = full
+        || baseline.must_be_full
+        || baseline.value.is_none()
+        || baseline
+            .inflight
+            .iter()
+            .any(|(_, value, _)| value.is_none());
+    if !must_be_full {
+        let previous = baseline.value.as_deref().unwrap();
+        let mut mask = vec![0u8; mask_len];
+        for (_, _, sent) in &baseline.inflight {
+            for (byte, sent) in mask.iter_mut().zip(sent) {
+                *byte |= sent;
+            }
+        }
+        for field in 0..fields {
+            let range = field_range(field, field_size, current.len());
+            if previous.get(range.clone()) != Some(&current[range]) {
+                mask[field / 8] |= 1 << (field % 8);
+            }
+        }
+        if current.len() == previous.len() && mask.iter().all(|&byte| byte == 0) {
+            return None;
+        }
+        out[8] = OP_DELTA;
+        out.extend_from_slice(&mask);
+        for field in 0..fields {
+            if mask[field / 8] & (1 << (field % 8)) != 0 {
+                out.extend_from_slice(&current[field_range(field, field_size, current.len())]);
+            }
+        }
+        stats.delta_entries += 1;
+        return Some(mask);
+    }
+
+    out[8] = OP_FULL;
+    out.extend_from_slice(current);
+    stats.full_entries += 1;
+    let mut mask = vec![0xFF; mask_len];
+    if let Some(last) = mask.last_mut() {
+        if fields % 8 != 0 {
+            *last = (1 << (fields % 8)) - 1;
+        }
+    }
+    Some(mask)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const A: u64 = 1;
+    const B: u64 = 2;
+
+    fn pair() -> (Replicator, Replicator) {
+        let mut a = Replicator::new(0, 4, 1000, 1200);
+        let mut b = Replicator::new(0, 4, 1000, 1200);
+        a.set_peers(&[B]);
+        b.set_peers(&[A]);
+        (a, b)
+    }
+
+    fn tick(from: &mut Replicator) -> Vec<Vec<u8>> {
+        let mut sent = Vec::new();
+        from.tick(|_, data| sent.push(data.to_vec()));
+        sent
+    }
+
+    /// Ticks `a`, delivers its state to `b` unless `lose` and returns
+    /// `b`'s acknowledgement to `a`.
+    fn exchange(a: &mut Replicator, b: &mut Replicator, lose: bool) {
+        for packet in tick(a) {
+            if !lose {
+                b.handle(A, &packet);
+            }
+        }
+        for packet in tick(b) {
+            a.handle(B, &packet);
+        }
+    }
+
+    #[test]
+    fn first_send_is_full_then_deltas() {
+        let (mut a, mut b) = pair();
+        a.set(7, b"aaaabbbbcccc");
+        exchange(&mut a, &mut b, false);
+        assert_eq!(b.get(A, 7), Some(&b"aaaabbbbcccc"[..]));
+        assert_eq!(a.stats.full_entries, 1);
+
+        a.set(7, b"aaaaBBBBcccc");
+        exchange(&mut a, &mut b, false);
+        assert_eq!(b.get(A, 7), Some(&b"aaaaBBBBcccc"[..]));
+        assert_eq!(a.stats.delta_entries, 1);
+        assert_eq!(b.take_changes(), [(A, 7)]);
+    }
+
+    #[test]
+    fn acknowledged_value_is_not_resent() {
+        let (mut a, mut b) = pair();
+        a.set(7, b"value");
+        exchange(&mut a, &mut b, false);
+        assert!(tick(&mut a).is_empty());
+    }
+
+    #[test]
+    fn delta_repeats_unacknowledged_fields() {
+        let (mut a, mut b) = pair();
+        a.set(7, b"aaaabbbbcccc");
+        exchange(&mut a, &mut b, false);
+        a.set(7, b"AAAAbbbbcccc");
+        exchange(&mut a, &mut b, true);
+        a.set(7, b"AAAAbbbbCCCC");
+        exchange(&mut a, &mut b, false);
+        assert_eq!(b.get(A, 7), Some(&b"AAAAbbbbCCCC"[..]));
+    }
+
+    #[test]
+    fn removal_is_replicated() {
+        let (mut a, mut b) = pair();
+        a.set(7, b"value");
+        exchange(&mut a, &mut b, false);
+        assert!(a.remove(7));
+        exchange(&mut a, &mut b, false);
+        assert_eq!(b.get(A, 7), None);
+        assert_eq!(a.stats.removed_entries, 1);
+        assert!(tick(&mut a).is_empty());
+    }
+
+    #[test]
+    fn stale_packets_are_ignored() {
+        let (mut a, mut b) = pair();
+        a.set(7, b"old!");
+        let old = tick(&mut a);
+        a.set(7, b"new!");
+        for packet in tick(&mut a) {
+            b.handle(A, &packet);
+        }
+        for packet in old {
+            b.handle(A, &packet);
+        }
+        assert_eq!(b.get(A, 7), Some(&b"new!"[..]));
+        assert_eq!(b.stats.stale_entries, 1);
+    }
+
+    #[test]
+    fn inflight_overflow_sends_full_state() {
+        let (mut a, mut b) = pair();
+        a.set(7, &[0; 8]);
+        exchange(&mut a, &mut b, false);
+        // Acknowledgements stop arriving; every send stays in flight.
+        for round in 1..=MAX_INFLIGHT + 1 {
+            a.set(7, &[round as u8; 8]);
+            tick(&mut a);
+        }
+        assert_eq!(a.stats.full_entries, 1);
+        a.set(7, &[0xFF; 8]);
+        tick(&mut a);
+        assert_eq!(a.stats.full_entries, 2);
+    }
+}
@@ -0,0 +1,132 @@
+use std::{
+    collections::HashMap,
+    sync::{
+        atomic::{AtomicU64, Ordering},
+        Arc, Mutex,
+    },
+    time::Instant,
+};
+
+use pyo3::{prelude::*, types::PyBytes};
+
+use crate::stats::NetStats;
+
+#[derive(Default)]
+struct ChannelRoutes {
+    handler: Option<Py<PyAny>>,
+    by_tag: HashMap<u8, Py<PyAny>>,
+}
+
+/// Immutable routing table. Lookups go tag handler, then channel handler,
+/// then the default message callback.
+#[derive(Default)]
+pub struct Routes {
+    default: Option<Py<PyAny>>,
+    channels: HashMap<u32, ChannelRoutes>,
+}
+
+impl Routes {
+    fn clone_ref(&self, py: Python<'_>) -> Self {
+        Routes {
+            default: self.default.as_ref().map(|cb| cb.clone_ref(py)),
+            channels: self
+                .channels
+                .iter()
+                .map(|(&channel, routes)| {
+                    let routes = ChannelRoutes {
+                        handler: routes.handler.as_ref().map(|cb| cb.clone_ref(py)),
+                        by_tag: routes
+                            .by_tag
+                            .iter()
+                            .map(|(&tag, cb)| (tag, cb.clone_ref(py)))
+                            .collect(),
+                    };
+                    (channel, routes)
+                })
+                .collect(),
+        }
+    }
+
+    pub fn resolve(&self, channel: u32, data: &[u8]) -> Option<&Py<PyAny>> {
+        if let Some(routes) = self.channels.get(&channel) {
+            let tagged = data.first().and_then(|tag| routes.by_tag.get(tag));
+            if let Some(cb) = tagged.or(routes.handler.as_ref()) {
+                return Some(cb);
+            }
+        }
+        self.default.as_ref()
+    }
+}
+
+/// Per-channel and per-tag message dispatch. The table is copied on write,
+/// so a batch takes the lock once to grab a snapshot and handlers may
+/// re-register routes while being dispatched to.
+#[derive(Default)]
+pub struct Router {
+    routes: Mutex<Arc<Routes>>,
+    unrouted: AtomicU64,
+}
+
+impl Router {
+    pub fn snapshot(&self) -> Arc<Routes> {
+        self.routes.lock().unwrap().clone()
+    }
+
+    fn update(&self, py: Python<'_>, change: impl FnOnce(&mut Routes)) {
+        let mut routes = self.routes.lock().unwrap();
+        let mut updated = routes.clone_ref(py);
+        change(&mut updated);
+        *routes = Arc::new(updated);
+    }
+
+    pub fn set_default(&self, py: Python<'_>, cb: Option<Py<PyAny>>) {
+        self.update(py, |routes| routes.default = cb);
+    }
+
+    pub fn set_handler(&self, py: Python<'_>, channel: u32, tag: Option<u8>, cb: Option<Py<PyAny>>) {
+        self.update(py, |routes| {
+            let entry = routes.channels.entry(channel).or_default();
+            match tag {
+                Some(tag) => match cb {
+                    Some(cb) => {
+                        entry.by_tag.insert(tag, cb);
+                    }
+                    None => {
+                        entry.by_tag.remove(&tag);
+                    }
+                },
+                None => entry.handler = cb,
+            }
+            if entry.handler.is_none() && entry.by_tag.is_empty() {
+                routes.channels.remove(&channel);
+            }
+        });
+    }
+
+    /// Calls the handler for one message. Messages without a handler are
+    /// counted and never converted to Python objects.
+    pub fn dispatch(
+        &self,
+        routes: &Routes,
+        stats: &NetStats,
+        py: Python<'_>,
+        steam_id: u64,
+        channel: u32,
+        data: &[u8],
+    ) {
+        match routes.resolve(channel, data) {
+            Some(cb) => {
+                let started = Instant::now();
+                let result = cb.call1(py, (steam_id, channel, PyBytes::new(py, data)));
+                stats.record_callback(started.elapsed(), result.is_err());
+            }
+            None => {
+                self.unrouted.fetch_add(1, Ordering::Relaxed);
+            }
+        }
+    }
+
+    pub fn unrouted(&self) -> u64 {
+        self.unrouted.load(Ordering::Relaxed)
+    }
+}
@@ -0,0 +1,291 @@
+use std::{
+    cmp::Reverse,
+    collections::{HashMap, HashSet},
+    time::Instant,
+};
+
+/// `k_nSteamNetworkingSend_Reliable`; only unreliable messages are replaced
+/// by a newer one with the same key.
+const SEND_RELIABLE: i32 = 8;
+
+/// Scheduler result codes, numbered like Steam's `EResult`.
+const SEND_PENDING: i32 = 22;
+const SEND_LIMIT_EXCEEDED: i32 = 25;
+
+/// A message waiting for its turn.
+pub struct Scheduled {
+    pub steam_id: u64,
+    pub message_type: i32,
+    pub channel: u32,
+    pub data: Vec<u8>,
+    key: Option<u64>,
+    seq: u64,
+}
+
+struct PeerQueue {
+    messages: Vec<Scheduled>,
+    /// Position in `messages` of the queued message for `(channel, key)`.
+    keyed: HashMap<(u32, u64), usize>,
+    tokens: f64,
+}
+
+#[derive(Default)]
+pub struct SchedulerStats {
+    pub sent: u64,
+    pub replaced: u64,
+    pub dropped: u64,
+    pub deferred: u64,
+}
+
+/// Holds outgoing messages until the next tick and releases them per peer
+/// in channel priority order, within a token-bucket byte budget.
+pub struct Scheduler {
+    pub bytes_per_sec: u64,
+    pub burst_bytes: u64,
+    pub max_queued: usize,
+    priorities: HashMap<u32, i32>,
+    peers: HashMap<u64, PeerQueue>,
+    next_seq: u64,
+    last_flush: Instant,
+    pub stats: SchedulerStats,
+}
+
+impl Scheduler {
+    pub fn new(bytes_per_sec: u64, burst_bytes: u64, max_queued: usize) -> Self {
+        Scheduler {
+            bytes_per_sec,
+            burst_bytes: burst_bytes.max(1),
+            max_queued,
+            priorities: HashMap::new(),
+            peers: HashMap::new(),
+            next_seq: 0,
+            last_flush: Instant::now(),
+            stats: SchedulerStats::default(),
+        }
+    }
+
+    pub fn set_priority(&mut self, channel: u32, priority: i32) {
+        self.priorities.insert(channel, priority);
+    }
+
+    /// Queues a message and returns its result code. An unreliable message
+    /// with a `key` replaces the one queued for the same peer, channel and
+    /// key; a full peer queue rejects the message.
+    pub fn push(
+        &mut self,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        key: Option<u64>,
+        data: &[u8],
+    ) -> i32 {
+        let burst = self.burst_bytes as f64;
+        let peer = self.peers.entry(steam_id).or_insert_with(|| PeerQueue {
+            messages: Vec::new(),
+            keyed: HashMap::new(),
+            tokens: burst,
+        });
+        let unreliable = message_type & SEND_RELIABLE == 0;
+        if let Some(key) = key.filter(|_| unreliable) {
+            if let Some(&index) = peer.keyed.get(&(channel, key)) {
+                let queued = &mut peer.messages[index];
+                queued.message_type = message_type;
+                queued.data.clear();
+                queued.data.extend_from_slice(data);
+                self.stats.replaced += 1;
+                return SEND_PENDING;
+            }
+        }
+        if peer.messages.len() >= self.max_queued {
+            self.stats.dropped += 1;
+            return SEND_LIMIT_EXCEEDED;
+        }
+        if let Some(key) = key.filter(|_| unreliable) {
+            peer.keyed.insert((channel, key), peer.messages.len());
+        }
+        peer.messages.push(Scheduled {
+            steam_id,
+            message_type,
+            channel,
+            data: data.to_vec(),
+            key,
+            seq: self.next_seq,
+        });
+        self.next_seq += 1;
+        SEND_PENDING
+    }
+
+    /// Takes the messages to send this tick. Each peer's queue is walked in
+    /// descending channel priority, oldest first within a channel. Once a
+    /// message does not fit the peer's budget, the rest of its channel waits
+    /// for the next tick so reliable ordering is kept, and so does every
+    /// lower-priority channel so it cannot starve the deferred one.
+    pub fn take_ready(&mut self, now: Instant) -> Vec<Scheduled> {
+        let refill = now.duration_since(self.last_flush).as_secs_f64() * self.bytes_per_sec as f64;
+        self.last_flush = now;
+        let burst = self.burst_bytes as f64;
+        let limited = self.bytes_per_sec > 0;
+
+        let mut ready = Vec::new();
+        for peer in self.peers.values_mut() {
+            peer.tokens = (peer.tokens + refill).min(burst);
+            let mut messages = std::mem::take(&mut peer.messages);
+            messages.sort_by_key(|m| priority_order(&self.priorities, m));
+            let mut blocked = HashSet::new();
+            // Priority of the first message deferred for lack of budget.
+            let mut deferred_at = None;
+            peer.keyed.clear();
+            for message in messages {
+                let len = message.data.len() as f64;
+                let priority = channel_priority(&self.priorities, message.channel);
+                // A message larger than the burst goes out once the bucket is full.
+                let fits = !limited || peer.tokens >= len.min(burst);
+                let starved = deferred_at.is_some_and(|deferred| priority < deferred);
+                if fits && !starved && !blocked.contains(&message.channel) {
+                    if limited {
+                        peer.tokens -= len;
+                    }
+                    ready.push(message);
+                } else {
+                    if !fits {
+                        deferred_at.get_or_insert(priority);
+                    }
+                    blocked.insert(message.channel);
+                    self.stats.deferred += 1;
+                    if let Some(key) = message
+                        .key
+                        .filter(|_| message.message_type & SEND_RELIABLE == 0)
+                    {
+                        peer.keyed
+                            .insert((message.channel, key), peer.messages.len());
+                    }
+                    peer.messages.push(message);
+                }
+            }
+        }
+        self.peers
+            .retain(|_, peer| !peer.messages.is_empty() || peer.tokens < burst);
+        ready.sort_by_key(|m| priority_order(&self.priorities, m));
+        self.stats.sent += ready.len() as u64;
+        ready
+    }
+
+    /// Takes every queued message regardless of budget.
+    pub fn take_all(&mut self) -> Vec<Scheduled> {
+        let mut all: Vec<Scheduled> = self
+            .peers
+            .drain()
+            .flat_map(|(_, peer)| peer.messages)
+            .collect();
+        all.sort_by_key(|m| m.seq);
+        self.stats.sent += all.len() as u64;
+        all
+    }
+
+    /// Queued message and byte counts per channel.
+    pub fn queued(&self) -> HashMap<u32, (usize, usize)> {
+        let mut queued = HashMap::new();
+        for message in self.peers.values().flat_map(|peer| &peer.messages) {
+            let entry = queued.entry(message.channel).or_insert((0, 0));
+            entry.0 += 1;
+            entry.1 += message.data.len();
+        }
+        queued
+    }
+}
+
+/// Sort key putting higher-priority channels first, then older messages.
+fn priority_order(priorities: &HashMap<u32, i32>, message: &Scheduled) -> (Reverse<i32>, u64) {
+    (
+        Reverse(channel_priority(priorities, message.channel)),
+        message.seq,
+    )
+}
+
+fn channel_priority(priorities: &HashMap<u32, i32>, channel: u32) -> i32 {
+    priorities.get(&channel).copied().unwrap_or(0)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn channels(ready: &[Scheduled]) -> Vec<(u32, usize)> {
+        ready.iter().map(|m| (m.channel, m.data.len())).collect()
+    }
+
+    #[test]
+    fn higher_priority_goes_first() {
+        let mut scheduler = Scheduler::new(0, 16384, 16);
+        scheduler.set_priority(1, 5);
+        scheduler.push(1, 0, 0, None, &[0; 1]);
+        scheduler.push(1, 0, 1, None, &[0; 2]);
+        scheduler.push(1, 0, 0, None, &[0; 3]);
+        let ready = scheduler.take_ready(Instant::now());
+        assert_eq!(channels(&ready), [(1, 2), (0, 1), (0, 3)]);
+        assert_eq!(scheduler.stats.sent, 3);
+    }
+
+    #[test]
+    fn over_budget_waits_in_order() {
+        // One byte per second: the refill during the test is negligible.
+        let mut scheduler = Scheduler::new(1, 100, 16);
+        scheduler.push(1, 0, 0, None, &[0; 80]);
+        scheduler.push(1, 0, 0, None, &[0; 50]);
+        scheduler.push(1, 0, 0, None, &[0; 10]);
+        let ready = scheduler.take_ready(Instant::now());
+        assert_eq!(channels(&ready), [(0, 80)]);
+        assert_eq!(scheduler.stats.deferred, 2);
+        assert_eq!(scheduler.queued()[&0], (2, 60));
+    }
+
+    #[test]
+    fn deferred_priority_is_not_starved() {
+        let mut scheduler = Scheduler::new(1, 100, 16);
+        scheduler.set_priority(1, 5);
+        scheduler.push(1, 0, 1, None, &[0; 80]);
+        scheduler.push(1, 0, 1, None, &[0; 80]);
+        scheduler.push(1, 0, 0, None, &[0; 10]);
+        // Another peer has its own budget.
+        scheduler.push(2, 0, 0, None, &[0; 10]);
+        let mut ready = channels(&scheduler.take_ready(Instant::now()));
+        ready.sort();
+        assert_eq!(ready, [(0, 10), (1, 80)]);
+        assert_eq!(scheduler.queued()[&0], (1, 10));
+        assert_eq!(scheduler.queued()[&1], (1, 80));
+    }
+
+    #[test]
+    fn keyed_unreliable_messages_are_replaced() {
+        let mut scheduler = Scheduler::new(0, 16384, 16);
+        assert_eq!(scheduler.push(1, 0, 0, Some(9), b"old"), SEND_PENDING);
+        assert_eq!(scheduler.push(1, 0, 0, Some(9), b"new"), SEND_PENDING);
+        scheduler.push(1, SEND_RELIABLE, 0, Some(9), b"kept");
+        scheduler.push(1, SEND_RELIABLE, 0, Some(9), b"kept");
+        let ready = scheduler.take_ready(Instant::now());
+        assert_eq!(ready.len(), 3);
+        assert_eq!(ready[0].data, b"new");
+        assert_eq!(scheduler.stats.replaced, 1);
+    }
+
+    #[test]
+    fn full_queue_rejects() {
+        let mut scheduler = Scheduler::new(0, 16384, 2);
+        scheduler.push(1, 0, 0, None, b"a");
+        scheduler.push(1, 0, 0, None, b"b");
+        assert_eq!(scheduler.push(1, 0, 0, None, b"c"), SEND_LIMIT_EXCEEDED);
+        assert_eq!(scheduler.push(2, 0, 0, None, b"c"), SEND_PENDING);
+        assert_eq!(scheduler.stats.dropped, 1);
+    }
+
+    #[test]
+    fn take_all_ignores_budget() {
+        let mut scheduler = Scheduler::new(1, 10, 16);
+        scheduler.set_priority(1, 5);
+        scheduler.push(1, 0, 0, None, &[0; 50]);
+        scheduler.push(1, 0, 1, None, &[0; 50]);
+        let all = scheduler.take_all();
+        assert_eq!(channels(&all), [(0, 50), (1, 50)]);
+        assert!(scheduler.queued().is_empty());
+    }
+}
@@ -0,0 +1,349 @@
+use std::{
+    collections::{HashMap, HashSet},
+    time::{Duration, Instant},
+};
+
+use pyo3::{prelude::*, types::PyDict};
+use steamworks::networking_types::{NetConnectionRealTimeInfo, NetworkingConnectionState};
+
+use crate::batch::to_array;
+
+/// Numbers a session state like Steam's `ESteamNetworkingConnectionState`.
+pub fn connection_state_code(state: NetworkingConnectionState) -> i32 {
+    match state {
+        NetworkingConnectionState::None => 0,
+        NetworkingConnectionState::Connecting => 1,
+        NetworkingConnectionState::FindingRoute => 2,
+        NetworkingConnectionState::Connected => 3,
+        NetworkingConnectionState::ClosedByPeer => 4,
+        NetworkingConnectionState::ProblemDetectedLocally => 5,
+    }
+}
+
+/// Realtime status of one session, as reported by Steam or simulated by
+/// the loopback backend.
+pub struct SessionStatus {
+    pub ping: i32,
+    pub quality_local: f32,
+    pub quality_remote: f32,
+    pub pending_reliable: i32,
+    pub pending_unreliable: i32,
+    pub sent_unacked_reliable: i32,
+    pub send_rate: i32,
+    pub out_bytes_per_sec: f32,
+    pub in_bytes_per_sec: f32,
+    pub queue_time_us: i64,
+}
+
+impl From<&NetConnectionRealTimeInfo> for SessionStatus {
+    fn from(status: &NetConnectionRealTimeInfo) -> Self {
+        SessionStatus {
+            ping: status.ping(),
+            quality_local: status.connection_quality_local(),
+            quality_remote: status.connection_quality_remote(),
+            pending_reliable: status.pending_reliable(),
+            pending_unreliable: status.pending_unreliable(),
+            sent_unacked_reliable: status.sent_unacked_reliable(),
+            send_rate: status.send_rate_bytes_per_sec(),
+            out_bytes_per_sec: status.out_bytes_per_sec(),
+            in_bytes_per_sec: status.in_bytes_per_sec(),
+            // steamworks exposes `m_usecQueueTime` under this name.
+            queue_time_us: status.queued_send_bytes(),
+        }
+    }
+}
+
+/// Columnar connection status of many sessions, one row per peer.
+#[derive(Default)]
+pub struct SessionInfoBatch {
+    steam_ids: Vec<u64>,
+    states: Vec<i32>,
+    pings: Vec<i32>,
+    quality_local: Vec<f32>,
+    quality_remote: Vec<f32>,
+    pending_reliable: Vec<i32>,
+    pending_unreliable: Vec<i32>,
+    sent_unacked_reliable: Vec<i32>,
+    send_rates: Vec<i32>,
+    out_bytes_per_sec: Vec<f32>,
+    in_bytes_per_sec: Vec<f32>,
+    queue_times: Vec<i64>,
+}
+
+impl SessionInfoBatch {
+    pub fn push(&mut self, steam_id: u64, state: i32, status: Option<&SessionStatus>) {
+        self.steam_ids.push(steam_id);
+        self.states.push(state);
+        match status {
+            Some(status) => {
+                self.pings.push(status.ping);
+                self.quality_local.push(status.quality_local);
+                self.quality_remote.push(status.quality_remote);
+                self.pending_reliable.push(status.pending_reliable);
+                self.pending_unreliable.push(status.pending_unreliable);
+                self.sent_unacked_reliable
+                    .push(status.sent_unacked_reliable);
+                self.send_rates.push(status.send_rate);
+                self.out_bytes_per_sec.push(status.out_bytes_per_sec);
+                self.in_bytes_per_sec.push(status.in_bytes_per_sec);
+                self.queue_times.push(status.queue_time_us);
+            }
+            None => {
+                self.pings.push(-1);
+                self.quality_local.push(-1.0);
+                self.quality_remote.push(-1.0);
+                self.pending_reliable.push(0);
+                self.pending_unreliable.push(0);
+                self.sent_unacked_reliable.push(0);
+                self.send_rates.push(0);
+                self.out_bytes_per_sec.push(0.0);
+                self.in_bytes_per_sec.push(0.0);
+                self.queue_times.push(0);
+            }
+        }
+    }
+
+    /// Returns a dict of `array.array` columns keyed by field name.
+    pub fn into_py<'py>(self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let columns = PyDict::new(py);
+        columns.set_item("steam_id", to_array(py, "Q", &self.steam_ids)?)?;
+        columns.set_item("state", to_array(py, "i", &self.states)?)?;
+        columns.set_item("ping_ms", to_array(py, "i", &self.pings)?)?;
+        columns.set_item("quality_local", to_array(py, "f", &self.quality_local)?)?;
+        columns.set_item("quality_remote", to_array(py, "f", &self.quality_remote)?)?;
+        columns.set_item(
+            "pending_reliable",
+            to_array(py, "i", &self.pending_reliable)?,
+        )?;
+        columns.set_item(
+            "pending_unreliable",
+            to_array(py, "i", &self.pending_unreliable)?,
+        )?;
+        columns.set_item(
+            "sent_unacked_reliable",
+            to_array(py, "i", &self.sent_unacked_reliable)?,
+        )?;
+        columns.set_item("send_rate", to_array(py, "i", &self.send_rates)?)?;
+        columns.set_item(
+            "out_bytes_per_sec",
+            to_array(py, "f", &self.out_bytes_per_sec)?,
+        )?;
+        columns.set_item(
+            "in_bytes_per_sec",
+            to_array(py, "f", &self.in_bytes_per_sec)?,
+        )?;
+        columns.set_item("queue_time_us", to_array(py, "q", &self.queue_times)?)?;
+        Ok(columns)
+    }
+}
+
+/// Sent on the session channel to open a session before the first real
+/// message; discarded on arrival.
+pub const SESSION_HELLO: &[u8] = &[0x01];
+pub const SESSION_SEND_FLAGS: i32 = 8;
+
+/// When sessions are opened, accepted and closed.
+pub struct SessionPolicy {
+    pub channel: u32,
+    /// Open sessions to lobby members as soon as they are seen.
+    pub prewarm: bool,
+    /// Accept session requests from lobby members and reject the rest.
+    pub accept_members: bool,
+    /// Close sessions to peers that left every lobby.
+    pub close_departed: bool,
+    /// Close sessions that carried no messages for this long.
+    pub idle_timeout: Option<Duration>,
+}
+
+struct TrackedSession {
+    state: i32,
+    /// Messages sent and received when last checked, and when that changed.
+    activity: u64,
+    last_active: Instant,
+    /// Opened with `open_session` rather than for a lobby member.
+    pinned: bool,
+    warmed: bool,
+    idle_closed: bool,
+}
+
+#[derive(Default)]
+pub struct SessionStats {
+    pub warmed: u64,
+    pub warm_failed: u64,
+    pub accepted: u64,
+    pub rejected: u64,
+    pub closed_idle: u64,
+    pub closed_departed: u64,
+}
+
+/// What a tick of the session manager wants done.
+#[derive(Default)]
+pub struct SessionActions {
+    pub warm: Vec<u64>,
+    pub close: Vec<u64>,
+    /// `(steam_id, old_state, new_state)` in the order they were seen.
+    pub transitions: Vec<(u64, i32, i32)>,
+}
+
+/// Tracks the sessions to lobby members and explicitly opened peers,
+/// deciding when to open them ahead of traffic and when to close them.
+pub struct SessionManager {
+    pub policy: SessionPolicy,
+    peers: HashMap<u64, TrackedSession>,
+    lobby_generation: Option<u64>,
+    pub stats: SessionStats,
+}
+
+impl SessionManager {
+    pub fn new(policy: SessionPolicy) -> Self {
+        SessionManager {
+            policy,
+            peers: HashMap::new(),
+            lobby_generation: None,
+            stats: SessionStats::default(),
+        }
+    }
+
+    fn track(&mut self, steam_id: u64, pinned: bool, now: Instant) -> &mut TrackedSession {
+        let session = self.peers.entry(steam_id).or_insert(TrackedSession {
+            state: 0,
+            activity: 0,
+            last_active: now,
+            pinned,
+            warmed: false,
+            idle_closed: false,
+        });
+        session.pinned |= pinned;
+        session
+    }
+
+    /// Starts tracking `steam_id` until `close`, whether or not it shares a
+    /// lobby, and opens its session on the next tick.
+    pub fn open(&mut self, steam_id: u64, now: Instant) {
+        let session = self.track(steam_id, true, now);
+        session.warmed = false;
+        session.idle_closed = false;
+    }
+
+    /// Stops tracking `steam_id`. Returns its last known state.
+    pub fn close(&mut self, steam_id: u64) -> Option<i32> {
+        self.peers.remove(&steam_id).map(|session| session.state)
+    }
+
+    /// Records that the warm-up message to `steam_id` could not be sent.
+    /// The session is not warmed again until `open` is called for it or it
+    /// rejoins a lobby.
+    pub fn warm_failed(&mut self, steam_id: u64) {
+        if self.peers.contains_key(&steam_id) {
+            self.stats.warm_failed += 1;
+        }
+    }
+
+    /// Decides a session request from `steam_id`, or returns `None` to
+    /// accept it without checking membership.
+    pub fn decide_request(&mut self, is_member: impl FnOnce() -> bool) -> Option<bool> {
+        if !self.policy.accept_members {
+            return None;
+        }
+        let accepted = is_member();
+        if accepted {
+            self.stats.accepted += 1;
+        } else {
+            self.stats.rejected += 1;
+        }
+        Some(accepted)
+    }
+
+    /// Reconciles tracked peers with lobby membership, polls their state
+    /// and applies the idle and departure policy. `members` is only
+    /// consulted when `generation` changed since the last tick.
+    pub fn tick(
+        &mut self,
+        now: Instant,
+        own_id: u64,
+        generation: u64,
+        members: impl FnOnce() -> HashSet<u64>,
+        activity: impl Fn(u64) -> u64,
+        state: impl Fn(u64) -> i32,
+    ) -> SessionActions {
+        let mut actions = SessionActions::default();
+        if self.lobby_generation != Some(generation) {
+            self.lobby_generation = Some(generation);
+            let mut members = members();
+            members.remove(&own_id);
+            let departed: Vec<u64> = self
+                .peers
+                .iter()
+                .filter(|(steam_id, session)| !session.pinned && !members.contains(steam_id))
+                .map(|(&steam_id, _)| steam_id)
+                .collect();
+            for steam_id in departed {
+                let session = self.peers.remove(&steam_id).unwrap();
+                if self.policy.close_departed && session.state != 0 {
+                    actions.close.push(steam_id);
+                    actions.transitions.push((steam_id, session.state, 0));
+                    self.stats.closed_departed += 1;
+                }
+            }
+            for steam_id in members {
+                self.track(steam_id, false, now);
+            }
+        }
+
+        for (&steam_id, session) in &mut self.peers {
+            let messages = activity(steam_id);
+            if messages != session.activity {
+                session.activity = messages;
+                session.last_active = now;
+                session.idle_closed = false;
+            }
+            if !session.warmed && (self.policy.prewarm || session.pinned) {
+                session.warmed = true;
+                actions.warm.push(steam_id);
+                self.stats.warmed += 1;
+                // A warmed session counts as fresh.
+                session.last_active = now;
+            }
+            let current = state(steam_id);
+            if let Some(timeout) = self.policy.idle_timeout {
+                if current != 0
+                    && !session.idle_closed
+                    && now.duration_since(session.last_active) >= timeout
+                {
+                    session.idle_closed = true;
+                    actions.close.push(steam_id);
+                    self.stats.closed_idle += 1;
+                }
+            }
+            if current != session.state {
+                actions.transitions.push((steam_id, session.state, current));
+                session.state = current;
+            }
+        }
+        actions
+    }
+
+    /// Returns `(steam_id, state, pinned, idle_seconds)` for every tracked
+    /// peer.
+    pub fn sessions(&self, now: Instant) -> Vec<(u64, i32, bool, f64)> {
+        let mut sessions: Vec<_> = self
+            .peers
+            .iter()
+            .map(|(&steam_id, session)| {
+                (
+                    steam_id,
+                    session.state,
+                    session.pinned,
+                    now.duration_since(session.last_active).as_secs_f64(),
+                )
+            })
+            .collect();
+        sessions.sort_unstable_by_key(|session| session.0);
+        sessions
+    }
+
+    pub fn clear(&mut self) {
+        self.peers.clear();
+        self.lobby_generation = None;
+    }
+}
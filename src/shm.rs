@@ -0,0 +1,895 @@
+use std::{
+    collections::VecDeque,
+    fs::{self, OpenOptions},
+    io,
+    path::PathBuf,
+    ptr,
+    sync::{
+        atomic::{AtomicBool, AtomicU32, AtomicU64, Ordering},
+        Arc, Mutex,
+    },
+    thread::{self, JoinHandle},
+    time::{Duration, Instant},
+};
+
+use memmap2::{MmapOptions, MmapRaw};
+
+use crate::{
+    coalesce::{Frames, Unpacking},
+    net_client::send_result_code,
+    stats::NetStats,
+    transport::Transport,
+};
+
+const BUS_MAGIC: u64 = u64::from_le_bytes(*b"PYSNBUS1");
+const BUS_VERSION: u32 = 2;
+/// Bus header: magic, version, channel count, slot size, slot count, owner
+/// PID and the closed flag, padded to a cache line.
+const BUS_HEADER: usize = 64;
+/// Ring header: head, tail and the producer lock on separate cache lines.
+const RING_HEADER: usize = 192;
+/// Failed attempts between checks whether a ring lock's holder still exists.
+const LIVENESS_SPINS: u32 = 1024;
+/// Per-message header: length, kind, SteamID, channel and send flags.
+const ENTRY_HEADER: usize = 24;
+const ENTRY_MESSAGE: u32 = 0;
+const ENTRY_SKIP: u32 = 1;
+
+fn bus_path(name: &str) -> io::Result<PathBuf> {
+    if name.is_empty() || name.contains(['/', '\\']) {
+        return Err(io::Error::new(
+            io::ErrorKind::InvalidInput,
+            "Bus name must be non-empty and contain no path separators",
+        ));
+    }
+    let file = format!("py_steam_net-{name}");
+    if cfg!(target_os = "linux") {
+        Ok(PathBuf::from("/dev/shm").join(file))
+    } else {
+        Ok(std::env::temp_dir().join(file))
+    }
+}
+
+/// Whether process `pid` still exists. PIDs are reused, so a live PID does
+/// not prove the original owner is alive, but a missing one proves it died.
+#[cfg(unix)]
+fn process_alive(pid: u32) -> bool {
+    // Signal 0 only checks that the process exists.
+    let result = unsafe { libc::kill(pid as libc::pid_t, 0) };
+    result == 0 || io::Error::last_os_error().raw_os_error() != Some(libc::ESRCH)
+}
+
+/// Without a way to check, an owner is never assumed dead.
+#[cfg(not(unix))]
+fn process_alive(_pid: u32) -> bool {
+    true
+}
+
+/// Device and inode of a file, to tell whether a path still names the bus
+/// this process created.
+#[cfg(unix)]
+fn file_id(metadata: &fs::Metadata) -> Option<(u64, u64)> {
+    use std::os::unix::fs::MetadataExt;
+    Some((metadata.dev(), metadata.ino()))
+}
+
+/// Without a file identity, whatever is at the path is taken to be the bus.
+#[cfg(not(unix))]
+fn file_id(_metadata: &fs::Metadata) -> Option<(u64, u64)> {
+    None
+}
+
+fn ring_bytes(slot_size: usize, slot_count: usize) -> usize {
+    RING_HEADER + slot_size * slot_count
+}
+
+fn channel_table_bytes(channels: usize) -> usize {
+    (channels * 4).div_ceil(64) * 64
+}
+
+/// One message read from a ring. `data` points into the shared mapping and
+/// stays valid until the ring's tail passes `end`.
+pub struct Entry {
+    pub steam_id: u64,
+    pub channel: u32,
+    pub message_type: i32,
+    pub data: *const u8,
+    pub len: usize,
+    pub end: u64,
+}
+
+impl Entry {
+    /// # Safety
+    /// The tail must not have been advanced past this entry.
+    pub unsafe fn data(&self) -> &[u8] {
+        std::slice::from_raw_parts(self.data, self.len)
+    }
+}
+
+/// Ring of fixed-size slots in shared memory. A message takes as many
+/// consecutive slots as it needs, so slots hold the common case and larger
+/// messages overflow into the following ones. Positions count slots and
+/// only grow; a message that would wrap is preceded by a skip entry.
+pub struct Ring {
+    base: *mut u8,
+    slot_size: usize,
+    slot_count: usize,
+}
+
+// The ring only touches shared memory through atomics and the
+// producer/consumer protocol below.
+unsafe impl Send for Ring {}
+unsafe impl Sync for Ring {}
+
+pub struct RingLock<'a>(&'a Ring);
+
+impl Drop for RingLock<'_> {
+    fn drop(&mut self) {
+        self.0.lock_word().store(0, Ordering::Release);
+    }
+}
+
+impl Ring {
+    fn u64_at(&self, offset: usize) -> &AtomicU64 {
+        unsafe { &*(self.base.add(offset) as *const AtomicU64) }
+    }
+
+    fn u32_at(&self, offset: usize) -> &AtomicU32 {
+        unsafe { &*(self.base.add(offset) as *const AtomicU32) }
+    }
+
+    fn head(&self) -> &AtomicU64 {
+        self.u64_at(0)
+    }
+
+    fn tail(&self) -> &AtomicU64 {
+        self.u64_at(64)
+    }
+
+    fn lock_word(&self) -> &AtomicU32 {
+        self.u32_at(128)
+    }
+
+    fn consumer(&self) -> &AtomicU32 {
+        self.u32_at(132)
+    }
+
+    pub fn dropped(&self) -> &AtomicU64 {
+        self.u64_at(136)
+    }
+
+    fn slot(&self, index: usize) -> *mut u8 {
+        unsafe { self.base.add(RING_HEADER + index * self.slot_size) }
+    }
+
+    fn slots_for(&self, len: usize) -> usize {
+        (ENTRY_HEADER + len).div_ceil(self.slot_size)
+    }
+
+    /// Largest payload a single message may carry.
+    pub fn max_message(&self) -> usize {
+        self.slot_count * self.slot_size - ENTRY_HEADER
+    }
+
+    /// Slots currently in use.
+    pub fn queued(&self) -> u64 {
+        let tail = self.tail().load(Ordering::Acquire);
+        self.head().load(Ordering::Acquire).saturating_sub(tail)
+    }
+
+    /// Serializes producers, which may live in different processes. The
+    /// lock word holds the holder's PID, so a lock left behind by a process
+    /// that died holding it is taken over. A push only becomes visible when
+    /// it moves the head, so a half-written message is simply overwritten.
+    pub fn lock(&self) -> RingLock<'_> {
+        let pid = std::process::id();
+        let mut attempts = 0u32;
+        loop {
+            let owner = match self.lock_word().compare_exchange_weak(
+                0,
+                pid,
+                Ordering::Acquire,
+                Ordering::Relaxed,
+            ) {
+                Ok(_) => return RingLock(self),
+                Err(owner) => owner,
+            };
+            attempts = attempts.wrapping_add(1);
+            if owner != 0
+                && attempts % LIVENESS_SPINS == 0
+                && !process_alive(owner)
+                && self
+                    .lock_word()
+                    .compare_exchange(owner, pid, Ordering::Acquire, Ordering::Relaxed)
+                    .is_ok()
+            {
+                return RingLock(self);
+            }
+            thread::yield_now();
+        }
+    }
+
+    /// Claims the ring for the calling process as its only consumer, taking
+    /// it over if the previous owner exited without giving it up. Returns
+    /// the current owner's PID if a live process holds it.
+    pub fn claim(&self) -> Result<(), u32> {
+        let pid = std::process::id();
+        let mut expected = 0;
+        loop {
+            match self.consumer().compare_exchange(
+                expected,
+                pid,
+                Ordering::AcqRel,
+                Ordering::Acquire,
+            ) {
+                Ok(_) => return Ok(()),
+                Err(owner) if owner == pid => return Ok(()),
+                Err(owner) if owner == 0 || !process_alive(owner) => expected = owner,
+                Err(owner) => return Err(owner),
+            }
+        }
+    }
+
+    pub fn unclaim(&self) {
+        let _ = self.consumer().compare_exchange(
+            std::process::id(),
+            0,
+            Ordering::AcqRel,
+            Ordering::Relaxed,
+        );
+    }
+
+    unsafe fn write_header(
+        slot: *mut u8,
+        len: u32,
+        kind: u32,
+        steam_id: u64,
+        channel: u32,
+        message_type: i32,
+    ) {
+        ptr::write_unaligned(slot as *mut u32, len);
+        ptr::write_unaligned(slot.add(4) as *mut u32, kind);
+        ptr::write_unaligned(slot.add(8) as *mut u64, steam_id);
+        ptr::write_unaligned(slot.add(16) as *mut u32, channel);
+        ptr::write_unaligned(slot.add(20) as *mut i32, message_type);
+    }
+
+    /// Appends one message and returns `false` if it does not fit. Producers
+    /// that may race with each other must hold `lock()`.
+    pub fn push(&self, steam_id: u64, channel: u32, message_type: i32, data: &[u8]) -> bool {
+        let needed = self.slots_for(data.len());
+        if needed > self.slot_count {
+            return false;
+        }
+        let count = self.slot_count as u64;
+        let mut head = self.head().load(Ordering::Relaxed);
+        let tail = self.tail().load(Ordering::Acquire);
+        let index = (head % count) as usize;
+        let pad = if index + needed > self.slot_count {
+            self.slot_count - index
+        } else {
+            0
+        };
+        if head + (pad + needed) as u64 - tail > count {
+            return false;
+        }
+        unsafe {
+            if pad > 0 {
+                Self::write_header(self.slot(index), pad as u32, ENTRY_SKIP, 0, 0, 0);
+                head += pad as u64;
+            }
+            let slot = self.slot((head % count) as usize);
+            Self::write_header(
+                slot,
+                data.len() as u32,
+                ENTRY_MESSAGE,
+                steam_id,
+                channel,
+                message_type,
+            );
+            ptr::copy_nonoverlapping(data.as_ptr(), slot.add(ENTRY_HEADER), data.len());
+        }
+        self.head().store(head + needed as u64, Ordering::Release);
+        true
+    }
+
+    /// Reads the next published message at `position` and moves `position`
+    /// past it. Does not advance the tail.
+    pub fn read(&self, position: &mut u64) -> Option<Entry> {
+        let count = self.slot_count as u64;
+        loop {
+            if *position == self.head().load(Ordering::Acquire) {
+                return None;
+            }
+            let slot = self.slot((*position % count) as usize);
+            let (len, kind, steam_id, channel, message_type) = unsafe {
+                (
+                    ptr::read_unaligned(slot as *const u32) as usize,
+                    ptr::read_unaligned(slot.add(4) as *const u32),
+                    ptr::read_unaligned(slot.add(8) as *const u64),
+                    ptr::read_unaligned(slot.add(16) as *const u32),
+                    ptr::read_unaligned(slot.add(20) as *const i32),
+                )
+            };
+            if kind == ENTRY_SKIP {
+                *position += len as u64;
+                continue;
+            }
+            *position += self.slots_for(len) as u64;
+            return Some(Entry {
+                steam_id,
+                channel,
+                message_type,
+                data: unsafe { slot.add(ENTRY_HEADER) },
+                len,
+                end: *position,
+            });
+        }
+    }
+
+    pub fn tail_position(&self) -> u64 {
+        self.tail().load(Ordering::Acquire)
+    }
+
+    /// Frees every slot before `position` for the producer.
+    pub fn release_to(&self, position: u64) {
+        self.tail().store(position, Ordering::Release);
+    }
+}
+
+/// A named shared-memory segment holding an inbound and an outbound ring
+/// per channel. Created by the process that owns the client and attached to
+/// by workers.
+pub struct Bus {
+    map: MmapRaw,
+    path: PathBuf,
+    owner: bool,
+    /// `file_id` of the segment this owner created.
+    file_id: Option<(u64, u64)>,
+    channels: Vec<u32>,
+    inbound: Vec<Ring>,
+    outbound: Vec<Ring>,
+}
+
+impl Bus {
+    /// Creates the bus `name`. Fails if it already exists unless `replace`
+    /// is set, in which case the existing segment is unlinked first; anyone
+    /// still attached to it keeps their mapping but no longer shares it.
+    pub fn create(
+        name: &str,
+        channels: &[u32],
+        slot_count: usize,
+        slot_size: usize,
+        replace: bool,
+    ) -> io::Result<Self> {
+        if channels.is_empty() || slot_count == 0 {
+            return Err(io::Error::new(
+                io::ErrorKind::InvalidInput,
+                "A bus needs at least one channel and one slot",
+            ));
+        }
+        let path = bus_path(name)?;
+        // Slots are cache-line sized so headers stay aligned.
+        let slot_size = (slot_size.max(ENTRY_HEADER + 1)).div_ceil(64) * 64;
+        let rings_offset = BUS_HEADER + channel_table_bytes(channels.len());
+        let total = rings_offset + 2 * channels.len() * ring_bytes(slot_size, slot_count);
+
+        if replace {
+            match fs::remove_file(&path) {
+                Err(err) if err.kind() != io::ErrorKind::NotFound => return Err(err),
+                _ => {}
+            }
+        }
+        let file = OpenOptions::new()
+            .read(true)
+            .write(true)
+            .create_new(true)
+            .open(&path)
+            .map_err(|err| match err.kind() {
+                io::ErrorKind::AlreadyExists => io::Error::new(
+                    io::ErrorKind::AlreadyExists,
+                    format!("Bus {name:?} already exists; pass replace=True to replace it"),
+                ),
+                _ => err,
+            })?;
+        file.set_len(total as u64)?;
+        let map = MmapOptions::new().map_raw(&file)?;
+        let base = map.as_mut_ptr();
+        unsafe {
+            ptr::write_unaligned(base.add(8) as *mut u32, BUS_VERSION);
+            ptr::write_unaligned(base.add(12) as *mut u32, channels.len() as u32);
+            ptr::write_unaligned(base.add(16) as *mut u32, slot_size as u32);
+            ptr::write_unaligned(base.add(20) as *mut u32, slot_count as u32);
+            ptr::write_unaligned(base.add(24) as *mut u32, std::process::id());
+            for (index, &channel) in channels.iter().enumerate() {
+                ptr::write_unaligned(base.add(BUS_HEADER + index * 4) as *mut u32, channel);
+            }
+            // Published last, so attaching workers never see a partial header.
+            (*(base as *const AtomicU64)).store(BUS_MAGIC, Ordering::Release);
+        }
+        let mut bus = Self::layout(map, path, true, channels.to_vec(), slot_size, slot_count);
+        bus.file_id = file_id(&file.metadata()?);
+        Ok(bus)
+    }
+
+    pub fn open(name: &str) -> io::Result<Self> {
+        let path = bus_path(name)?;
+        let file = OpenOptions::new().read(true).write(true).open(&path)?;
+        let invalid = || io::Error::new(io::ErrorKind::InvalidData, "Not a py_steam_net bus");
+        if (file.metadata()?.len() as usize) < BUS_HEADER {
+            return Err(invalid());
+        }
+        let map = MmapOptions::new().map_raw(&file)?;
+        let base = map.as_mut_ptr();
+        let (magic, version, channel_count, slot_size, slot_count) = unsafe {
+            (
+                (*(base as *const AtomicU64)).load(Ordering::Acquire),
+                ptr::read_unaligned(base.add(8) as *const u32),
+                ptr::read_unaligned(base.add(12) as *const u32) as usize,
+                ptr::read_unaligned(base.add(16) as *const u32) as usize,
+                ptr::read_unaligned(base.add(20) as *const u32) as usize,
+            )
+        };
+        if magic != BUS_MAGIC || version != BUS_VERSION {
+            return Err(invalid());
+        }
+        let rings_offset = BUS_HEADER + channel_table_bytes(channel_count);
+        if map.len() < rings_offset + 2 * channel_count * ring_bytes(slot_size, slot_count) {
+            return Err(invalid());
+        }
+        let channels = (0..channel_count)
+            .map(|index| unsafe {
+                ptr::read_unaligned(base.add(BUS_HEADER + index * 4) as *const u32)
+            })
+            .collect();
+        Ok(Self::layout(
+            map, path, false, channels, slot_size, slot_count,
+        ))
+    }
+
+    fn layout(
+        map: MmapRaw,
+        path: PathBuf,
+        owner: bool,
+        channels: Vec<u32>,
+        slot_size: usize,
+        slot_count: usize,
+    ) -> Self {
+        let base = map.as_mut_ptr();
+        let ring_size = ring_bytes(slot_size, slot_count);
+        let mut offset = BUS_HEADER + channel_table_bytes(channels.len());
+        let mut ring = || {
+            let ring = Ring {
+                base: unsafe { base.add(offset) },
+                slot_size,
+                slot_count,
+            };
+            offset += ring_size;
+            ring
+        };
+        let mut inbound = Vec::with_capacity(channels.len());
+        let mut outbound = Vec::with_capacity(channels.len());
+        for _ in &channels {
+            inbound.push(ring());
+            outbound.push(ring());
+        }
+        Bus {
+            map,
+            path,
+            owner,
+            file_id: None,
+            channels,
+            inbound,
+            outbound,
+        }
+    }
+
+    fn closed_flag(&self) -> &AtomicU32 {
+        unsafe { &*(self.map.as_mut_ptr().add(28) as *const AtomicU32) }
+    }
+
+    pub fn channels(&self) -> &[u32] {
+        &self.channels
+    }
+
+    pub fn channel_index(&self, channel: u32) -> Option<usize> {
+        self.channels.iter().position(|&c| c == channel)
+    }
+
+    /// Ring carrying messages from the network to workers.
+    pub fn inbound(&self, index: usize) -> &Ring {
+        &self.inbound[index]
+    }
+
+    /// Ring carrying messages from workers to the network.
+    pub fn outbound(&self, index: usize) -> &Ring {
+        &self.outbound[index]
+    }
+
+    pub fn is_closed(&self) -> bool {
+        self.closed_flag().load(Ordering::Acquire) != 0
+    }
+}
+
+impl Drop for Bus {
+    /// The owner marks the bus closed and unlinks it, unless another bus
+    /// has replaced it at the same path since. Attached workers keep their
+    /// mapping until they drop it.
+    fn drop(&mut self) {
+        if self.owner {
+            self.closed_flag().store(1, Ordering::Release);
+            let current = fs::metadata(&self.path).map(|metadata| file_id(&metadata));
+            if current.is_ok_and(|current| current == self.file_id) {
+                let _ = fs::remove_file(&self.path);
+            }
+        }
+    }
+}
+
+pub struct BusHostShared {
+    running: AtomicBool,
+    pub forwarded_in: AtomicU64,
+    pub forwarded_out: AtomicU64,
+    pub ticks: AtomicU64,
+}
+
+/// Native thread in the owning process that moves received messages into
+/// the inbound rings and sends whatever workers put in the outbound rings.
+pub struct BusHost {
+    pub bus: Arc<Bus>,
+    pub shared: Arc<BusHostShared>,
+    handle: Mutex<Option<JoinHandle<()>>>,
+}
+
+impl BusHost {
+    pub fn start(
+        bus: Bus,
+        transport: Transport,
+        stats: Arc<NetStats>,
+        unpacking: Arc<Unpacking>,
+        interval: Duration,
+        max_messages: usize,
+    ) -> Self {
+        let bus = Arc::new(bus);
+        let shared = Arc::new(BusHostShared {
+            running: AtomicBool::new(true),
+            forwarded_in: AtomicU64::new(0),
+            forwarded_out: AtomicU64::new(0),
+            ticks: AtomicU64::new(0),
+        });
+
+        let thread_bus = bus.clone();
+        let thread_shared = shared.clone();
+        let handle = thread::Builder::new()
+            .name("py_steam_net-bus".into())
+            .spawn(move || {
+                while thread_shared.running.load(Ordering::Acquire) {
+                    let started = Instant::now();
+                    for (index, &channel) in thread_bus.channels().iter().enumerate() {
+                        let inbound = thread_bus.inbound(index);
+                        let unpack = unpacking.contains(channel);
+                        for (steam_id, message) in transport.receive(channel, max_messages, &stats)
+                        {
+                            let data = message.data();
+                            for (start, end) in Frames::new(data, unpack) {
+                                stats.record_receive(steam_id, channel, end - start);
+                                if inbound.push(steam_id, channel, 0, &data[start..end]) {
+                                    thread_shared.forwarded_in.fetch_add(1, Ordering::Relaxed);
+                                } else {
+                                    inbound.dropped().fetch_add(1, Ordering::Relaxed);
+                                }
+                            }
+                        }
+
+                        let outbound = thread_bus.outbound(index);
+                        let mut position = outbound.tail_position();
+                        let mut sent = 0;
+                        while sent < max_messages {
+                            let Some(entry) = outbound.read(&mut position) else {
+                                break;
+                            };
+                            let data = unsafe { entry.data() };
+                            let result =
+                                transport.send(entry.steam_id, entry.message_type, channel, data);
+                            let code = send_result_code(&result);
+                            stats.record_send(
+                                entry.steam_id,
+                                channel,
+                                data.len(),
+                                result.is_ok(),
+                                code,
+                            );
+                            sent += 1;
+                        }
+                        outbound.release_to(position);
+                        thread_shared
+                            .forwarded_out
+                            .fetch_add(sent as u64, Ordering::Relaxed);
+                    }
+                    thread_shared.ticks.fetch_add(1, Ordering::Relaxed);
+
+                    if let Some(remaining) = interval.checked_sub(started.elapsed()) {
+                        thread::park_timeout(remaining);
+                    }
+                }
+            })
+            .expect("failed to spawn bus thread");
+
+        BusHost {
+            bus,
+            shared,
+            handle: Mutex::new(Some(handle)),
+        }
+    }
+
+    pub fn is_running(&self) -> bool {
+        self.handle.lock().unwrap().is_some()
+    }
+
+    /// Signals the thread to exit and waits for it. Must be called without
+    /// holding the GIL.
+    pub fn stop(&self) {
+        self.shared.running.store(false, Ordering::Release);
+        let handle = self.handle.lock().unwrap().take();
+        if let Some(handle) = handle {
+            handle.thread().unpark();
+            let _ = handle.join();
+        }
+    }
+}
+
+impl Drop for BusHost {
+    /// Signals the thread without joining it, like `Pump`.
+    fn drop(&mut self) {
+        self.shared.running.store(false, Ordering::Release);
+        if let Some(handle) = self.handle.get_mut().unwrap().take() {
+            handle.thread().unpark();
+        }
+    }
+}
+
+struct ConsumerState {
+    position: u64,
+    first_seq: u64,
+    outstanding: VecDeque<(u64, bool)>,
+}
+
+/// A worker's claim on one inbound ring. Messages may be released out of
+/// order; the tail only advances past a prefix of released messages.
+pub struct Consumer {
+    bus: Arc<Bus>,
+    index: usize,
+    state: Mutex<ConsumerState>,
+}
+
+impl Consumer {
+    pub fn claim(bus: Arc<Bus>, index: usize) -> Result<Arc<Self>, u32> {
+        let ring = bus.inbound(index);
+        ring.claim()?;
+        let position = ring.tail_position();
+        Ok(Arc::new(Consumer {
+            bus,
+            index,
+            state: Mutex::new(ConsumerState {
+                position,
+                first_seq: 0,
+                outstanding: VecDeque::new(),
+            }),
+        }))
+    }
+
+    fn ring(&self) -> &Ring {
+        self.bus.inbound(self.index)
+    }
+
+    /// Reads up to `max_messages` entries. `keep` decides per entry whether
+    /// it stays reserved until `release(seq)`; others are freed at once.
+    pub fn take(&self, max_messages: usize, mut keep: impl FnMut(u64, &Entry) -> bool) {
+        let ring = self.ring();
+        let mut state = self.state.lock().unwrap();
+        let mut taken = 0;
+        while taken < max_messages {
+            let mut position = state.position;
+            let Some(entry) = ring.read(&mut position) else {
+                break;
+            };
+            state.position = position;
+            let seq = state.first_seq + state.outstanding.len() as u64;
+            let kept = keep(seq, &entry);
+            state.outstanding.push_back((entry.end, !kept));
+            taken += 1;
+        }
+        Self::advance(ring, &mut state);
+    }
+
+    pub fn release(&self, seq: u64) {
+        let mut state = self.state.lock().unwrap();
+        let offset = (seq - state.first_seq) as usize;
+        if let Some(slot) = state.outstanding.get_mut(offset) {
+            slot.1 = true;
+        }
+        Self::advance(self.ring(), &mut state);
+    }
+
+    fn advance(ring: &Ring, state: &mut ConsumerState) {
+        let mut tail = None;
+        while let Some(&(end, true)) = state.outstanding.front() {
+            tail = Some(end);
+            state.outstanding.pop_front();
+            state.first_seq += 1;
+        }
+        if let Some(tail) = tail {
+            ring.release_to(tail);
+        }
+    }
+}
+
+impl Drop for Consumer {
+    fn drop(&mut self) {
+        self.ring().unclaim();
+    }
+}
+
+/// A received message still in its inbound ring slot. The slot is handed
+/// back to the owner when this is dropped.
+pub struct SharedSlot {
+    consumer: Arc<Consumer>,
+    seq: u64,
+    data: *const u8,
+    len: usize,
+}
+
+impl SharedSlot {
+    pub fn new(consumer: Arc<Consumer>, seq: u64, entry: &Entry) -> Self {
+        SharedSlot {
+            consumer,
+            seq,
+            data: entry.data,
+            len: entry.len,
+        }
+    }
+
+    pub fn data(&self) -> &[u8] {
+        unsafe { std::slice::from_raw_parts(self.data, self.len) }
+    }
+}
+
+impl Drop for SharedSlot {
+    fn drop(&mut self) {
+        self.consumer.release(self.seq);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    #[cfg(unix)]
+    use std::process::Command;
+
+    use super::*;
+
+    fn bus(test: &str, slot_count: usize) -> Bus {
+        let name = format!("test-{test}-{}", std::process::id());
+        Bus::create(&name, &[0, 7], slot_count, 64, true).unwrap()
+    }
+
+    /// PID of a process that has exited and been reaped.
+    #[cfg(unix)]
+    fn dead_pid() -> u32 {
+        let mut child = Command::new("true").spawn().unwrap();
+        child.wait().unwrap();
+        child.id()
+    }
+
+    fn drain(ring: &Ring) -> Vec<(u64, Vec<u8>)> {
+        let mut position = ring.tail_position();
+        let mut messages = Vec::new();
+        while let Some(entry) = ring.read(&mut position) {
+            messages.push((entry.steam_id, unsafe { entry.data() }.to_vec()));
+        }
+        ring.release_to(position);
+        messages
+    }
+
+    #[test]
+    fn ring_round_trip_and_wrap() {
+        let bus = bus("wrap", 4);
+        let ring = bus.inbound(1);
+        // Slots are 64 bytes, so a 30-byte message takes one slot and a
+        // 60-byte message takes two.
+        for round in 0..5u8 {
+            assert!(ring.push(1, 7, 0, &[round; 30]));
+            assert!(ring.push(2, 7, 0, &[round; 60]));
+            assert_eq!(drain(ring), [(1, vec![round; 30]), (2, vec![round; 60])]);
+        }
+        assert_eq!(ring.queued(), 0);
+    }
+
+    #[test]
+    fn ring_rejects_when_full() {
+        let bus = bus("full", 2);
+        let ring = bus.outbound(0);
+        assert!(!ring.push(1, 0, 0, &vec![0; ring.max_message() + 1]));
+        assert!(ring.push(1, 0, 0, &[1; 30]));
+        assert!(ring.push(1, 0, 0, &[2; 30]));
+        assert!(!ring.push(1, 0, 0, &[3; 30]));
+        assert_eq!(drain(ring).len(), 2);
+        assert!(ring.push(1, 0, 0, &[3; 30]));
+    }
+
+    #[test]
+    fn open_sees_the_owner_bus() {
+        let name = format!("test-open-{}", std::process::id());
+        let owner = Bus::create(&name, &[3, 9], 8, 64, true).unwrap();
+        let worker = Bus::open(&name).unwrap();
+        assert_eq!(worker.channels(), [3, 9]);
+        assert_eq!(worker.channel_index(9), Some(1));
+        assert!(owner.inbound(1).push(5, 9, 0, b"hello"));
+        assert_eq!(drain(worker.inbound(1)), [(5, b"hello".to_vec())]);
+        drop(owner);
+        assert!(worker.is_closed());
+    }
+
+    #[test]
+    fn create_refuses_existing_bus() {
+        let name = format!("test-exists-{}", std::process::id());
+        let first = Bus::create(&name, &[0], 8, 64, true).unwrap();
+        let err = Bus::create(&name, &[0], 8, 64, false).err().unwrap();
+        assert_eq!(err.kind(), io::ErrorKind::AlreadyExists);
+        assert!(first.inbound(0).push(1, 0, 0, b"kept"));
+        assert_eq!(drain(first.inbound(0)).len(), 1);
+        let replaced = Bus::create(&name, &[0], 8, 64, true).unwrap();
+        assert_eq!(replaced.inbound(0).queued(), 0);
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn replaced_bus_outlives_previous_owner() {
+        let name = format!("test-replaced-{}", std::process::id());
+        let first = Bus::create(&name, &[0], 8, 64, true).unwrap();
+        let second = Bus::create(&name, &[4], 8, 64, true).unwrap();
+        drop(first);
+        assert_eq!(Bus::open(&name).unwrap().channels(), [4]);
+        drop(second);
+        assert!(Bus::open(&name).is_err());
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn claim_is_exclusive_while_owner_lives() {
+        let bus = bus("claim", 4);
+        let ring = bus.inbound(0);
+        assert_eq!(ring.claim(), Ok(()));
+        assert_eq!(ring.claim(), Ok(()));
+        ring.unclaim();
+
+        let mut child = Command::new("sleep").arg("5").spawn().unwrap();
+        ring.consumer().store(child.id(), Ordering::Release);
+        assert_eq!(ring.claim(), Err(child.id()));
+        child.kill().unwrap();
+        child.wait().unwrap();
+        assert_eq!(ring.claim(), Ok(()));
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn claim_of_dead_owner_is_taken_over() {
+        let bus = bus("dead-claim", 4);
+        let ring = bus.inbound(0);
+        ring.consumer().store(dead_pid(), Ordering::Release);
+        assert_eq!(ring.claim(), Ok(()));
+        assert_eq!(ring.consumer().load(Ordering::Acquire), std::process::id());
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn lock_of_dead_holder_is_taken_over() {
+        let bus = bus("dead-lock", 4);
+        let ring = bus.outbound(0);
+        ring.lock_word().store(dead_pid(), Ordering::Release);
+        {
+            let _lock = ring.lock();
+            assert_eq!(ring.lock_word().load(Ordering::Acquire), std::process::id());
+        }
+        assert_eq!(ring.lock_word().load(Ordering::Acquire), 0);
+    }
+}
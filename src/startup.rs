@@ -0,0 +1,163 @@
+use std::{
+    sync::{Condvar, Mutex},
+    time::{Duration, Instant},
+};
+
+use pyo3::{prelude::*, types::PyDict};
+
+/// `k_ESteamNetworkingAvailability_Current`: the relay network is usable.
+pub const RELAY_CURRENT: i32 = 100;
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+enum Phase {
+    Idle,
+    Starting,
+    Ready,
+    Failed,
+}
+
+struct Progress {
+    phase: Phase,
+    error: Option<String>,
+    started: Option<Instant>,
+    steam_init: Option<Duration>,
+    wiring: Option<Duration>,
+    ready: Option<Duration>,
+    relay_state: Option<i32>,
+    relay: Option<Duration>,
+}
+
+impl Default for Progress {
+    fn default() -> Self {
+        Progress {
+            phase: Phase::Idle,
+            error: None,
+            started: None,
+            steam_init: None,
+            wiring: None,
+            ready: None,
+            relay_state: None,
+            relay: None,
+        }
+    }
+}
+
+/// Where initialization is and how long each stage took. Waiters block on
+/// the condition variable until the client is ready or failed, and until
+/// the relay network is usable.
+#[derive(Default)]
+pub struct Startup {
+    progress: Mutex<Progress>,
+    changed: Condvar,
+}
+
+impl Startup {
+    /// Moves to the starting phase. Fails if initialization is already
+    /// under way or finished; a ready client has to be deinitialized first.
+    pub fn begin(&self) -> Result<(), &'static str> {
+        let mut progress = self.progress.lock().unwrap();
+        match progress.phase {
+            Phase::Starting => return Err("Initialization already in progress"),
+            Phase::Ready => return Err("Client already initialized; call deinit() first"),
+            Phase::Idle | Phase::Failed => {}
+        }
+        *progress = Progress {
+            phase: Phase::Starting,
+            started: Some(Instant::now()),
+            ..Progress::default()
+        };
+        Ok(())
+    }
+
+    pub fn steam_initialized(&self) {
+        let mut progress = self.progress.lock().unwrap();
+        progress.steam_init = progress.started.map(|started| started.elapsed());
+    }
+
+    pub fn finish(&self, result: Result<(), String>) {
+        let mut progress = self.progress.lock().unwrap();
+        let elapsed = progress.started.map(|started| started.elapsed());
+        match result {
+            Ok(()) => {
+                progress.phase = Phase::Ready;
+                progress.ready = elapsed;
+                progress.wiring = elapsed
+                    .zip(progress.steam_init)
+                    .map(|(ready, steam_init)| ready.saturating_sub(steam_init));
+            }
+            Err(error) => {
+                progress.phase = Phase::Failed;
+                progress.error = Some(error);
+            }
+        }
+        self.changed.notify_all();
+    }
+
+    /// Records the relay network availability, timing when it first
+    /// became usable. Returns `true` once it is.
+    pub fn relay_update(&self, state: i32) -> bool {
+        let mut progress = self.progress.lock().unwrap();
+        progress.relay_state = Some(state);
+        if state == RELAY_CURRENT && progress.relay.is_none() {
+            progress.relay = progress.started.map(|started| started.elapsed());
+            self.changed.notify_all();
+        }
+        state == RELAY_CURRENT
+    }
+
+    pub fn reset(&self) {
+        *self.progress.lock().unwrap() = Progress::default();
+        self.changed.notify_all();
+    }
+
+    /// Waits until initialization finished, and with `relay` until the relay
+    /// network is usable too. Returns `false` on timeout or failure.
+    pub fn wait(&self, timeout: Option<Duration>, relay: bool) -> bool {
+        let deadline = timeout.map(|timeout| Instant::now() + timeout);
+        let mut progress = self.progress.lock().unwrap();
+        loop {
+            match progress.phase {
+                Phase::Failed | Phase::Idle => return false,
+                Phase::Ready if !relay || progress.relay.is_some() => return true,
+                _ => {}
+            }
+            progress = match deadline {
+                Some(deadline) => {
+                    let now = Instant::now();
+                    if now >= deadline {
+                        return false;
+                    }
+                    self.changed
+                        .wait_timeout(progress, deadline - now)
+                        .unwrap()
+                        .0
+                }
+                None => self.changed.wait(progress).unwrap(),
+            };
+        }
+    }
+
+    pub fn to_dict<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let progress = self.progress.lock().unwrap();
+        let status = PyDict::new(py);
+        let phase = match progress.phase {
+            Phase::Idle => "idle",
+            Phase::Starting => "starting",
+            Phase::Ready => "ready",
+            Phase::Failed => "failed",
+        };
+        let ms = |duration: Option<Duration>| duration.map(|d| d.as_secs_f64() * 1000.0);
+        status.set_item("state", phase)?;
+        status.set_item("error", progress.error.as_deref())?;
+        status.set_item("steam_init_ms", ms(progress.steam_init))?;
+        status.set_item("wiring_ms", ms(progress.wiring))?;
+        status.set_item("ready_ms", ms(progress.ready))?;
+        status.set_item("relay_state", progress.relay_state)?;
+        status.set_item("relay_ms", ms(progress.relay))?;
+        status.set_item(
+            "elapsed_ms",
+            ms(progress.started.map(|started| started.elapsed())),
+        )?;
+        Ok(status)
+    }
+}
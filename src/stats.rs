@@ -0,0 +1,186 @@
+use std::{
+    collections::HashMap,
+    hash::Hash,
+    sync::{
+        atomic::{AtomicU64, Ordering},
+        Arc, Mutex, RwLock,
+    },
+    time::Duration,
+};
+
+use pyo3::{prelude::*, types::PyDict};
+
+fn take(counter: &AtomicU64, reset: bool) -> u64 {
+    if reset {
+        counter.swap(0, Ordering::Relaxed)
+    } else {
+        counter.load(Ordering::Relaxed)
+    }
+}
+
+#[derive(Default)]
+pub struct Counters {
+    messages_sent: AtomicU64,
+    bytes_sent: AtomicU64,
+    send_failures: AtomicU64,
+    messages_received: AtomicU64,
+    bytes_received: AtomicU64,
+}
+
+impl Counters {
+    fn to_dict<'py>(&self, py: Python<'py>, reset: bool) -> PyResult<Bound<'py, PyDict>> {
+        let dict = PyDict::new(py);
+        dict.set_item("messages_sent", take(&self.messages_sent, reset))?;
+        dict.set_item("bytes_sent", take(&self.bytes_sent, reset))?;
+        dict.set_item("send_failures", take(&self.send_failures, reset))?;
+        dict.set_item("messages_received", take(&self.messages_received, reset))?;
+        dict.set_item("bytes_received", take(&self.bytes_received, reset))?;
+        Ok(dict)
+    }
+}
+
+const HISTOGRAM_BUCKETS: usize = 32;
+
+/// Latency histogram with power-of-two microsecond buckets. Bucket `i`
+/// counts samples below `2**i` microseconds that did not fit bucket `i - 1`.
+pub struct Histogram {
+    buckets: [AtomicU64; HISTOGRAM_BUCKETS],
+    count: AtomicU64,
+    total_ns: AtomicU64,
+}
+
+impl Default for Histogram {
+    fn default() -> Self {
+        Histogram {
+            buckets: std::array::from_fn(|_| AtomicU64::new(0)),
+            count: AtomicU64::new(0),
+            total_ns: AtomicU64::new(0),
+        }
+    }
+}
+
+impl Histogram {
+    pub fn record(&self, elapsed: Duration) {
+        let micros = elapsed.as_micros() as u64;
+        let bucket = (u64::BITS - micros.leading_zeros()) as usize;
+        self.buckets[bucket.min(HISTOGRAM_BUCKETS - 1)].fetch_add(1, Ordering::Relaxed);
+        self.count.fetch_add(1, Ordering::Relaxed);
+        self.total_ns
+            .fetch_add(elapsed.as_nanos() as u64, Ordering::Relaxed);
+    }
+
+    fn to_dict<'py>(&self, py: Python<'py>, reset: bool) -> PyResult<Bound<'py, PyDict>> {
+        let dict = PyDict::new(py);
+        dict.set_item("count", take(&self.count, reset))?;
+        dict.set_item("total_us", take(&self.total_ns, reset) as f64 / 1000.0)?;
+        let buckets: Vec<u64> = self.buckets.iter().map(|b| take(b, reset)).collect();
+        dict.set_item("buckets", buckets)?;
+        Ok(dict)
+    }
+}
+
+/// Networking counters shared by the Python thread and the pump thread.
+/// Per-key counters are created once and then updated with relaxed atomics
+/// under a read lock.
+#[derive(Default)]
+pub struct NetStats {
+    peers: RwLock<HashMap<u64, Arc<Counters>>>,
+    channels: RwLock<HashMap<u32, Arc<Counters>>>,
+    send_failures_by_code: Mutex<HashMap<i32, u64>>,
+    identityless_drops: AtomicU64,
+    callback_exceptions: AtomicU64,
+    pub run_callbacks_time: Histogram,
+    pub receive_time: Histogram,
+    pub callback_time: Histogram,
+}
+
+fn counters<K: Copy + Eq + Hash>(map: &RwLock<HashMap<K, Arc<Counters>>>, key: K) -> Arc<Counters> {
+    if let Some(counters) = map.read().unwrap().get(&key) {
+        return counters.clone();
+    }
+    map.write().unwrap().entry(key).or_default().clone()
+}
+
+impl NetStats {
+    pub fn record_send(&self, steam_id: u64, channel: u32, bytes: usize, succeeded: bool, code: i32) {
+        for counters in [counters(&self.peers, steam_id), counters(&self.channels, channel)] {
+            if succeeded {
+                counters.messages_sent.fetch_add(1, Ordering::Relaxed);
+                counters.bytes_sent.fetch_add(bytes as u64, Ordering::Relaxed);
+            } else {
+                counters.send_failures.fetch_add(1, Ordering::Relaxed);
+            }
+        }
+        if !succeeded {
+            *self.send_failures_by_code.lock().unwrap().entry(code).or_default() += 1;
+        }
+    }
+
+    pub fn record_receive(&self, steam_id: u64, channel: u32, bytes: usize) {
+        for counters in [counters(&self.peers, steam_id), counters(&self.channels, channel)] {
+            counters.messages_received.fetch_add(1, Ordering::Relaxed);
+            counters.bytes_received.fetch_add(bytes as u64, Ordering::Relaxed);
+        }
+    }
+
+    /// Returns how many messages were sent to and received from `steam_id`.
+    pub fn peer_messages(&self, steam_id: u64) -> u64 {
+        self.peers
+            .read()
+            .unwrap()
+            .get(&steam_id)
+            .map_or(0, |counters| {
+                counters.messages_sent.load(Ordering::Relaxed)
+                    + counters.messages_received.load(Ordering::Relaxed)
+            })
+    }
+
+    /// Returns every peer traffic was sent to or received from.
+    pub fn peers(&self) -> Vec<u64> {
+        self.peers.read().unwrap().keys().copied().collect()
+    }
+
+    pub fn record_identityless_drop(&self) {
+        self.identityless_drops.fetch_add(1, Ordering::Relaxed);
+    }
+
+    pub fn record_callback(&self, elapsed: Duration, raised: bool) {
+        self.callback_time.record(elapsed);
+        if raised {
+            self.callback_exceptions.fetch_add(1, Ordering::Relaxed);
+        }
+    }
+
+    pub fn to_dict<'py>(&self, py: Python<'py>, reset: bool) -> PyResult<Bound<'py, PyDict>> {
+        let stats = PyDict::new(py);
+
+        let peers = PyDict::new(py);
+        for (steam_id, counters) in self.peers.read().unwrap().iter() {
+            peers.set_item(steam_id, counters.to_dict(py, reset)?)?;
+        }
+        stats.set_item("peers", peers)?;
+
+        let channels = PyDict::new(py);
+        for (channel, counters) in self.channels.read().unwrap().iter() {
+            channels.set_item(channel, counters.to_dict(py, reset)?)?;
+        }
+        stats.set_item("channels", channels)?;
+
+        let mut failures = self.send_failures_by_code.lock().unwrap();
+        stats.set_item("send_failures", failures.clone())?;
+        if reset {
+            failures.clear();
+        }
+
+        stats.set_item("identityless_drops", take(&self.identityless_drops, reset))?;
+        stats.set_item("callback_exceptions", take(&self.callback_exceptions, reset))?;
+
+        let timings = PyDict::new(py);
+        timings.set_item("run_callbacks", self.run_callbacks_time.to_dict(py, reset)?)?;
+        timings.set_item("receive", self.receive_time.to_dict(py, reset)?)?;
+        timings.set_item("callbacks", self.callback_time.to_dict(py, reset)?)?;
+        stats.set_item("timings", timings)?;
+
+        Ok(stats)
+    }
+}
@@ -0,0 +1,715 @@
+use std::{
+    collections::{HashMap, VecDeque},
+    fs::{File, OpenOptions},
+    io,
+    path::Path,
+};
+
+use memmap2::{Mmap, MmapMut};
+
+/// Transfer messages, identified by their first byte.
+const MSG_OFFER: u8 = 1;
+const MSG_CHUNK: u8 = 2;
+/// Sent by the sender to abort.
+const MSG_CANCEL: u8 = 3;
+/// Sent by the receiver to reject or abort.
+const MSG_REFUSE: u8 = 4;
+const MSG_COMPLETE: u8 = 5;
+/// Sent by the receiver once it has room for the transfer.
+const MSG_ACCEPT: u8 = 6;
+
+/// Header of a chunk: kind, transfer ID and offset.
+const CHUNK_HEADER: usize = 17;
+
+/// Flags used for every transfer message: `k_nSteamNetworkingSend_Reliable`.
+pub const TRANSFER_SEND_FLAGS: i32 = 8;
+
+/// Send result codes the pacing loop tells apart.
+const SEND_OK: i32 = 1;
+const SEND_LIMIT_EXCEEDED: i32 = 25;
+
+/// Payload being sent, either copied from Python or mapped from a file.
+pub enum Source {
+    Memory(Vec<u8>),
+    File(Mmap),
+}
+
+impl Source {
+    pub fn open(path: &Path) -> io::Result<Self> {
+        let file = File::open(path)?;
+        if file.metadata()?.len() == 0 {
+            return Ok(Source::Memory(Vec::new()));
+        }
+        Ok(Source::File(unsafe { Mmap::map(&file)? }))
+    }
+
+    fn data(&self) -> &[u8] {
+        match self {
+            Source::Memory(data) => data,
+            Source::File(map) => map,
+        }
+    }
+}
+
+/// Where an accepted transfer is reassembled. Both are allocated to the
+/// full size when the offer is accepted.
+enum Sink {
+    Memory(Vec<u8>),
+    File(MmapMut, String),
+}
+
+impl Sink {
+    fn data_mut(&mut self) -> &mut [u8] {
+        match self {
+            Sink::Memory(data) => data,
+            Sink::File(map, _) => map,
+        }
+    }
+}
+
+/// How to store an offered transfer, as decided by the transfer callback.
+pub enum Accept {
+    Memory,
+    File(String),
+    Reject,
+}
+
+/// Completed payload handed to Python.
+pub enum Payload {
+    Memory(Vec<u8>),
+    File(String),
+}
+
+pub enum TransferEvent {
+    Offer {
+        steam_id: u64,
+        id: u64,
+        total: u64,
+        name: String,
+    },
+    SendProgress {
+        steam_id: u64,
+        id: u64,
+        done: u64,
+        total: u64,
+    },
+    RecvProgress {
+        steam_id: u64,
+        id: u64,
+        done: u64,
+        total: u64,
+    },
+    Sent {
+        steam_id: u64,
+        id: u64,
+        total: u64,
+    },
+    Received {
+        steam_id: u64,
+        id: u64,
+        total: u64,
+        payload: Payload,
+    },
+    Cancelled {
+        steam_id: u64,
+        id: u64,
+        done: u64,
+        total: u64,
+    },
+}
+
+struct Outgoing {
+    steam_id: u64,
+    id: u64,
+    name: String,
+    source: Source,
+    sent: u64,
+    offered: bool,
+    accepted: bool,
+}
+
+struct Incoming {
+    total: u64,
+    received: u64,
+    sink: Sink,
+}
+
+/// Send and receive state of every large-payload transfer. Outgoing
+/// transfers are chunked onto one reliable channel and paced per tick, so
+/// other channels sharing the session keep their latency.
+pub struct Transfers {
+    pub channel: u32,
+    pub chunk_size: usize,
+    pub window_bytes: usize,
+    pub tick_bytes: usize,
+    pub max_memory: usize,
+    next_id: u64,
+    outgoing: VecDeque<Outgoing>,
+    incoming: HashMap<(u64, u64), Incoming>,
+    memory_in_use: usize,
+}
+
+impl Transfers {
+    pub fn new(
+        channel: u32,
+        chunk_size: usize,
+        window_bytes: usize,
+        tick_bytes: usize,
+        max_memory: usize,
+    ) -> Self {
+        Transfers {
+            channel,
+            chunk_size: chunk_size.max(1),
+            window_bytes,
+            tick_bytes,
+            max_memory,
+            next_id: 1,
+            outgoing: VecDeque::new(),
+            incoming: HashMap::new(),
+            memory_in_use: 0,
+        }
+    }
+
+    /// Queues `source` for `steam_id` and returns the transfer ID.
+    pub fn start(&mut self, steam_id: u64, name: String, source: Source) -> u64 {
+        let id = self.next_id;
+        self.next_id += 1;
+        self.outgoing.push_back(Outgoing {
+            steam_id,
+            id,
+            name,
+            source,
+            sent: 0,
+            offered: false,
+            accepted: false,
+        });
+        id
+    }
+
+    /// Sends offers and chunks for this tick. Chunks only follow once the
+    /// peer accepted the offer, and only while its queued and unacknowledged
+    /// reliable bytes reported by `pending` stay below `window_bytes`,
+    /// and all transfers together send at most `tick_bytes`. Transfers take
+    /// turns being first so one cannot starve the others. `send` returns a
+    /// send result code; a full send queue is retried on the next tick and
+    /// any other failure cancels the transfer.
+    pub fn pump(
+        &mut self,
+        pending: impl Fn(u64) -> usize,
+        mut send: impl FnMut(u64, &[u8]) -> i32,
+    ) -> Vec<TransferEvent> {
+        let mut events = Vec::new();
+        let mut budget = self.tick_bytes;
+        let mut failed = Vec::new();
+        for outgoing in self.outgoing.iter_mut() {
+            let total = outgoing.source.data().len() as u64;
+            if !outgoing.offered {
+                let mut offer = Vec::with_capacity(19 + outgoing.name.len());
+                offer.push(MSG_OFFER);
+                offer.extend_from_slice(&outgoing.id.to_le_bytes());
+                offer.extend_from_slice(&total.to_le_bytes());
+                offer.extend_from_slice(&(outgoing.name.len() as u16).to_le_bytes());
+                offer.extend_from_slice(outgoing.name.as_bytes());
+                match send(outgoing.steam_id, &offer) {
+                    SEND_OK => {}
+                    SEND_LIMIT_EXCEEDED => continue,
+                    _ => {
+                        failed.push((outgoing.steam_id, outgoing.id));
+                        continue;
+                    }
+                }
+                outgoing.offered = true;
+            }
+            if !outgoing.accepted {
+                continue;
+            }
+            let started = outgoing.sent;
+            let mut in_flight = pending(outgoing.steam_id);
+            let mut chunk = Vec::with_capacity(CHUNK_HEADER + self.chunk_size);
+            while outgoing.sent < total && budget > 0 && in_flight < self.window_bytes {
+                let start = outgoing.sent as usize;
+                let end = (start + self.chunk_size).min(total as usize);
+                chunk.clear();
+                chunk.push(MSG_CHUNK);
+                chunk.extend_from_slice(&outgoing.id.to_le_bytes());
+                chunk.extend_from_slice(&outgoing.sent.to_le_bytes());
+                chunk.extend_from_slice(&outgoing.source.data()[start..end]);
+                match send(outgoing.steam_id, &chunk) {
+                    SEND_OK => {}
+                    SEND_LIMIT_EXCEEDED => break,
+                    _ => {
+                        failed.push((outgoing.steam_id, outgoing.id));
+                        break;
+                    }
+                }
+                outgoing.sent = end as u64;
+                in_flight += end - start;
+                budget = budget.saturating_sub(end - start);
+            }
+            if outgoing.sent != started {
+                events.push(TransferEvent::SendProgress {
+                    steam_id: outgoing.steam_id,
+                    id: outgoing.id,
+                    done: outgoing.sent,
+                    total,
+                });
+            }
+        }
+        for (steam_id, id) in failed {
+            if let Some(event) = self.cancel_outgoing(steam_id, id) {
+                events.push(event);
+            }
+        }
+        self.outgoing
+            .rotate_left(usize::from(!self.outgoing.is_empty()));
+        events
+    }
+
+    /// Forgets every transfer without telling peers, e.g. after `deinit`.
+    pub fn clear(&mut self) {
+        self.outgoing.clear();
+        self.incoming.clear();
+        self.memory_in_use = 0;
+    }
+
+    /// Parses one message from the transfer channel. Returns a reply for the
+    /// sender, if any, and the resulting event. Offers must be answered with
+    /// `accept`.
+    pub fn handle(
+        &mut self,
+        steam_id: u64,
+        data: &[u8],
+    ) -> (Option<Vec<u8>>, Option<TransferEvent>) {
+        let Some((&kind, rest)) = data.split_first() else {
+            return (None, None);
+        };
+        let Some(id) = read_u64(rest, 0) else {
+            return (None, None);
+        };
+        match kind {
+            MSG_OFFER => (None, parse_offer(steam_id, id, &rest[8..])),
+            MSG_CHUNK => {
+                let Some(offset) = read_u64(rest, 8) else {
+                    return (None, None);
+                };
+                let chunk = &rest[16..];
+                let Some(incoming) = self.incoming.get_mut(&(steam_id, id)) else {
+                    return (None, None);
+                };
+                let end = offset + chunk.len() as u64;
+                // Chunks arrive in order on a reliable channel.
+                if offset != incoming.received || end > incoming.total {
+                    let event = self.drop_incoming(steam_id, id);
+                    return (Some(control(MSG_REFUSE, id)), event);
+                }
+                incoming.sink.data_mut()[offset as usize..end as usize].copy_from_slice(chunk);
+                incoming.received = end;
+                if end == incoming.total {
+                    return (
+                        Some(control(MSG_COMPLETE, id)),
+                        self.finish_incoming(steam_id, id),
+                    );
+                }
+                let event = TransferEvent::RecvProgress {
+                    steam_id,
+                    id,
+                    done: end,
+                    total: incoming.total,
+                };
+                (None, Some(event))
+            }
+            MSG_ACCEPT => {
+                if let Some(index) = self.outgoing_index(steam_id, id) {
+                    self.outgoing[index].accepted = true;
+                }
+                (None, None)
+            }
+            MSG_CANCEL => (None, self.drop_incoming(steam_id, id)),
+            MSG_REFUSE => (None, self.cancel_outgoing(steam_id, id)),
+            MSG_COMPLETE => {
+                let Some(index) = self.outgoing_index(steam_id, id) else {
+                    return (None, None);
+                };
+                let outgoing = self.outgoing.remove(index).unwrap();
+                let event = TransferEvent::Sent {
+                    steam_id,
+                    id,
+                    total: outgoing.source.data().len() as u64,
+                };
+                (None, Some(event))
+            }
+            _ => (None, None),
+        }
+    }
+
+    /// Applies the decision for an offer. Returns the reply for the sender,
+    /// accepting, completing or refusing it, and an event if the transfer
+    /// already ended.
+    pub fn accept(
+        &mut self,
+        steam_id: u64,
+        id: u64,
+        total: u64,
+        accept: Accept,
+    ) -> io::Result<(Option<Vec<u8>>, Option<TransferEvent>)> {
+        let fits = self.memory_in_use as u64 + total <= self.max_memory as u64;
+        if total == 0 && !matches!(accept, Accept::Reject) {
+            let payload = match accept {
+                Accept::File(path) => {
+                    File::create(&path)?;
+                    Payload::File(path)
+                }
+                _ => Payload::Memory(Vec::new()),
+            };
+            let event = TransferEvent::Received {
+                steam_id,
+                id,
+                total,
+                payload,
+            };
+            return Ok((Some(control(MSG_COMPLETE, id)), Some(event)));
+        }
+        let sink = match accept {
+            Accept::Memory if fits => {
+                self.memory_in_use += total as usize;
+                Sink::Memory(vec![0; total as usize])
+            }
+            Accept::File(path) => {
+                let file = OpenOptions::new()
+                    .read(true)
+                    .write(true)
+                    .create(true)
+                    .truncate(true)
+                    .open(&path)?;
+                file.set_len(total)?;
+                Sink::File(unsafe { MmapMut::map_mut(&file)? }, path)
+            }
+            Accept::Memory | Accept::Reject => {
+                let event = TransferEvent::Cancelled {
+                    steam_id,
+                    id,
+                    done: 0,
+                    total,
+                };
+                return Ok((Some(control(MSG_REFUSE, id)), Some(event)));
+            }
+        };
+        self.incoming.insert(
+            (steam_id, id),
+            Incoming {
+                total,
+                received: 0,
+                sink,
+            },
+        );
+        Ok((Some(control(MSG_ACCEPT, id)), None))
+    }
+
+    /// Cancels a transfer with `steam_id` in either direction. `incoming`
+    /// selects transfers this client receives. Returns the message telling
+    /// the peer and the resulting event.
+    pub fn cancel(
+        &mut self,
+        steam_id: u64,
+        id: u64,
+        incoming: bool,
+    ) -> Option<(Vec<u8>, TransferEvent)> {
+        if incoming {
+            let event = self.drop_incoming(steam_id, id)?;
+            Some((control(MSG_REFUSE, id), event))
+        } else {
+            let event = self.cancel_outgoing(steam_id, id)?;
+            Some((control(MSG_CANCEL, id), event))
+        }
+    }
+
+    fn outgoing_index(&self, steam_id: u64, id: u64) -> Option<usize> {
+        self.outgoing
+            .iter()
+            .position(|o| o.id == id && o.steam_id == steam_id)
+    }
+
+    fn cancel_outgoing(&mut self, steam_id: u64, id: u64) -> Option<TransferEvent> {
+        let index = self.outgoing_index(steam_id, id)?;
+        let outgoing = self.outgoing.remove(index)?;
+        Some(TransferEvent::Cancelled {
+            steam_id,
+            id,
+            done: outgoing.sent,
+            total: outgoing.source.data().len() as u64,
+        })
+    }
+
+    fn drop_incoming(&mut self, steam_id: u64, id: u64) -> Option<TransferEvent> {
+        let incoming = self.incoming.remove(&(steam_id, id))?;
+        if let Sink::Memory(_) = incoming.sink {
+            self.memory_in_use -= incoming.total as usize;
+        }
+        Some(TransferEvent::Cancelled {
+            steam_id,
+            id,
+            done: incoming.received,
+            total: incoming.total,
+        })
+    }
+
+    fn finish_incoming(&mut self, steam_id: u64, id: u64) -> Option<TransferEvent> {
+        let incoming = self.incoming.remove(&(steam_id, id))?;
+        let payload = match incoming.sink {
+            Sink::Memory(data) => {
+                self.memory_in_use -= incoming.total as usize;
+                Payload::Memory(data)
+            }
+            Sink::File(map, path) => {
+                let _ = map.flush();
+                Payload::File(path)
+            }
+        };
+        Some(TransferEvent::Received {
+            steam_id,
+            id,
+            total: incoming.total,
+            payload,
+        })
+    }
+}
+
+fn read_u64(data: &[u8], offset: usize) -> Option<u64> {
+    Some(u64::from_le_bytes(
+        data.get(offset..offset + 8)?.try_into().ok()?,
+    ))
+}
+
+fn parse_offer(steam_id: u64, id: u64, data: &[u8]) -> Option<TransferEvent> {
+    let total = read_u64(data, 0)?;
+    let name_len = u16::from_le_bytes(data.get(8..10)?.try_into().ok()?) as usize;
+    let name = String::from_utf8_lossy(data.get(10..10 + name_len)?).into_owned();
+    Some(TransferEvent::Offer {
+        steam_id,
+        id,
+        total,
+        name,
+    })
+}
+
+fn control(kind: u8, id: u64) -> Vec<u8> {
+    let mut message = Vec::with_capacity(9);
+    message.push(kind);
+    message.extend_from_slice(&id.to_le_bytes());
+    message
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const A: u64 = 1;
+    const B: u64 = 2;
+
+    fn transfers(chunk_size: usize, tick_bytes: usize) -> Transfers {
+        Transfers::new(250, chunk_size, 1 << 20, tick_bytes, 1 << 20)
+    }
+
+    /// Starts a transfer its peer has already accepted.
+    fn start_accepted(sender: &mut Transfers, payload: Vec<u8>) -> u64 {
+        let id = sender.start(B, String::new(), Source::Memory(payload));
+        sender.handle(B, &control(MSG_ACCEPT, id));
+        id
+    }
+
+    fn pump(sender: &mut Transfers) -> Vec<Vec<u8>> {
+        let mut sent = Vec::new();
+        sender.pump(
+            |_| 0,
+            |_, data| {
+                sent.push(data.to_vec());
+                SEND_OK
+            },
+        );
+        sent
+    }
+
+    /// Delivers `messages` to `receiver`, accepting offers with `accept`,
+    /// and returns its replies and events.
+    fn deliver(
+        receiver: &mut Transfers,
+        messages: Vec<Vec<u8>>,
+        accept: impl Fn() -> Accept,
+    ) -> (Vec<Vec<u8>>, Vec<TransferEvent>) {
+        let mut replies = Vec::new();
+        let mut events = Vec::new();
+        for message in messages {
+            let (reply, event) = receiver.handle(A, &message);
+            replies.extend(reply);
+            let (reply, event) = match event {
+                Some(TransferEvent::Offer { id, total, .. }) => {
+                    receiver.accept(A, id, total, accept()).unwrap()
+                }
+                event => (None, event),
+            };
+            replies.extend(reply);
+            events.extend(event);
+        }
+        (replies, events)
+    }
+
+    fn received(events: &[TransferEvent]) -> Option<&Payload> {
+        events.iter().find_map(|event| match event {
+            TransferEvent::Received { payload, .. } => Some(payload),
+            _ => None,
+        })
+    }
+
+    #[test]
+    fn payload_is_chunked_and_reassembled() {
+        let payload: Vec<u8> = (0..2500u32).map(|i| i as u8).collect();
+        let mut sender = transfers(1000, 1 << 20);
+        let mut receiver = transfers(1000, 1 << 20);
+        let id = sender.start(B, "data".into(), Source::Memory(payload.clone()));
+        let offer = pump(&mut sender);
+        assert_eq!(offer.len(), 1);
+        let (replies, _) = deliver(&mut receiver, offer, || Accept::Memory);
+        assert_eq!(replies, [control(MSG_ACCEPT, id)]);
+        sender.handle(B, &replies[0]);
+
+        let messages = pump(&mut sender);
+        assert_eq!(messages.len(), 3);
+        assert_eq!(messages[2].len(), CHUNK_HEADER + 500);
+        let (replies, events) = deliver(&mut receiver, messages, || Accept::Memory);
+        match received(&events) {
+            Some(Payload::Memory(data)) => assert_eq!(data, &payload),
+            _ => panic!("transfer not received"),
+        }
+        assert_eq!(receiver.memory_in_use, 0);
+        assert_eq!(replies, [control(MSG_COMPLETE, id)]);
+
+        let (_, event) = sender.handle(B, &replies[0]);
+        assert!(matches!(
+            event,
+            Some(TransferEvent::Sent { total: 2500, .. })
+        ));
+        assert!(sender.outgoing.is_empty());
+    }
+
+    #[test]
+    fn chunks_wait_for_accept() {
+        let mut sender = transfers(100, 1 << 20);
+        let id = sender.start(B, String::new(), Source::Memory(vec![0; 300]));
+        assert_eq!(pump(&mut sender).len(), 1);
+        assert!(pump(&mut sender).is_empty());
+        sender.handle(B, &control(MSG_ACCEPT, id));
+        assert_eq!(pump(&mut sender).len(), 3);
+
+        // A refused transfer never sends a chunk.
+        let id = sender.start(B, String::new(), Source::Memory(vec![0; 300]));
+        assert_eq!(pump(&mut sender).len(), 1);
+        let (_, event) = sender.handle(B, &control(MSG_REFUSE, id));
+        assert!(matches!(
+            event,
+            Some(TransferEvent::Cancelled { done: 0, .. })
+        ));
+        assert!(pump(&mut sender).is_empty());
+    }
+
+    #[test]
+    fn tick_budget_paces_chunks() {
+        let mut sender = transfers(100, 200);
+        start_accepted(&mut sender, vec![0; 1000]);
+        assert_eq!(pump(&mut sender).len(), 3);
+        assert_eq!(pump(&mut sender).len(), 2);
+        assert_eq!(sender.outgoing[0].sent, 400);
+    }
+
+    #[test]
+    fn window_limits_unacknowledged_bytes() {
+        let mut sender = Transfers::new(250, 100, 300, 1 << 20, 1 << 20);
+        start_accepted(&mut sender, vec![0; 1000]);
+        sender.pump(|_| 250, |_, _| SEND_OK);
+        assert_eq!(sender.outgoing[0].sent, 100);
+    }
+
+    #[test]
+    fn full_send_queue_resumes_next_tick() {
+        let payload: Vec<u8> = (0..300u32).map(|i| i as u8).collect();
+        let mut sender = transfers(100, 1 << 20);
+        let mut receiver = transfers(100, 1 << 20);
+        start_accepted(&mut sender, payload.clone());
+
+        let mut messages = Vec::new();
+        let events = sender.pump(
+            |_| 0,
+            |_, data| {
+                if messages.len() == 2 {
+                    return SEND_LIMIT_EXCEEDED;
+                }
+                messages.push(data.to_vec());
+                SEND_OK
+            },
+        );
+        assert!(matches!(
+            events[..],
+            [TransferEvent::SendProgress { done: 100, .. }]
+        ));
+        messages.extend(pump(&mut sender));
+
+        let (_, events) = deliver(&mut receiver, messages, || Accept::Memory);
+        match received(&events) {
+            Some(Payload::Memory(data)) => assert_eq!(data, &payload),
+            _ => panic!("transfer not received"),
+        }
+    }
+
+    #[test]
+    fn failed_send_cancels() {
+        let mut sender = transfers(100, 1 << 20);
+        sender.start(B, String::new(), Source::Memory(vec![0; 300]));
+        let events = sender.pump(|_| 0, |_, _| 2);
+        assert!(matches!(events[..], [TransferEvent::Cancelled { .. }]));
+        assert!(sender.outgoing.is_empty());
+    }
+
+    #[test]
+    fn offer_over_memory_limit_is_refused() {
+        let mut sender = transfers(100, 1 << 20);
+        let mut receiver = Transfers::new(250, 100, 1 << 20, 1 << 20, 50);
+        let id = sender.start(B, String::new(), Source::Memory(vec![0; 100]));
+        let messages = pump(&mut sender);
+        let (replies, events) = deliver(&mut receiver, messages, || Accept::Memory);
+        assert!(matches!(
+            events[..],
+            [TransferEvent::Cancelled { done: 0, .. }]
+        ));
+        assert_eq!(replies, [control(MSG_REFUSE, id)]);
+        let (_, event) = sender.handle(B, &replies[0]);
+        assert!(matches!(event, Some(TransferEvent::Cancelled { .. })));
+    }
+
+    #[test]
+    fn out_of_order_chunk_aborts() {
+        let mut sender = transfers(100, 1 << 20);
+        let mut receiver = transfers(100, 1 << 20);
+        let id = start_accepted(&mut sender, vec![0; 300]);
+        let mut messages = pump(&mut sender);
+        messages.remove(1);
+        let (replies, events) = deliver(&mut receiver, messages, || Accept::Memory);
+        assert_eq!(replies, [control(MSG_ACCEPT, id), control(MSG_REFUSE, id)]);
+        assert!(matches!(events[..], [TransferEvent::Cancelled { .. }]));
+        assert_eq!(receiver.memory_in_use, 0);
+    }
+
+    #[test]
+    fn file_sink_receives_payload() {
+        let path =
+            std::env::temp_dir().join(format!("py_steam_net-transfer-test-{}", std::process::id()));
+        let path_str = path.to_string_lossy().into_owned();
+        let payload = vec![42u8; 250];
+        let mut sender = transfers(100, 1 << 20);
+        let mut receiver = transfers(100, 1 << 20);
+        start_accepted(&mut sender, payload.clone());
+        let messages = pump(&mut sender);
+        let (_, events) = deliver(&mut receiver, messages, || Accept::File(path_str.clone()));
+        assert!(matches!(received(&events), Some(Payload::File(p)) if *p == path_str));
+        assert_eq!(std::fs::read(&path).unwrap(), payload);
+        std::fs::remove_file(&path).unwrap();
+    }
+}
@@ -0,0 +1,448 @@
+use std::{
+    io,
+    ops::Range,
+    path::{Path, PathBuf},
+    sync::{Arc, Mutex},
+    time::Instant,
+};
+
+use memmap2::Mmap;
+
+use steamworks::{
+    networking_messages::NetworkingMessages,
+    networking_types::{NetworkingIdentity, NetworkingMessage, SendFlags},
+    sys, CallbackHandle, Client, ClientManager, LobbyChatUpdate, LobbyId, LobbyType, SteamError,
+    SteamId,
+};
+
+use crate::{
+    capture::{Recorder, ReplayPeer},
+    loopback::{LinkConditions, LoopbackPeer},
+    pump::CallbackRunner,
+    session::{connection_state_code, SessionStatus},
+    shm::SharedSlot,
+    startup::RELAY_CURRENT,
+    stats::NetStats,
+};
+
+/// Lobby member state changes, numbered like Steam's `EChatMemberStateChange`.
+pub const MEMBER_ENTERED: u64 = 0x01;
+pub const MEMBER_LEFT: u64 = 0x02;
+pub const MEMBER_DISCONNECTED: u64 = 0x04;
+
+/// A `LobbyChatUpdate` reduced to raw IDs, shared by both backends.
+#[derive(Clone, Copy)]
+pub struct LobbyUpdate {
+    pub lobby: u64,
+    pub user_changed: u64,
+    pub making_change: u64,
+    pub state: u64,
+}
+
+/// Networking backend selected at `init` time.
+pub enum Backend {
+    Steam,
+    Loopback(LinkConditions),
+    /// Capture log to play back and the speed to play it at.
+    Replay(PathBuf, f64),
+}
+
+/// A received message: still in Steam's receive buffer, an owned copy
+/// delivered by the loopback backend, a slot in a shared-memory bus, or a
+/// range of a replayed capture log.
+pub enum Received {
+    Steam(NetworkingMessage<ClientManager>),
+    Owned(Vec<u8>),
+    Shared(SharedSlot),
+    Mapped(Arc<Mmap>, Range<usize>),
+}
+
+// A received message is owned by whoever holds it and released through
+// `ISteamNetworkingMessage::Release`, which is thread safe.
+unsafe impl Send for Received {}
+
+impl Received {
+    pub fn data(&self) -> &[u8] {
+        match self {
+            Received::Steam(message) => message.data(),
+            Received::Owned(data) => data,
+            Received::Shared(slot) => slot.data(),
+            Received::Mapped(log, range) => &log[range.clone()],
+        }
+    }
+}
+
+pub struct SteamTransport {
+    client: Client,
+    messages: NetworkingMessages<ClientManager>,
+    callbacks: Arc<Mutex<Vec<CallbackHandle>>>,
+}
+
+// `ISteamNetworkingMessages` may be called from any thread; the wrapper only
+// holds the interface pointer.
+unsafe impl Send for SteamTransport {}
+unsafe impl Sync for SteamTransport {}
+
+impl Clone for SteamTransport {
+    fn clone(&self) -> Self {
+        SteamTransport {
+            client: self.client.clone(),
+            messages: self.client.networking_messages(),
+            callbacks: self.callbacks.clone(),
+        }
+    }
+}
+
+/// The networking and lobby operations `PySteamClient` needs, implemented
+/// by Steam, by in-process loopback clients or by a capture replay.
+/// Received messages and events can be recorded to a capture log.
+#[derive(Clone)]
+pub struct Transport {
+    driver: Driver,
+    capture: Arc<Mutex<Option<Recorder>>>,
+}
+
+#[derive(Clone)]
+enum Driver {
+    Steam(SteamTransport),
+    Loopback(Arc<LoopbackPeer>),
+    Replay(Arc<ReplayPeer>),
+}
+
+impl Transport {
+    pub fn init(app_id: u32, backend: Backend) -> Result<(Self, CallbackRunner), String> {
+        let (driver, runner) = match backend {
+            Backend::Steam => {
+                let (client, single) = Client::init_app(app_id).map_err(|e| e.to_string())?;
+                let transport = SteamTransport {
+                    messages: client.networking_messages(),
+                    client,
+                    callbacks: Arc::new(Mutex::new(Vec::new())),
+                };
+                (Driver::Steam(transport), CallbackRunner::Steam(single))
+            }
+            Backend::Loopback(conditions) => {
+                let peer = LoopbackPeer::connect(app_id, conditions);
+                (
+                    Driver::Loopback(peer.clone()),
+                    CallbackRunner::Loopback(peer),
+                )
+            }
+            Backend::Replay(path, speed) => {
+                let peer = ReplayPeer::open(&path, speed).map_err(|e| e.to_string())?;
+                (Driver::Replay(peer.clone()), CallbackRunner::Replay(peer))
+            }
+        };
+        let transport = Transport {
+            driver,
+            capture: Arc::new(Mutex::new(None)),
+        };
+        Ok((transport, runner))
+    }
+
+    /// Starts recording received messages and events to `path`, replacing
+    /// any capture in progress.
+    pub fn start_capture(&self, path: &Path) -> io::Result<()> {
+        let recorder = Recorder::create(path, self.own_steam_id())?;
+        let previous = self.capture.lock().unwrap().replace(recorder);
+        if let Some(mut previous) = previous {
+            previous.flush()?;
+        }
+        Ok(())
+    }
+
+    /// Stops recording and returns how many records were written.
+    pub fn stop_capture(&self) -> io::Result<Option<u64>> {
+        let recorder = self.capture.lock().unwrap().take();
+        match recorder {
+            Some(mut recorder) => {
+                recorder.flush()?;
+                Ok(Some(recorder.records))
+            }
+            None => Ok(None),
+        }
+    }
+
+    /// Returns `(bytes read, log size, records read, finished)` when
+    /// replaying a capture.
+    pub fn replay_progress(&self) -> Option<(usize, usize, u64, bool)> {
+        match &self.driver {
+            Driver::Replay(peer) => Some(peer.progress()),
+            _ => None,
+        }
+    }
+
+    pub fn own_steam_id(&self) -> u64 {
+        match &self.driver {
+            Driver::Steam(steam) => steam.client.user().steam_id().raw(),
+            Driver::Loopback(peer) => peer.steam_id(),
+            Driver::Replay(peer) => peer.steam_id(),
+        }
+    }
+
+    pub fn on_lobby_update(&self, handler: impl Fn(LobbyUpdate) + Send + Sync + 'static) {
+        let capture = self.capture.clone();
+        let handler = move |update| {
+            if let Some(recorder) = &mut *capture.lock().unwrap() {
+                recorder.record_lobby_update(update);
+            }
+            handler(update)
+        };
+        match &self.driver {
+            Driver::Steam(steam) => {
+                let handle = steam
+                    .client
+                    .register_callback::<LobbyChatUpdate, _>(move |update| {
+                        handler(LobbyUpdate {
+                            lobby: update.lobby.raw(),
+                            user_changed: update.user_changed.raw(),
+                            making_change: update.making_change.raw(),
+                            state: update.member_state_change as u64,
+                        })
+                    });
+                steam.callbacks.lock().unwrap().push(handle);
+            }
+            Driver::Loopback(peer) => peer.on_lobby_update(handler),
+            Driver::Replay(peer) => peer.on_lobby_update(handler),
+        }
+    }
+
+    pub fn on_session_failed(&self, handler: impl Fn(u64) + Send + Sync + 'static) {
+        let capture = self.capture.clone();
+        let handler = move |steam_id| {
+            if let Some(recorder) = &mut *capture.lock().unwrap() {
+                recorder.record_session_failed(steam_id);
+            }
+            handler(steam_id)
+        };
+        match &self.driver {
+            Driver::Steam(steam) => steam.messages.session_failed_callback(move |info| {
+                if let Some(steam_id) = info.identity_remote().and_then(|id| id.steam_id()) {
+                    handler(steam_id.raw());
+                }
+            }),
+            Driver::Loopback(peer) => peer.on_session_failed(handler),
+            Driver::Replay(peer) => peer.on_session_failed(handler),
+        }
+    }
+
+    /// Starts connecting to the Steam relay network, which otherwise happens
+    /// on the first operation that needs it.
+    pub fn warm_relay(&self) {
+        if let Driver::Steam(_) = &self.driver {
+            unsafe {
+                sys::SteamAPI_ISteamNetworkingUtils_InitRelayNetworkAccess(
+                    sys::SteamAPI_SteamNetworkingUtils_SteamAPI_v004(),
+                );
+            }
+        }
+    }
+
+    /// Returns the relay network availability, numbered like Steam's
+    /// `ESteamNetworkingAvailability`. Backends without relays report it as
+    /// current.
+    pub fn relay_status(&self) -> i32 {
+        match &self.driver {
+            Driver::Steam(_) => unsafe {
+                sys::SteamAPI_ISteamNetworkingUtils_GetRelayNetworkStatus(
+                    sys::SteamAPI_SteamNetworkingUtils_SteamAPI_v004(),
+                    std::ptr::null_mut(),
+                ) as i32
+            },
+            Driver::Loopback(_) | Driver::Replay(_) => RELAY_CURRENT,
+        }
+    }
+
+    /// Decides incoming session requests with `handler`. Only Steam asks;
+    /// the other backends accept every peer.
+    pub fn on_session_request(&self, handler: impl Fn(u64) -> bool + Send + Sync + 'static) {
+        if let Driver::Steam(steam) = &self.driver {
+            steam.messages.session_request_callback(move |request| {
+                match request.remote().steam_id() {
+                    Some(steam_id) if handler(steam_id.raw()) => {
+                        request.accept();
+                    }
+                    _ => request.reject(),
+                }
+            });
+        }
+    }
+
+    /// Closes the session with `steam_id`, dropping anything still queued
+    /// for it. Returns `false` if there was none.
+    pub fn close_session(&self, steam_id: u64) -> bool {
+        match &self.driver {
+            // steamworks does not wrap `CloseSessionWithUser`.
+            Driver::Steam(_) => unsafe {
+                let mut identity: sys::SteamNetworkingIdentity = std::mem::zeroed();
+                sys::SteamAPI_SteamNetworkingIdentity_SetSteamID64(&mut identity, steam_id);
+                sys::SteamAPI_ISteamNetworkingMessages_CloseSessionWithUser(
+                    sys::SteamAPI_SteamNetworkingMessages_SteamAPI_v002(),
+                    &identity,
+                )
+            },
+            Driver::Loopback(_) | Driver::Replay(_) => false,
+        }
+    }
+
+    pub fn create_lobby(
+        &self,
+        lobby_type: u32,
+        max_members: u32,
+        cb: impl FnOnce(Result<u64, SteamError>) + Send + 'static,
+    ) {
+        match &self.driver {
+            Driver::Steam(steam) => {
+                let lobby_kind = match lobby_type {
+                    0 => LobbyType::Private,
+                    1 => LobbyType::FriendsOnly,
+                    2 => LobbyType::Public,
+                    3 => LobbyType::Invisible,
+                    _ => LobbyType::Private,
+                };
+                steam
+                    .client
+                    .matchmaking()
+                    .create_lobby(lobby_kind, max_members, move |result| {
+                        cb(result.map(|lobby_id| lobby_id.raw()))
+                    });
+            }
+            Driver::Loopback(peer) => peer.create_lobby(max_members, cb),
+            Driver::Replay(peer) => peer.create_lobby(cb),
+        }
+    }
+
+    pub fn join_lobby(&self, lobby_id: u64, cb: impl FnOnce(Result<u64, ()>) + Send + 'static) {
+        match &self.driver {
+            Driver::Steam(steam) => {
+                steam
+                    .client
+                    .matchmaking()
+                    .join_lobby(LobbyId::from_raw(lobby_id), move |result| {
+                        cb(result.map(|lobby_id| lobby_id.raw()).map_err(|_| ()))
+                    });
+            }
+            Driver::Loopback(peer) => peer.join_lobby(lobby_id, cb),
+            Driver::Replay(peer) => peer.join_lobby(cb),
+        }
+    }
+
+    pub fn leave_lobby(&self, lobby_id: u64) {
+        match &self.driver {
+            Driver::Steam(steam) => steam
+                .client
+                .matchmaking()
+                .leave_lobby(LobbyId::from_raw(lobby_id)),
+            Driver::Loopback(peer) => peer.leave_lobby(lobby_id),
+            Driver::Replay(_) => {}
+        }
+    }
+
+    pub fn lobby_members(&self, lobby_id: u64) -> Vec<u64> {
+        match &self.driver {
+            Driver::Steam(steam) => steam
+                .client
+                .matchmaking()
+                .lobby_members(LobbyId::from_raw(lobby_id))
+                .iter()
+                .map(|id| id.raw())
+                .collect(),
+            Driver::Loopback(peer) => peer.lobby_members(lobby_id),
+            Driver::Replay(_) => Vec::new(),
+        }
+    }
+
+    pub fn send(
+        &self,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> Result<(), SteamError> {
+        match &self.driver {
+            Driver::Steam(steam) => {
+                let flags = SendFlags::from_bits(message_type).unwrap_or(SendFlags::RELIABLE);
+                steam.messages.send_message_to_user(
+                    NetworkingIdentity::new_steam_id(SteamId::from_raw(steam_id)),
+                    flags,
+                    message,
+                    channel,
+                )
+            }
+            Driver::Loopback(peer) => peer.send(steam_id, message_type, channel, message),
+            // Replies to replayed traffic go nowhere.
+            Driver::Replay(_) => Ok(()),
+        }
+    }
+
+    /// Receives up to `max_messages` on `channel`, dropping and counting
+    /// messages whose sender has no SteamID identity.
+    pub fn receive(
+        &self,
+        channel: u32,
+        max_messages: usize,
+        stats: &NetStats,
+    ) -> Vec<(u64, Received)> {
+        let started = Instant::now();
+        let received = match &self.driver {
+            Driver::Steam(steam) => steam
+                .messages
+                .receive_messages_on_channel(channel, max_messages)
+                .into_iter()
+                .filter_map(|message| match message.identity_peer().steam_id() {
+                    Some(steam_id) => Some((steam_id.raw(), Received::Steam(message))),
+                    None => {
+                        stats.record_identityless_drop();
+                        None
+                    }
+                })
+                .collect(),
+            Driver::Loopback(peer) => peer
+                .receive(channel, max_messages)
+                .into_iter()
+                .map(|(steam_id, data)| (steam_id, Received::Owned(data)))
+                .collect(),
+            Driver::Replay(peer) => peer
+                .receive(channel, max_messages)
+                .into_iter()
+                .map(|(steam_id, log, range)| (steam_id, Received::Mapped(log, range)))
+                .collect(),
+        };
+        if !received.is_empty() {
+            if let Some(recorder) = &mut *self.capture.lock().unwrap() {
+                for (steam_id, message) in &received {
+                    recorder.record_message(*steam_id, channel, message.data());
+                }
+            }
+        }
+        stats.receive_time.record(started.elapsed());
+        received
+    }
+
+    /// Returns the session state code and realtime status towards `steam_id`.
+    pub fn session_status(&self, steam_id: u64) -> (i32, Option<SessionStatus>) {
+        match &self.driver {
+            Driver::Steam(steam) => {
+                let identity = NetworkingIdentity::new_steam_id(SteamId::from_raw(steam_id));
+                let (state, _, status) = steam.messages.get_session_connection_info(&identity);
+                (
+                    connection_state_code(state),
+                    status.as_ref().map(SessionStatus::from),
+                )
+            }
+            Driver::Loopback(peer) => peer.session_status(steam_id),
+            Driver::Replay(_) => (0, None),
+        }
+    }
+
+    /// Applies new link conditions. Only the loopback backend simulates them.
+    pub fn set_conditions(&self, conditions: LinkConditions) -> bool {
+        match &self.driver {
+            Driver::Steam(_) | Driver::Replay(_) => false,
+            Driver::Loopback(peer) => {
+                peer.set_conditions(conditions);
+                true
+            }
+        }
+    }
+}
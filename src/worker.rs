@@ -0,0 +1,155 @@
+use std::{
+    collections::HashMap,
+    sync::{Arc, Mutex},
+};
+
+use pyo3::{
+    exceptions::{PyRuntimeError, PyValueError},
+    prelude::*,
+    types::PyList,
+};
+
+use crate::{
+    batch::MessageBatch,
+    message::SteamMessage,
+    shm::{Bus, Consumer, SharedSlot},
+    transport::Received,
+};
+
+/// Handle to a shared-memory bus started with
+/// `PySteamClient.start_shared_bus`, usable from other processes. Sends are
+/// written straight into the bus and received messages are read in place.
+#[pyclass(frozen)]
+pub struct SteamNetWorker {
+    bus: Arc<Bus>,
+    consumers: Mutex<HashMap<u32, Arc<Consumer>>>,
+}
+
+#[pymethods]
+impl SteamNetWorker {
+    /// Attaches to the bus called `name`.
+    #[new]
+    pub fn new(name: &str) -> PyResult<Self> {
+        Ok(SteamNetWorker {
+            bus: Arc::new(Bus::open(name)?),
+            consumers: Mutex::new(HashMap::new()),
+        })
+    }
+
+    #[getter]
+    pub fn channels(&self) -> Vec<u32> {
+        self.bus.channels().to_vec()
+    }
+
+    /// True once the owning client stopped the bus.
+    #[getter]
+    pub fn closed(&self) -> bool {
+        self.bus.is_closed()
+    }
+
+    /// Queues `message` for the owning client to send. Returns `False` if
+    /// the bus is full.
+    pub fn send(
+        &self,
+        py: Python<'_>,
+        steam_id: u64,
+        message_type: i32,
+        channel: u32,
+        message: &[u8],
+    ) -> PyResult<bool> {
+        let ring = self.bus.outbound(self.channel_index(channel)?);
+        if message.len() > ring.max_message() {
+            return Err(PyValueError::new_err(format!(
+                "Message of {} bytes exceeds the bus limit of {} bytes",
+                message.len(),
+                ring.max_message()
+            )));
+        }
+        Ok(py.allow_threads(|| {
+            let _lock = ring.lock();
+            ring.push(steam_id, channel, message_type, message)
+        }))
+    }
+
+    /// Returns up to `max_messages` from `channel` as `SteamMessage` views
+    /// into the bus. Each slot is freed when its view is released. The first
+    /// call claims the channel for this process.
+    #[pyo3(signature = (channel, max_messages=256))]
+    pub fn recv<'py>(
+        &self,
+        py: Python<'py>,
+        channel: u32,
+        max_messages: usize,
+    ) -> PyResult<Bound<'py, PyList>> {
+        let consumer = self.consumer(channel)?;
+        let mut slots = Vec::new();
+        consumer.take(max_messages, |seq, entry| {
+            slots.push((
+                entry.steam_id,
+                SharedSlot::new(consumer.clone(), seq, entry),
+            ));
+            true
+        });
+        let mut views = Vec::with_capacity(slots.len());
+        for (steam_id, slot) in slots {
+            let len = slot.data().len();
+            let message = Arc::new(Received::Shared(slot));
+            views.push(Bound::new(
+                py,
+                SteamMessage::new(message, 0..len, steam_id, channel),
+            )?);
+        }
+        PyList::new(py, views)
+    }
+
+    /// Copies up to `max_messages` from `channel` into a columnar batch with
+    /// the same layout as `PySteamClient.receive_batch`.
+    #[pyo3(signature = (channel, max_messages=256))]
+    pub fn recv_batch(
+        &self,
+        py: Python<'_>,
+        channel: u32,
+        max_messages: usize,
+    ) -> PyResult<PyObject> {
+        let consumer = self.consumer(channel)?;
+        let batch = py.allow_threads(|| {
+            let mut batch = MessageBatch::default();
+            consumer.take(max_messages, |_, entry| {
+                // The slot is not freed before `take` returns.
+                batch.push(entry.steam_id, channel, unsafe { entry.data() });
+                false
+            });
+            batch
+        });
+        batch.into_py(py)
+    }
+
+    /// Gives up this process's claims. Views still alive keep their channel
+    /// claimed until they are released.
+    pub fn close(&self) {
+        self.consumers.lock().unwrap().clear();
+    }
+}
+
+impl SteamNetWorker {
+    fn channel_index(&self, channel: u32) -> PyResult<usize> {
+        self.bus
+            .channel_index(channel)
+            .ok_or_else(|| PyValueError::new_err(format!("Channel {channel} is not on this bus")))
+    }
+
+    fn consumer(&self, channel: u32) -> PyResult<Arc<Consumer>> {
+        let index = self.channel_index(channel)?;
+        let mut consumers = self.consumers.lock().unwrap();
+        if let Some(consumer) = consumers.get(&channel) {
+            return Ok(consumer.clone());
+        }
+        let consumer = Consumer::claim(self.bus.clone(), index).map_err(|pid| {
+            PyRuntimeError::new_err(format!(
+                "Channel {channel} is already read by process {pid}"
+            ))
+        })?;
+        consumers.insert(channel, consumer.clone());
+        Ok(consumer)
+    }
+}
@@ -0,0 +1,13 @@
+import pytest
+
+from helpers import loopback_client, new_app_id
+
+
+@pytest.fixture
+def pair():
+    app_id = new_app_id()
+    a = loopback_client(app_id)
+    b = loopback_client(app_id)
+    yield a, b
+    a.deinit()
+    b.deinit()
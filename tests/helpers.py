@@ -0,0 +1,50 @@
+import itertools
+import time
+
+from py_steam_net import PySteamClient
+
+RELIABLE = 8
+
+# Loopback clients only see clients initialized with the same app ID, so
+# every test gets its own.
+_app_ids = itertools.count(480_000)
+
+
+def new_app_id():
+    return next(_app_ids)
+
+
+def loopback_client(app_id, **kwargs):
+    client = PySteamClient()
+    client.init(app_id, backend="loopback", **kwargs)
+    return client
+
+
+def wait_for(predicate, timeout=5.0):
+    """Polls `predicate` until it is true or `timeout` seconds pass."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def batch_messages(batch):
+    """Splits a `receive_batch` result into `(steam_id, channel, data)`."""
+    payload, steam_ids, channels, offsets, lengths = batch
+    return [
+        (steam_id, channel, payload[offset : offset + length])
+        for steam_id, channel, offset, length in zip(steam_ids, channels, offsets, lengths)
+    ]
+
+
+def records(batch):
+    """Splits a `tick` result into `(kind, steam_id, lobby, extra, code, data)`."""
+    payload, kinds, steam_ids, lobbies, extras, codes, offsets, lengths = batch
+    return [
+        (kind, steam_id, lobby, extra, code, payload[offset : offset + length])
+        for kind, steam_id, lobby, extra, code, offset, length in zip(
+            kinds, steam_ids, lobbies, extras, codes, offsets, lengths
+        )
+    ]
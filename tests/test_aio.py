@@ -0,0 +1,86 @@
+import asyncio
+import gc
+
+import pytest
+
+from helpers import RELIABLE
+
+
+def test_lobby_operations_async(pair):
+    a, b = pair
+
+    async def main():
+        lobby_id = await a.create_lobby_async(2, 4)
+        assert await b.join_lobby_async(lobby_id) == lobby_id
+        with pytest.raises(RuntimeError):
+            await b.join_lobby_async(lobby_id + 1000)
+        return lobby_id
+
+    lobby_id = asyncio.run(main())
+    assert a.get_lobby_members(lobby_id) == (a.own_steam_id(), b.own_steam_id())
+
+
+def test_message_stream(pair):
+    a, b = pair
+
+    async def main():
+        stream = a.messages(5)
+        assert stream.channel == 5
+        for message in (b"one", b"two"):
+            b.send_message_to(a.own_steam_id(), RELIABLE, 5, message)
+        received = []
+        async for steam_id, channel, data in stream:
+            received.append((steam_id, channel, data))
+            if len(received) == 2:
+                stream.close()
+        return received
+
+    assert asyncio.run(main()) == [(b.own_steam_id(), 5, b"one"), (b.own_steam_id(), 5, b"two")]
+
+
+def test_close_ends_pending_iteration(pair):
+    a, _ = pair
+
+    async def main():
+        stream = a.messages(5)
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        stream.close()
+        with pytest.raises(StopAsyncIteration):
+            await waiting
+
+    asyncio.run(main())
+
+
+def test_stream_usable_from_other_threads(pair):
+    a, b = pair
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        stream = a.messages(5)
+        assert await loop.run_in_executor(None, lambda: stream.channel) == 5
+        b.send_message_to(a.own_steam_id(), RELIABLE, 5, b"hello")
+        message = await stream.__anext__()
+        await loop.run_in_executor(None, stream.close)
+        return message
+
+    assert asyncio.run(main()) == (b.own_steam_id(), 5, b"hello")
+
+
+def test_freed_stream_stops_receiving(pair):
+    a, b = pair
+    received = []
+    a.set_message_recv_callback(lambda *message: received.append(message[2]))
+
+    async def main():
+        stream = a.messages(5)
+        del stream
+        gc.collect()
+        b.send_message_to(a.own_steam_id(), RELIABLE, 5, b"kept")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    # Nothing drained the channel on behalf of the freed stream.
+    a.receive_messages(5, 16)
+    assert received == [b"kept"]
+
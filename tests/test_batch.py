@@ -0,0 +1,37 @@
+from helpers import RELIABLE, batch_messages
+
+
+def test_receive_batch_packs_every_channel(pair):
+    a, b = pair
+    for channel, message in ((1, b"one"), (2, b""), (1, b"three")):
+        b.send_message_to(a.own_steam_id(), RELIABLE, channel, message)
+
+    batch = a.receive_batch([1, 2], 16)
+    payload, steam_ids, channels, offsets, lengths = batch
+    assert payload == b"onethree"
+    assert (steam_ids.typecode, channels.typecode) == ("Q", "I")
+    assert (offsets.typecode, lengths.typecode) == ("Q", "Q")
+    sender = b.own_steam_id()
+    assert batch_messages(batch) == [(sender, 1, b"one"), (sender, 1, b"three"), (sender, 2, b"")]
+    assert batch_messages(a.receive_batch([1, 2], 16)) == []
+
+
+def test_receive_batch_limits_each_channel(pair):
+    a, b = pair
+    for channel in (1, 2):
+        for message in (b"first", b"second"):
+            b.send_message_to(a.own_steam_id(), RELIABLE, channel, message)
+
+    first = batch_messages(a.receive_batch([1, 2], 1))
+    assert [(channel, data) for _, channel, data in first] == [(1, b"first"), (2, b"first")]
+    rest = batch_messages(a.receive_batch([1, 2], 16))
+    assert [(channel, data) for _, channel, data in rest] == [(1, b"second"), (2, b"second")]
+
+
+def test_receive_batch_skips_the_message_callback(pair):
+    a, b = pair
+    received = []
+    a.set_message_recv_callback(lambda *message: received.append(message))
+    b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"batched")
+    assert len(batch_messages(a.receive_batch([0], 16))) == 1
+    assert received == []
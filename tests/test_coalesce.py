@@ -0,0 +1,47 @@
+from helpers import RELIABLE, batch_messages
+
+
+def test_coalesced_packs_only_unpacked_on_opted_in_channels(pair):
+    a, b = pair
+    a.enable_coalescing()
+    for message in (b"one", b"two"):
+        a.send_message_to(b.own_steam_id(), RELIABLE, 3, message)
+    a.flush()
+    [(_, _, pack)] = batch_messages(b.receive_batch([3], 16))
+    assert pack.startswith(b"\xff\xc0")
+
+    b.set_unpack_channels([3])
+    assert b.unpack_channels() == [3]
+    for message in (b"one", b"two"):
+        a.send_message_to(b.own_steam_id(), RELIABLE, 3, message)
+    a.flush()
+    messages = [data for _, _, data in batch_messages(b.receive_batch([3], 16))]
+    assert messages == [b"one", b"two"]
+
+    # Raw binary payloads on other channels are never split.
+    a.disable_coalescing()
+    raw = b"\xff\xc0\x01\x09"
+    a.send_message_to(b.own_steam_id(), RELIABLE, 4, raw)
+    assert batch_messages(b.receive_batch([4], 16)) == [(a.own_steam_id(), 4, raw)]
+
+
+def test_large_messages_are_sent_directly_in_order(pair):
+    a, b = pair
+    a.enable_coalescing(max_bytes=64, flush_on_tick=False)
+    b.set_unpack_channels([3])
+    large = bytes(range(200))
+    for message in (b"small", large, b"after"):
+        a.send_message_to(b.own_steam_id(), RELIABLE, 3, message)
+    a.flush()
+    messages = [data for _, _, data in batch_messages(b.receive_batch([3], 16))]
+    assert messages == [b"small", large, b"after"]
+
+
+def test_failed_pack_send_is_reported(pair):
+    a, _ = pair
+    a.enable_coalescing(max_bytes=64, flush_on_tick=False)
+    assert list(a.send_to_many([1234], RELIABLE, 3, b"queued")) == [22]
+    # The pending pack is sent first and fails: nobody is 1234.
+    assert list(a.send_to_many([1234], RELIABLE, 3, bytes(100))) == [3]
+    a.send_to_many([1234], RELIABLE, 3, b"queued")
+    assert a.flush() == 0
@@ -0,0 +1,73 @@
+from helpers import RELIABLE, batch_messages
+
+
+def shared_lobby(a, b):
+    """Creates a lobby with `a` and has `b` join it."""
+    lobbies = []
+    a.create_lobby(2, 4, lobbies.append)
+    a.run_callbacks()
+    [lobby_id] = lobbies
+    b.join_lobby(lobby_id)
+    b.run_callbacks()
+    a.run_callbacks()
+    return lobby_id
+
+
+def test_send_to_lobby_reaches_every_member(pair):
+    a, b = pair
+    lobby_id = shared_lobby(a, b)
+
+    steam_ids, codes = a.send_to_lobby(lobby_id, RELIABLE, 0, b"everyone")
+    assert (steam_ids.typecode, codes.typecode) == ("Q", "i")
+    assert (list(steam_ids), list(codes)) == ([b.own_steam_id()], [1])
+
+    steam_ids, codes = a.send_to_lobby(lobby_id, RELIABLE, 0, b"me too", exclude_self=False)
+    assert sorted(steam_ids) == sorted([a.own_steam_id(), b.own_steam_id()])
+    assert list(codes) == [1, 1]
+
+    sender = a.own_steam_id()
+    assert batch_messages(b.receive_batch([0], 16)) == [(sender, 0, b"everyone"), (sender, 0, b"me too")]
+    assert batch_messages(a.receive_batch([0], 16)) == [(sender, 0, b"me too")]
+
+
+def test_send_to_unknown_lobby_sends_nothing(pair):
+    a, _ = pair
+    steam_ids, codes = a.send_to_lobby(1234, RELIABLE, 0, b"nobody")
+    assert (list(steam_ids), list(codes)) == ([], [])
+
+
+def test_send_to_many_reports_each_result(pair):
+    a, b = pair
+    codes = a.send_to_many([b.own_steam_id(), 1234, b.own_steam_id()], RELIABLE, 0, b"hi")
+    assert codes.typecode == "i"
+    assert list(codes) == [1, 3, 1]
+    assert len(batch_messages(b.receive_batch([0], 16))) == 2
+
+
+def test_member_cache_follows_joins_and_leaves(pair):
+    a, b = pair
+    lobby_id = shared_lobby(a, b)
+    members = a.get_lobby_members(lobby_id)
+    assert sorted(members) == sorted([a.own_steam_id(), b.own_steam_id()])
+    # Unchanged membership returns the same tuple.
+    assert a.get_lobby_members(lobby_id) is members
+    assert b.get_lobby_members(lobby_id) == members
+    version = a.get_lobby_members_version(lobby_id)
+    assert version is not None
+
+    b.leave_lobby(lobby_id)
+    assert b.get_lobby_members_version(lobby_id) is None
+    assert a.get_lobby_members_version(lobby_id) == version
+    a.run_callbacks()
+    assert a.get_lobby_members(lobby_id) == (a.own_steam_id(),)
+    assert a.get_lobby_members_version(lobby_id) != version
+
+    a.leave_lobby(lobby_id)
+    assert a.get_lobby_members_version(lobby_id) is None
+    assert a.get_lobby_members(lobby_id) == ()
+
+
+def test_unknown_lobby_is_not_cached(pair):
+    a, _ = pair
+    assert a.get_lobby_members(1234) == ()
+    assert a.get_lobby_members_version(1234) is None
@@ -0,0 +1,19 @@
+from helpers import RELIABLE
+
+
+def test_message_delivered_to_peer(pair):
+    a, b = pair
+    received = []
+    a.set_message_recv_callback(lambda *message: received.append(message))
+    b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"hello")
+    a.receive_messages(0, 16)
+    assert received == [(b.own_steam_id(), 0, b"hello")]
+
+
+def test_connection_failed_callback(pair):
+    a, _ = pair
+    failed = []
+    a.set_connection_failed_callback(lambda steam_id, *details: failed.append(steam_id))
+    a.send_message_to(1234, RELIABLE, 0, b"nobody")
+    a.run_callbacks()
+    assert failed == [1234]
@@ -0,0 +1,65 @@
+import pytest
+
+from helpers import RELIABLE, batch_messages, wait_for
+
+
+def test_pump_queues_messages_for_the_callback(pair):
+    a, b = pair
+    received = []
+    a.set_message_recv_callback(lambda *message: received.append(message))
+    a.start_pump([0, 1])
+    try:
+        b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"zero")
+        b.send_message_to(a.own_steam_id(), RELIABLE, 1, b"one")
+        assert wait_for(lambda: a.pump_stats()["queued"] == 2)
+        assert received == []
+        assert a.drain_pump(1) == 1
+        assert a.drain_pump() == 1
+    finally:
+        a.stop_pump()
+    sender = b.own_steam_id()
+    assert sorted(received) == [(sender, 0, b"zero"), (sender, 1, b"one")]
+    stats = a.pump_stats()
+    assert (stats["running"], stats["received"], stats["queued"]) == (False, 2, 0)
+    assert stats["ticks"] > 0
+
+
+def test_pump_drains_into_batches(pair):
+    a, b = pair
+    a.start_pump([0])
+    try:
+        for message in (b"one", b"two"):
+            b.send_message_to(a.own_steam_id(), RELIABLE, 0, message)
+        assert wait_for(lambda: a.pump_stats()["received"] == 2)
+    finally:
+        a.stop_pump()
+    # Messages still queued after stopping can be drained.
+    messages = batch_messages(a.drain_pump_batch())
+    assert [data for _, _, data in messages] == [b"one", b"two"]
+
+
+def test_full_pump_queue_drops_messages(pair):
+    a, b = pair
+    a.start_pump([0], capacity=2)
+    try:
+        for _ in range(5):
+            b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"flood")
+        assert wait_for(lambda: a.pump_stats()["dropped"] == 3)
+        stats = a.pump_stats()
+        assert (stats["capacity"], stats["received"], stats["high_water"]) == (2, 2, 2)
+    finally:
+        a.stop_pump()
+
+
+def test_pump_runs_callbacks(pair):
+    a, _ = pair
+    failed = []
+    a.set_connection_failed_callback(lambda steam_id, *details: failed.append(steam_id))
+    a.start_pump([0])
+    try:
+        with pytest.raises(RuntimeError):
+            a.start_pump([0])
+        a.send_message_to(1234, RELIABLE, 0, b"nobody")
+        assert wait_for(lambda: failed == [1234])
+    finally:
+        a.stop_pump()
@@ -0,0 +1,73 @@
+from helpers import RELIABLE
+
+
+def send_all(sender, receiver, channel, messages):
+    for message in messages:
+        sender.send_message_to(receiver.own_steam_id(), RELIABLE, channel, message)
+
+
+def test_tag_then_channel_then_default(pair):
+    a, b = pair
+    default, channel, tagged = [], [], []
+    a.set_message_recv_callback(lambda *message: default.append(message[2]))
+    a.set_channel_handler(0, lambda *message: channel.append(message[2]))
+    a.set_channel_handler(0, lambda *message: tagged.append(message), tag=7)
+
+    send_all(b, a, 0, [b"\x07tagged", b"plain"])
+    send_all(b, a, 1, [b"\x07other channel"])
+    a.receive_messages(0, 16)
+    a.receive_messages(1, 16)
+
+    assert tagged == [(b.own_steam_id(), 0, b"\x07tagged")]
+    assert channel == [b"plain"]
+    assert default == [b"\x07other channel"]
+
+
+def test_removed_routes_fall_through(pair):
+    a, b = pair
+    channel, tagged = [], []
+    a.set_channel_handler(2, lambda *message: channel.append(message[2]))
+    a.set_channel_handler(2, lambda *message: tagged.append(message[2]), tag=1)
+    a.set_channel_handler(2, None, tag=1)
+
+    send_all(b, a, 2, [b"\x01now untagged"])
+    a.receive_messages(2, 16)
+    assert (channel, tagged) == ([b"\x01now untagged"], [])
+
+    a.set_channel_handler(2, None)
+    send_all(b, a, 2, [b"dropped"])
+    a.receive_messages(2, 16)
+    assert channel == [b"\x01now untagged"]
+    assert a.get_unrouted_count() == 1
+    assert a.get_stats()["unrouted"] == 1
+
+
+def test_handler_may_reroute_during_dispatch(pair):
+    a, b = pair
+    first, second = [], []
+
+    def handle_once(steam_id, channel, data):
+        first.append(data)
+        a.set_channel_handler(0, lambda *message: second.append(message[2]))
+
+    a.set_channel_handler(0, handle_once)
+    send_all(b, a, 0, [b"one", b"two"])
+    # The batch keeps the routes it started with.
+    a.receive_messages(0, 16)
+    send_all(b, a, 0, [b"three"])
+    a.receive_messages(0, 16)
+
+    assert first == [b"one", b"two"]
+    assert second == [b"three"]
+
+
+def test_handler_exceptions_are_counted(pair):
+    a, b = pair
+
+    def fail(*message):
+        raise ValueError("handler failed")
+
+    a.set_channel_handler(0, fail)
+    send_all(b, a, 0, [b"one", b"two"])
+    a.receive_messages(0, 16)
+    assert a.get_stats()["callback_exceptions"] == 2
@@ -0,0 +1,76 @@
+import py_steam_net
+
+from helpers import RELIABLE, records
+
+
+def test_session_state_callback_may_close_session(pair):
+    a, b = pair
+    a.enable_sessions()
+    transitions = []
+
+    def on_state(steam_id, old, new):
+        transitions.append((steam_id, old, new))
+        if new == 3:
+            # Re-enters the client, which reports the close right away.
+            a.close_session(steam_id)
+
+    a.set_session_state_callback(on_state)
+    a.open_session(b.own_steam_id())
+    a.run_callbacks()
+
+    assert transitions == [(b.own_steam_id(), 0, 3), (b.own_steam_id(), 3, 0)]
+    assert a.get_sessions() == []
+    assert a.session_stats()["warmed"] == 1
+
+
+def test_enable_sessions_twice(pair):
+    a, b = pair
+    a.enable_sessions()
+    a.enable_sessions(prewarm=False)
+    a.open_session(b.own_steam_id())
+    a.run_callbacks()
+    [(steam_id, state, pinned, _)] = a.get_sessions()
+    assert (steam_id, state, pinned) == (b.own_steam_id(), 3, True)
+
+
+def test_session_state_reported_by_tick(pair):
+    a, b = pair
+    a.enable_sessions()
+    a.tick([])
+    a.open_session(b.own_steam_id())
+    [state] = records(a.tick([]))
+    assert state[:5] == (py_steam_net.EVENT_SESSION_STATE, b.own_steam_id(), 0, 0, 3)
+
+
+def test_failed_warm_up_is_counted(pair):
+    a, _ = pair
+    a.enable_sessions()
+    a.open_session(1234)
+    a.run_callbacks()
+    a.run_callbacks()
+    stats = a.session_stats()
+    assert (stats["warmed"], stats["warm_failed"]) == (1, 1)
+    assert a.get_stats()["send_failures"] == {3: 1}
+
+
+def test_session_info_reports_link_quality(pair):
+    a, b = pair
+    a.set_link_conditions(latency_ms=10, bandwidth=50_000)
+    b.set_link_conditions(latency_ms=5, loss=0.5)
+
+    info = a.get_session_info([b.own_steam_id(), 1234])
+    assert list(info["steam_id"]) == [b.own_steam_id(), 1234]
+    assert list(info["state"]) == [3, 0]
+    assert list(info["ping_ms"]) == [15, -1]
+    assert list(info["quality_local"]) == [0.5, -1.0]
+    assert list(info["quality_remote"]) == [1.0, -1.0]
+    assert list(info["send_rate"]) == [50_000, 0]
+
+
+def test_session_info_defaults_to_known_peers(pair):
+    a, b = pair
+    assert list(a.get_session_info()["steam_id"]) == []
+    a.send_message_to(b.own_steam_id(), RELIABLE, 0, b"hello")
+    a.send_message_to(1234, RELIABLE, 0, b"nobody")
+    # Peers without a session are left out.
+    assert list(a.get_session_info()["steam_id"]) == [b.own_steam_id()]
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import pytest
+from py_steam_net import PySteamClient
+
+from helpers import new_app_id
+
+
+def test_background_init():
+    client = PySteamClient()
+    assert not client.wait_ready(timeout=0.1)
+    client.init(new_app_id(), backend="loopback", background=True)
+    try:
+        assert client.wait_ready(timeout=10)
+        assert client.wait_ready(timeout=10, relay=True)
+        assert client.is_ready()
+        status = client.init_status()
+        assert status["state"] == "ready"
+        assert status["error"] is None
+        assert status["ready_ms"] is not None
+        assert status["relay_state"] == 100
+    finally:
+        client.deinit()
+    assert not client.is_ready()
+
+
+def test_background_init_from_threads():
+    client = PySteamClient()
+    client.init(new_app_id(), backend="loopback", background=True)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.wait_ready(timeout=10)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert results == [True] * 4
+    finally:
+        client.deinit()
+
+
+def test_init_twice_requires_deinit():
+    app_id = new_app_id()
+    client = PySteamClient()
+    client.init(app_id, backend="loopback")
+    try:
+        steam_id = client.own_steam_id()
+        with pytest.raises(RuntimeError, match="deinit"):
+            client.init(app_id, backend="loopback")
+        with pytest.raises(RuntimeError, match="deinit"):
+            client.init(app_id, backend="loopback", background=True)
+        assert client.own_steam_id() == steam_id
+        client.deinit()
+        client.init(app_id, backend="loopback")
+        assert client.is_ready()
+    finally:
+        client.deinit()
+
+
+def test_init_async():
+    client = PySteamClient()
+    app_id = new_app_id()
+
+    async def main():
+        future = client.init_async(app_id, backend="loopback")
+        with pytest.raises(RuntimeError, match="in progress"):
+            client.init_async(app_id, backend="loopback")
+        return await future
+
+    try:
+        assert asyncio.run(main()) is None
+        assert client.is_ready()
+        assert client.init_status()["state"] == "ready"
+    finally:
+        client.deinit()
+
+
+def test_init_async_requires_running_loop():
+    client = PySteamClient()
+    with pytest.raises(RuntimeError):
+        client.init_async(new_app_id(), backend="loopback")
+    assert not client.is_ready()
@@ -0,0 +1,48 @@
+from helpers import RELIABLE
+
+
+def test_traffic_is_counted_per_peer_and_channel(pair):
+    a, b = pair
+    a.set_message_recv_callback(lambda *message: None)
+    b.send_message_to(a.own_steam_id(), RELIABLE, 4, b"hello")
+    b.send_message_to(a.own_steam_id(), RELIABLE, 5, b"hi")
+    b.send_message_to(1234, RELIABLE, 4, b"nobody")
+    a.receive_messages(4, 16)
+    a.receive_messages(5, 16)
+
+    sent = b.get_stats()
+    assert sent["peers"][a.own_steam_id()]["messages_sent"] == 2
+    assert sent["peers"][a.own_steam_id()]["bytes_sent"] == 7
+    assert sent["peers"][1234]["send_failures"] == 1
+    assert sent["channels"][4]["messages_sent"] == 1
+    assert sent["channels"][4]["send_failures"] == 1
+    assert sent["send_failures"] == {3: 1}
+
+    received = a.get_stats()
+    assert received["peers"][b.own_steam_id()]["messages_received"] == 2
+    assert received["channels"][4]["bytes_received"] == 5
+    assert received["channels"][5]["bytes_received"] == 2
+    assert received["timings"]["receive"]["count"] >= 2
+    callbacks = received["timings"]["callbacks"]
+    assert callbacks["count"] == 2
+    assert sum(callbacks["buckets"]) == 2
+
+
+def test_stats_can_be_reset(pair):
+    a, b = pair
+    a.send_message_to(b.own_steam_id(), RELIABLE, 0, b"one")
+    a.send_message_to(1234, RELIABLE, 0, b"nobody")
+
+    stats = a.get_stats(reset=True)
+    assert stats["channels"][0]["messages_sent"] == 1
+    assert stats["send_failures"] == {3: 1}
+    stats = a.get_stats()
+    assert stats["channels"][0]["messages_sent"] == 0
+    assert stats["send_failures"] == {}
+
+    a.send_message_to(b.own_steam_id(), RELIABLE, 0, b"two")
+    a.run_callbacks()
+    a.reset_stats()
+    stats = a.get_stats()
+    assert stats["peers"][b.own_steam_id()]["messages_sent"] == 0
+    assert stats["timings"]["run_callbacks"]["count"] == 0
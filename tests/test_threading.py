@@ -0,0 +1,78 @@
+import threading
+
+from helpers import RELIABLE, batch_messages, wait_for
+
+
+def test_lobby_callback_may_replace_itself(pair):
+    a, b = pair
+    lobbies, first, second = [], [], []
+
+    def replace(*update):
+        first.append(update)
+        a.set_lobby_changed_callback(lambda *update: second.append(update))
+        # Re-entering from inside a callback must not take the runner again.
+        a.run_callbacks()
+
+    a.create_lobby(2, 4, lobbies.append)
+    a.run_callbacks()
+    [lobby_id] = lobbies
+    a.set_lobby_changed_callback(replace)
+
+    b.join_lobby(lobby_id)
+    a.run_callbacks()
+    b.leave_lobby(lobby_id)
+    a.run_callbacks()
+
+    assert [update[1] for update in first] == [b.own_steam_id()]
+    assert [update[1] for update in second] == [b.own_steam_id()]
+
+
+def test_connection_failed_callback_may_replace_itself(pair):
+    a, _ = pair
+    first, second = [], []
+
+    def replace(steam_id, *details):
+        first.append(steam_id)
+        a.set_connection_failed_callback(lambda steam_id, *details: second.append(steam_id))
+
+    a.set_connection_failed_callback(replace)
+    for steam_id in (1234, 5678):
+        a.send_message_to(steam_id, RELIABLE, 0, b"nobody")
+        a.run_callbacks()
+
+    assert (first, second) == ([1234], [5678])
+
+
+def run_threads(*targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_sends_and_receives(pair):
+    a, b = pair
+    senders, per_sender = 4, 200
+    received = []
+    lock = threading.Lock()
+
+    def send(sender):
+        for i in range(per_sender):
+            b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"%d:%d" % (sender, i))
+
+    def receive():
+        def drained():
+            messages = batch_messages(a.receive_batch([0], 32))
+            with lock:
+                received.extend(data for _, _, data in messages)
+                return len(received) == senders * per_sender
+
+        wait_for(drained)
+
+    run_threads(*[lambda sender=sender: send(sender) for sender in range(senders)], receive, receive)
+
+    assert sorted(received) == sorted(
+        b"%d:%d" % (sender, i) for sender in range(senders) for i in range(per_sender)
+    )
+    assert a.get_stats()["channels"][0]["messages_received"] == senders * per_sender
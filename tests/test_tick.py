@@ -0,0 +1,33 @@
+import py_steam_net
+
+from helpers import RELIABLE, records
+
+
+def test_tick_orders_events_and_messages(pair):
+    a, b = pair
+    op = a.create_lobby(2, 4)
+    [created] = records(a.tick([0]))
+    kind, _, lobby_id, extra, code, error = created
+    assert (kind, extra, code, error) == (py_steam_net.EVENT_LOBBY_CREATED, op, 1, b"")
+    assert lobby_id
+
+    op = b.join_lobby(lobby_id)
+    assert records(b.tick([]))[0][:5] == (py_steam_net.EVENT_LOBBY_JOINED, 0, lobby_id, op, 1)
+
+    b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"after join")
+    changed, message = records(a.tick([0]))
+    assert changed[:4] == (py_steam_net.EVENT_LOBBY_CHANGED, b.own_steam_id(), lobby_id, b.own_steam_id())
+    assert message == (py_steam_net.EVENT_MESSAGE, b.own_steam_id(), 0, 0, 0, b"after join")
+    assert a.get_lobby_members(lobby_id) == (a.own_steam_id(), b.own_steam_id())
+
+
+def test_lobby_failures_share_a_code(pair):
+    a, _ = pair
+    created = a.create_lobby(2, 0)
+    joined = a.join_lobby(1234)
+    failures = records(a.tick([]))
+    assert [record[:5] for record in failures] == [
+        (py_steam_net.EVENT_LOBBY_CREATED, 0, 0, created, 2),
+        (py_steam_net.EVENT_LOBBY_JOINED, 0, 0, joined, 2),
+    ]
+    assert all(error for *_, error in failures)
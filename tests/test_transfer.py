@@ -0,0 +1,58 @@
+def test_transfer_callback_may_cancel(pair):
+    a, b = pair
+    # One chunk per tick, so the receiver can cancel halfway.
+    a.enable_transfers(chunk_size=1024, tick_bytes=1024)
+    b.enable_transfers(chunk_size=1024)
+    sent, received = [], []
+
+    def on_receive(event, steam_id, transfer_id, done, total, data):
+        received.append(event)
+        if event == "recv_progress":
+            # Calls back into the client from inside the callback.
+            assert b.cancel_transfer(steam_id, transfer_id, incoming=True)
+
+    a.set_transfer_callback(lambda event, *args: sent.append(event))
+    b.set_transfer_callback(on_receive)
+    a.send_transfer(b.own_steam_id(), bytes(8192))
+    for _ in range(5):
+        a.run_callbacks()
+        b.run_callbacks()
+
+    assert received[:3] == ["offer", "recv_progress", "cancelled"]
+    assert "received" not in received
+    assert sent[-1] == "cancelled"
+
+
+def test_transfer_round_trip(pair):
+    a, b = pair
+    a.enable_transfers(chunk_size=1024)
+    b.enable_transfers(chunk_size=1024)
+    payload = bytes(range(256)) * 20
+    done = []
+    b.set_transfer_callback(
+        lambda event, steam_id, transfer_id, sent, total, data: done.append(data)
+        if event == "received"
+        else None
+    )
+    a.send_transfer(b.own_steam_id(), payload, name="blob")
+    for _ in range(5):
+        a.run_callbacks()
+        b.run_callbacks()
+    assert done == [payload]
+
+
+def test_refused_transfer_sends_no_chunks(pair):
+    a, b = pair
+    a.enable_transfers(chunk_size=1024)
+    b.enable_transfers(chunk_size=1024)
+    sent = []
+    a.set_transfer_callback(lambda event, *args: sent.append(event))
+    b.set_transfer_callback(lambda event, *args: False)
+    a.send_transfer(b.own_steam_id(), bytes(65536))
+    for _ in range(5):
+        a.run_callbacks()
+        b.run_callbacks()
+
+    assert sent == ["cancelled"]
+    # Only the offer went out.
+    assert a.get_stats()["channels"][250]["messages_sent"] == 1
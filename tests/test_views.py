@@ -0,0 +1,45 @@
+import struct
+
+import pytest
+
+from helpers import RELIABLE
+
+
+def test_views_expose_the_payload(pair):
+    a, b = pair
+    b.send_message_to(a.own_steam_id(), RELIABLE, 3, struct.pack("<If", 7, 0.5))
+
+    [view] = a.receive_message_views(3, 16)
+    assert (view.steam_id, view.channel, view.released) == (b.own_steam_id(), 3, False)
+    assert len(view) == 8
+    assert struct.unpack_from("<If", view) == (7, 0.5)
+    assert view.tobytes() == struct.pack("<If", 7, 0.5)
+
+
+def test_released_views_refuse_access(pair):
+    a, b = pair
+    b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"payload")
+    [view] = a.receive_message_views(0, 16)
+
+    with view:
+        assert bytes(memoryview(view)) == b"payload"
+    assert view.released
+    assert len(view) == 0
+    with pytest.raises(BufferError):
+        view.tobytes()
+    with pytest.raises(BufferError):
+        memoryview(view)
+
+
+def test_views_are_not_released_while_exported(pair):
+    a, b = pair
+    b.send_message_to(a.own_steam_id(), RELIABLE, 0, b"payload")
+    [view] = a.receive_message_views(0, 16)
+
+    exported = memoryview(view)
+    with pytest.raises(BufferError):
+        view.release()
+    assert exported.tobytes() == b"payload"
+    exported.release()
+    view.release()
+    assert view.released